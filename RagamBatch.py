@@ -0,0 +1,207 @@
+#! /usr/bin/env python
+# This file runs the Ragam Finder over many recordings at once: every audio file in a directory, or every
+# (file, sruthi) pair listed in a manifest. Files are analyzed in parallel by a pool of worker processes,
+# and results are written to a CSV or JSONL file as soon as each file is done, so that an interrupted batch
+# can be resumed by running the same command again.
+
+import sys, os, csv, json, time, traceback, io, contextlib
+from multiprocessing import Pool, cpu_count
+from RagamFinder import processFile, getPossibleRagas, processFileAllSruthis, getBestSruthis
+from RagamDB import RagamDB
+from cacheFuncs import FeatureCache
+from musicFuncs import PITCH_NAMES
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".m4a", ".flac", ".ogg", ".aac", ".aif", ".aiff"}
+RESULT_FIELDS = ["file", "sruthi", "num_transitions", "num_ragams", "ragams", "seconds", "error", "detected_sruthi"]
+
+# The RagamDB of a worker process, loaded once when the worker starts, and its FeatureCache (or None).
+workerRagamDB = None
+workerCache = None
+
+# Initializes a worker process by loading the ragam database, and opening the feature cache in the given
+# directory if there is one.
+def initWorker(ragamListFilename, cacheDirectory=None):
+    global workerRagamDB, workerCache
+    with contextlib.redirect_stdout(io.StringIO()):
+        workerRagamDB = RagamDB(ragamListFilename)
+    if cacheDirectory is not None:
+        workerCache = FeatureCache(cacheDirectory)
+
+# Analyzes one (file, sruthi) job in a worker process, and returns its result as a dictionary with the
+# RESULT_FIELDS. Errors are reported in the result instead of being raised. If the sruthi is auto, every sruthi
+# is tried (see RagamFinder.evaluateSruthis): the best supported ones are the detected sruthis, and the ragams
+# are those of each of them, as sruthi:ragam.
+def analyzeJob(job):
+    filename, sruthi = job
+    start = time.time()
+    result = {"file": filename, "sruthi": sruthi, "num_transitions": 0, "num_ragams": 0, "ragams": [], "error": "",
+              "detected_sruthi": ""}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if sruthi == "auto":
+                best = getBestSruthis(processFileAllSruthis(filename, workerRagamDB, cache=workerCache))
+                transitions = best[0]["transitions"]
+                ragas = ["%s:%s" % (sruthiResult["sruthi"], ragam.name) for sruthiResult in best 
+                         for ragam in sruthiResult["ragams"] or sruthiResult["best_ragams"]]
+                result["detected_sruthi"] = ";".join(sruthiResult["sruthi"] for sruthiResult in best)
+            else:
+                transitions = processFile(filename, sruthi + "3", printFrames=False, cache=workerCache)
+                ragas = [ragam.name for ragam in getPossibleRagas(workerRagamDB, transitions)]
+        result["num_transitions"] = len(transitions)
+        result["num_ragams"] = len(ragas)
+        result["ragams"] = ragas
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    result["seconds"] = round(time.time() - start, 3)
+    return result
+
+# Returns the sruthi at the start of the given filename, such as C# for "C#_0.m4a", or None if there is none.
+def getSruthiFromFilename(filename):
+    name = os.path.basename(filename).split("_")[0].split(".")[0]
+    return name if name in PITCH_NAMES else None
+
+# Returns the list of (file, sruthi) jobs for every audio file under the given directory. The sruthi of a 
+# file is taken from its name if it starts with one (see getSruthiFromFilename), and is the given default 
+# sruthi otherwise. Files without a sruthi are skipped with a warning.
+def getDirectoryJobs(directory, defaultSruthi=None):
+    jobs = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in AUDIO_EXTENSIONS:
+                continue
+            filename = os.path.join(root, name)
+            sruthi = getSruthiFromFilename(name) or defaultSruthi
+            if sruthi is None:
+                print("Skipping %s: no sruthi given" % filename, file=sys.stderr)
+                continue
+            jobs.append((filename, sruthi))
+    return jobs
+
+# Returns the list of (file, sruthi) jobs in the given manifest, a CSV file with one "file,sruthi" line per 
+# recording. Relative paths are relative to the manifest. Blank lines and lines starting with # are ignored.
+def getManifestJobs(manifest):
+    jobs = []
+    with open(manifest, newline='') as manifestFile:
+        for row in csv.reader(manifestFile):
+            if len(row) == 0 or row[0].strip() == "" or row[0].startswith("#"):
+                continue
+            filename = os.path.join(os.path.dirname(manifest), row[0].strip())
+            jobs.append((filename, row[1].strip()))
+    return jobs
+
+# Returns True if the given output filename is a JSONL file, and False if it is a CSV file.
+def isJsonOutput(output):
+    return os.path.splitext(output)[1].lower() in (".jsonl", ".json")
+
+# Returns the set of (file, sruthi) jobs that already have a result in the given output file. A last line
+# that was only partly written (because the batch was interrupted) is removed from the file, and so are the
+# results with an error, so that their jobs are run again. Raises ValueError if the output is a CSV file whose
+# columns are not the RESULT_FIELDS (such as one written by an older version), since results cannot be added to it.
+def getCompletedJobs(output):
+    completed = set()
+    if not os.path.exists(output):
+        return completed
+    with open(output, 'rb+') as outputFile:
+        data = outputFile.read()
+        if data and not data.endswith(b"\n"):
+            outputFile.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    lines = data.decode("utf-8").splitlines()
+    if isJsonOutput(output):
+        rows = [json.loads(line) for line in lines if line.strip()]
+    else:
+        reader = csv.DictReader(lines)
+        if lines != [] and reader.fieldnames != RESULT_FIELDS:
+            raise ValueError("%s has the columns %s instead of %s: write the results to a new file" %
+                             (output, ",".join(reader.fieldnames or []), ",".join(RESULT_FIELDS)))
+        rows = list(reader)
+    failed = [row for row in rows if row.get("error")]
+    if failed != []:
+        with open(output, 'w', newline='', encoding="utf-8") as outputFile:
+            if isJsonOutput(output):
+                outputFile.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows if not row.get("error"))
+            else:
+                writer = csv.DictWriter(outputFile, fieldnames=RESULT_FIELDS)
+                writer.writeheader()
+                writer.writerows(row for row in rows if not row.get("error"))
+    for row in rows:
+        if not row.get("error"):
+            completed.add((row["file"], row["sruthi"]))
+    return completed
+
+# Writes results to a CSV or JSONL output file, one line per result, flushing after each one.
+class ResultWriter:
+    def __init__(self, output):
+        self.json = isJsonOutput(output)
+        newFile = not os.path.exists(output) or os.path.getsize(output) == 0
+        self.file = open(output, 'a', newline='', encoding="utf-8")
+        if not self.json:
+            self.writer = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            if newFile:
+                self.writer.writeheader()
+
+    def write(self, result):
+        if self.json:
+            self.file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        else:
+            self.writer.writerow(dict(result, ragams=";".join(result["ragams"])))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+# Runs the given jobs over a pool of worker processes, appending each result to the output file as soon as 
+# it is available. Jobs that already have a result in the output file are skipped, unless it was an error (see
+# getCompletedJobs). If a cache directory is given, the workers share a FeatureCache there.
+def runBatch(jobs, output, workers=None, ragamListFilename="reference/ragam_list.txt", cacheDirectory=None):
+    completed = getCompletedJobs(output)
+    pending = [job for job in jobs if job not in completed]
+    print("%d files to analyze (%d already done)" % (len(pending), len(jobs) - len(pending)))
+    if pending == []:
+        return
+    # Compile the ragam database once up front, so that the workers only have to load it
+    with contextlib.redirect_stdout(io.StringIO()):
+        RagamDB(ragamListFilename)
+    writer = ResultWriter(output)
+    start = time.time()
+    try:
+        with Pool(workers or cpu_count(), initializer=initWorker, initargs=(ragamListFilename, cacheDirectory)) as pool:
+            for count, result in enumerate(pool.imap_unordered(analyzeJob, pending), 1):
+                writer.write(result)
+                print("[%d/%d] %s (%s): %s" % (count, len(pending), result["file"], result["sruthi"], 
+                      result["error"] or "%d ragams" % result["num_ragams"]), flush=True)
+    finally:
+        writer.close()
+    print("Finished %d files in %.1f seconds" % (len(pending), time.time() - start))
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    if len(args) < 2:
+        print("Usage:   python3 RagamBatch.py input output [--sruthi=pitch] [--workers=n] [--cache=dir]")
+        print("         input    : A directory of audio files, or a CSV manifest of file,sruthi lines")
+        print("         output   : The CSV or JSONL (.jsonl) file to append results to. If it already has")
+        print("                    results, the batch is resumed: those files are skipped, and files whose")
+        print("                    analysis failed are analyzed again")
+        print("         --sruthi : The sruthi of files in the directory whose names do not start with one, or")
+        print("                    auto to find it. A manifest can also give auto as the sruthi of a file")
+        print("         --workers: The number of worker processes (default: one per core)")
+        print("         --cache  : Keep the fundamental frequencies of analyzed files in the given directory, so")
+        print("                    that analyzing them again (with another sruthi or ragam list) is much faster")
+        print("Example: python3 RagamBatch.py TestData results.csv")
+        return
+    input, output = args[0], args[1]
+    if os.path.isdir(input):
+        jobs = getDirectoryJobs(input, options.get("sruthi"))
+    else:
+        jobs = getManifestJobs(input)
+    workers = int(options["workers"]) if "workers" in options else None
+    try:
+        runBatch(jobs, output, workers, cacheDirectory=options.get("cache"))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+#! /usr/bin/env python
+# This file benchmarks the Ragam Finder over the bundled recordings. Every stage of the pipeline is timed
+# separately on every file, and the results (timings, frames per second, real-time factor, peak memory, and
+# the transitions and ragams found) are saved to a JSON file. Two such files can then be compared, to flag
+# stages that got slower and files whose results changed.
+
+import sys, os, json, time, platform, resource, io, contextlib, tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from RagamFinder import (despeckleTrack, determineTransitionsFromNotes, getPossibleRagas, analyzeSemitones,
+                         evaluateSruthis, getBestSruthis, processFile)
+from RagamBatch import getDirectoryJobs, getSruthiFromFilename
+from RagamDB import RagamDB
+from musicFuncs import freqToSemitones
+from audioFuncs import FrontEnd, getFrontEnd
+from pitchFuncs import PITCH_BACKENDS, getPitchBackend, hasExactPitches
+from noteFuncs import NoteSegmenter, getNoteSegmenter
+from synthFuncs import parseDuration
+from profileFuncs import enableProfiling, disableProfiling, stageTimer
+from RagamGenerator import getSynthesizer, getRagamByName
+
+BENCHMARK_VERSION = 1
+DEFAULT_CORPORA = ["TestData", "ragam_testing", "maya_testing", "Arun-voice-testing"]
+# fft_peaks and fundamentals are only timed with the fft pitch backend, and pitch with the others (see pitchFuncs)
+STAGES = ["decode", "fft_peaks", "fundamentals", "pitch", "pitch_confidence", "despeckle", "notes_transitions",
+          "ragam_filter"]
+
+# Returns the peak resident memory of this process so far, in megabytes.
+def getPeakRss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+# Runs the whole pipeline on one file, as processFile does with the given FrontEnd, pitch backend and
+# NoteSegmenter, and returns a dictionary of the time taken by every stage (see STAGES), as timed by the stage
+# timers of the analysis (see profileFuncs), along with the number of frames analyzed, the transitions found, the
+# ragams left after narrowing down the candidates, and the top ranked ragams (see RagamDB.rankRagams).
+def benchmarkFile(filename, sruthi, ragamDB, superwindow_size=5, frontEnd=None, pitchBackend="fft", segmenter=None):
+    if frontEnd is None:
+        frontEnd = FrontEnd()
+    s = frontEnd.openSource(filename)
+    profiler = enableProfiling()
+    try:
+        transitions = processFile(filename, sruthi, superwindow_size, frontEnd=frontEnd, pitchBackend=pitchBackend,
+                                  segmenter=segmenter)
+        with stageTimer("ragam_filter"):
+            ragas = getPossibleRagas(ragamDB, transitions)
+            ranking = ragamDB.rankRagams(ragamDB.getTransitionCounts(transitions))
+    finally:
+        disableProfiling()
+    timings = {stage: profiler.stageSeconds.get(stage, 0.0) for stage in STAGES}
+    return {"frames": profiler.counters["frames"], "audio_seconds": s.duration / s.samplerate, "timings": timings,
+            "transitions": [repr(transition) for transition in transitions], "ragams": [ragam.name for ragam in ragas],
+            "ranking": [[ragam.name, score] for ragam, score in ranking]}
+
+# Benchmarks every (file, sruthi) job, repeating each one the given number of times and keeping the fastest
+# time of every stage. The audio is read by the given FrontEnd, its pitches found by the pitch backend with the
+# given name and split into notes by the given NoteSegmenter (see benchmarkFile), whose settings are all saved with
+# the results. Returns the benchmark results as a dictionary, ready to be saved as JSON.
+def runBenchmark(jobs, repeat=1, ragamListFilename="reference/ragam_list.txt", frontEnd=None, pitchBackend="fft",
+                 segmenter=None):
+    if frontEnd is None:
+        frontEnd = FrontEnd()
+    if segmenter is None:
+        segmenter = NoteSegmenter(frontEnd.hop_s / frontEnd.rate)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ragamDB = RagamDB(ragamListFilename)
+    loadTime = time.perf_counter() - start
+    files = {}
+    for count, (filename, sruthi) in enumerate(jobs, 1):
+        result = None
+        try:
+            for run in range(repeat):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    current = benchmarkFile(filename, sruthi + "3", ragamDB, frontEnd=frontEnd,
+                                            pitchBackend=pitchBackend, segmenter=segmenter)
+                if result is None:
+                    result = current
+                else:
+                    for stage in STAGES:
+                        result["timings"][stage] = min(result["timings"][stage], current["timings"][stage])
+        except Exception as e:
+            files[filename] = {"sruthi": sruthi, "error": "%s: %s" % (type(e).__name__, e)}
+            print("[%d/%d] %s: %s" % (count, len(jobs), filename, files[filename]["error"]), flush=True)
+            continue
+        total = sum(result["timings"].values())
+        result["sruthi"] = sruthi
+        result["total_seconds"] = total
+        result["frames_per_second"] = result["frames"] / total if total > 0 else 0.0
+        result["real_time_factor"] = total / result["audio_seconds"] if result["audio_seconds"] > 0 else 0.0
+        files[filename] = result
+        print("[%d/%d] %s: %.3f s for %.1f s of audio (%.0f frames/s)" % (count, len(jobs), filename, total,
+              result["audio_seconds"], result["frames_per_second"]), flush=True)
+    return {"version": BENCHMARK_VERSION, "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "repeat": repeat, "front_end": frontEnd.getParameters(),
+            "pitch_backend": pitchBackend, "segmenter": segmenter.getParameters(),
+            "ragam_db_load_seconds": loadTime,
+            "summary": getSummary(files), "peak_rss_mb": getPeakRss(), "files": files}
+
+# Returns the totals over all the files that were benchmarked successfully: the time of every stage, the
+# number of frames and seconds of audio, frames per second, and the real-time factor (time taken per second
+# of audio).
+def getSummary(files):
+    results = [result for result in files.values() if "error" not in result]
+    # results saved before the pitch backend was configurable have no pitch stages
+    stages = {stage: sum(result["timings"].get(stage, 0.0) for result in results) for stage in STAGES}
+    total = sum(stages.values())
+    frames = sum(result["frames"] for result in results)
+    audioSeconds = sum(result["audio_seconds"] for result in results)
+    return {"files": len(results), "errors": len(files) - len(results), "frames": frames,
+            "audio_seconds": audioSeconds, "stages": stages, "total_seconds": total,
+            "frames_per_second": frames / total if total > 0 else 0.0,
+            "real_time_factor": total / audioSeconds if audioSeconds > 0 else 0.0}
+
+# Prints a table of the time taken by every stage in the given benchmark summary.
+def printSummary(summary):
+    print()
+    print("%-20s %10s %8s" % ("stage", "seconds", "share"))
+    for stage in STAGES:
+        seconds = summary["stages"][stage]
+        print("%-20s %10.3f %7.1f%%" % (stage, seconds, 100 * seconds / summary["total_seconds"] if summary["total_seconds"] else 0))
+    print("%-20s %10.3f" % ("total", summary["total_seconds"]))
+    print()
+    print("%d files (%d errors), %d frames, %.1f s of audio" % (summary["files"], summary["errors"], summary["frames"],
+          summary["audio_seconds"]))
+    print("%.0f frames/s, real-time factor %.4f" % (summary["frames_per_second"], summary["real_time_factor"]))
+
+# Compares the current benchmark results to the baseline. A stage (or the total) is a regression if it got
+# slower by more than the threshold, a fraction of the baseline time, over the files found in both results.
+# Slowdowns of less than minSeconds are ignored, since very short stages are mostly timing noise. The
+# transitions, ragams and ranking found in every file must be the same. Returns the list of problems found.
+def compareBenchmarks(baseline, current, threshold=0.1, minSeconds=0.05):
+    problems = []
+    # results saved before the front end was configurable all used its defaults
+    if baseline.get("front_end", FrontEnd().getParameters()) != current.get("front_end", FrontEnd().getParameters()):
+        print("The results were found with different front end settings, so they are expected to differ")
+    # and before the pitch backend and note settings were, with the fft backend and the default note settings
+    if baseline.get("pitch_backend", "fft") != current.get("pitch_backend", "fft") or \
+       baseline.get("segmenter", current.get("segmenter")) != current.get("segmenter", baseline.get("segmenter")):
+        print("The results were found with different pitch backends or note settings, so they are expected to differ")
+    common = [filename for filename in baseline["files"] if filename in current["files"]]
+    for filename in common:
+        before, after = baseline["files"][filename], current["files"][filename]
+        if before.get("error") != after.get("error"):
+            problems.append("%s: error changed from %r to %r" % (filename, before.get("error"), after.get("error")))
+        elif "error" not in before:
+            if before["transitions"] != after["transitions"]:
+                problems.append("%s: transitions changed" % filename)
+            if before["ragams"] != after["ragams"]:
+                problems.append("%s: ragams changed from %s to %s" % (filename, before["ragams"], after["ragams"]))
+            # results saved before ragams were ranked have no ranking
+            if "ranking" in before and "ranking" in after and before["ranking"] != after["ranking"]:
+                problems.append("%s: ranking changed" % filename)
+    for filename in baseline["files"]:
+        if filename not in current["files"]:
+            print("Not in the current results: %s" % filename)
+    beforeSummary = getSummary({filename: baseline["files"][filename] for filename in common})
+    afterSummary = getSummary({filename: current["files"][filename] for filename in common})
+    print()
+    print("%-20s %10s %10s %8s" % ("stage", "baseline", "current", "change"))
+    for stage in STAGES + ["total"]:
+        if stage == "total":
+            before, after = beforeSummary["total_seconds"], afterSummary["total_seconds"]
+        else:
+            before, after = beforeSummary["stages"][stage], afterSummary["stages"][stage]
+        change = (after - before) / before if before > 0 else 0.0
+        flag = ""
+        if change > threshold and after - before > minSeconds:
+            flag = "  REGRESSION"
+            problems.append("%s: %.3f s -> %.3f s (%+.1f%%)" % (stage, before, after, 100 * change))
+        print("%-20s %10.3f %10.3f %+7.1f%%%s" % (stage, before, after, 100 * change, flag))
+    print()
+    print("peak RSS: %.1f MB -> %.1f MB" % (baseline["peak_rss_mb"], current["peak_rss_mb"]))
+    return problems
+
+# Compares the given pitch backends (see pitchFuncs) on the given files. Every file is decoded once by the given
+# FrontEnd, and then analyzed by every backend. Returns a dictionary with the results of every backend: the time it
+# took, the number of frames, the fraction of them with a pitch and the mean confidence, how often its despeckled
+# pitches agree with those of the fft backend (the same semitone, or the same pitch class in any octave), and, for
+# the files whose names start with their sruthi, how often that sruthi is among the best supported ones when every
+# sruthi is tried (see RagamFinder.evaluateSruthis).
+def comparePitchBackends(filenames, backends, frontEnd=None, ragamListFilename="reference/ragam_list.txt"):
+    if frontEnd is None:
+        frontEnd = FrontEnd()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ragamDB = RagamDB(ragamListFilename)
+    results = {name: {"seconds": 0.0, "frames": 0, "voiced": 0, "confidence": 0.0, "compared": 0, "same_semitone": 0,
+                      "same_pitch_class": 0, "sruthi_files": 0, "sruthi_found": 0} for name in backends}
+    for count, filename in enumerate(filenames, 1):
+        blocks = list(frontEnd.getFrameBlocks(frontEnd.readSourceHops(frontEnd.openSource(filename))))
+        frames = np.vstack(blocks) if blocks != [] else np.zeros((0, frontEnd.win_s), dtype=np.float32)
+        label = getSruthiFromFilename(filename)
+        reference = None
+        for name in ["fft"] + [name for name in backends if name != "fft"]:
+            backend = getPitchBackend(name, frontEnd.rate, frontEnd.win_s)
+            start = time.perf_counter()
+            fundamentals = backend.getFrameFundamentals(frames)
+            seconds = time.perf_counter() - start
+            bySemitone = hasExactPitches(name)
+            pitches = np.nan_to_num(despeckleTrack(fundamentals, bySemitone=bySemitone))
+            semitones = np.where(pitches > 0, freqToSemitones(pitches), -1)
+            if name == "fft":
+                reference = semitones
+            if name not in results:
+                continue
+            result = results[name]
+            result["seconds"] += seconds
+            result["frames"] += len(frames)
+            result["voiced"] += int(np.count_nonzero(fundamentals.getLengths()))
+            result["confidence"] += float(np.sum(fundamentals.columns["confidence"], dtype=float))
+            compared = (semitones >= 0) & (reference >= 0)
+            result["compared"] += int(compared.sum())
+            result["same_semitone"] += int((semitones == reference)[compared].sum())
+            result["same_pitch_class"] += int((semitones % 12 == reference % 12)[compared].sum())
+            if label is not None:
+                semitones = analyzeSemitones(fundamentals, frontEnd.rate, frontEnd.win_s, hop_s=frontEnd.hop_s,
+                                             bySemitone=bySemitone)
+                best = getBestSruthis(evaluateSruthis(semitones, ragamDB))
+                result["sruthi_files"] += 1
+                result["sruthi_found"] += label in [sruthiResult["sruthi"] for sruthiResult in best]
+        print("[%d/%d] %s" % (count, len(filenames), filename), flush=True)
+    return {"version": BENCHMARK_VERSION, "front_end": frontEnd.getParameters(), "backends": results}
+
+# Analyzes the given synthetic recording of the ragam with the given name (see RagamGenerator), as processFile
+# does with the given FrontEnd and number of workers, and returns the time it took, the peak memory of the
+# process, and how well the ragam was identified: its rank among all ragams (see RagamDB.rankRagams), whether
+# it is among the possible ragams, and the recall and precision of the transitions found, against those between
+# the given notes that were sung. Run in a new process for every recording, so that its peak memory is its own.
+def analyzeSyntheticFile(filename, sruthi, name, sungNotes, frontEnd, workers=None,
+                         ragamListFilename="reference/ragam_list.txt"):
+    with contextlib.redirect_stdout(io.StringIO()):
+        ragamDB = RagamDB(ragamListFilename)
+        start = time.perf_counter()
+        transitions = processFile(filename, sruthi, frontEnd=frontEnd, workers=workers)
+        seconds = time.perf_counter() - start
+        ranking = ragamDB.rankRagams(ragamDB.getTransitionCounts(transitions), None)
+        ragams = [ragam.name for ragam in getPossibleRagas(ragamDB, transitions)]
+    found = set(transition.code for transition in transitions)
+    sung = set(transition.code for transition in determineTransitionsFromNotes(sungNotes))
+    return {"seconds": seconds, "peak_rss_mb": getPeakRss(), "transitions": len(transitions),
+            "rank": [ragam.name for ragam, score in ranking].index(name) + 1, "possible": name in ragams,
+            "num_possible": len(ragams), "transition_recall": len(found & sung) / len(sung) if sung else 0.0,
+            "transition_precision": len(found & sung) / len(found) if found else 0.0}
+
+# Load tests the analysis with synthetic recordings of the ragam with the given name at the given sruthi, one of
+# each of the given durations (in seconds), rendered by the given RagamSynthesizer into the given directory (a
+# temporary one by default, whose recordings are removed once analyzed). Returns the results as a dictionary,
+# with those of every duration (see analyzeSyntheticFile) along with the time taken to render it, the throughput
+# (seconds of audio analyzed per second) and the growth of the peak memory since the shortest recording.
+def runLoadTest(name, sruthi, durations, synthesizer, frontEnd=None, workers=None, directory=None,
+                ragamListFilename="reference/ragam_list.txt"):
+    if frontEnd is None:
+        frontEnd = FrontEnd()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ragam = getRagamByName(RagamDB(ragamListFilename), name)
+    results = []
+    with tempfile.TemporaryDirectory() as temporaryDirectory:
+        for duration in sorted(durations):
+            filename = os.path.join(directory or temporaryDirectory, "%s_%s_%ds.wav" % (ragam.name, sruthi, duration))
+            start = time.perf_counter()
+            notes = synthesizer.render(ragam, sruthi + "3", duration, filename,
+                                       os.path.splitext(filename)[0] + ".csv" if directory is not None else None)
+            renderSeconds = time.perf_counter() - start
+            with ProcessPoolExecutor(1) as executor:
+                result = executor.submit(analyzeSyntheticFile, filename, sruthi + "3", ragam.name, notes, frontEnd,
+                                         workers, ragamListFilename).result()
+            if directory is None:
+                os.remove(filename)
+            result.update({"audio_seconds": duration, "notes": len(notes), "render_seconds": renderSeconds,
+                           "throughput": duration / result["seconds"] if result["seconds"] > 0 else 0.0,
+                           "peak_rss_growth_mb": result["peak_rss_mb"] - (results[0] if results else result)["peak_rss_mb"]})
+            printLoadResult(result, results == [])
+            results.append(result)
+    return {"version": BENCHMARK_VERSION, "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "ragam": ragam.name, "sruthi": sruthi,
+            "synthesizer": synthesizer.getParameters(), "front_end": frontEnd.getParameters(), "workers": workers,
+            "durations": results}
+
+# Prints one line of the results of a load test (see runLoadTest), after a header if header is True.
+def printLoadResult(result, header=False):
+    if header:
+        print("%9s %8s %9s %11s %9s %9s %6s %8s %7s" % ("audio s", "render s", "analyze s", "throughput", "peak MB",
+              "growth MB", "rank", "possible", "recall"))
+    print("%9.0f %8.1f %9.2f %10.0fx %9.1f %+9.1f %6d %8s %6.0f%%" % (result["audio_seconds"],
+          result["render_seconds"], result["seconds"], result["throughput"], result["peak_rss_mb"],
+          result["peak_rss_growth_mb"], result["rank"], "yes" if result["possible"] else "no",
+          100 * result["transition_recall"]), flush=True)
+
+# Prints a table comparing the pitch backends, from the results of comparePitchBackends.
+def printPitchComparison(comparison):
+    print()
+    print("%-16s %9s %10s %7s %10s %9s %11s %9s" % ("backend", "seconds", "frames/s", "voiced", "confidence",
+          "same note", "same class", "sruthi"))
+    for name, result in comparison["backends"].items():
+        frames, compared = max(result["frames"], 1), max(result["compared"], 1)
+        print("%-16s %9.3f %10.0f %6.1f%% %10.2f %8.1f%% %10.1f%% %4d/%-4d" % (name, result["seconds"],
+              result["frames"] / result["seconds"] if result["seconds"] > 0 else 0.0, 100 * result["voiced"] / frames,
+              result["confidence"] / frames, 100 * result["same_semitone"] / compared,
+              100 * result["same_pitch_class"] / compared, result["sruthi_found"], result["sruthi_files"]))
+    print()
+    print("same note and same class compare the despeckled pitches of each frame to those of the fft backend;")
+    print("sruthi counts the files named after their sruthi for which it is among the best supported ones;")
+    print("yin and yinfft call aubio once per frame from Python, which accounts for most of their time")
+
+# Returns the (file, sruthi) jobs for the given files and directories. Files in directories are found as in
+# RagamBatch; files whose names do not start with a sruthi use the default sruthi.
+def getJobs(paths, defaultSruthi):
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            jobs += getDirectoryJobs(path, defaultSruthi)
+        else:
+            jobs.append((path, defaultSruthi))
+    return jobs
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    if len(args) < 2 or args[0] not in ("run", "compare", "pitch", "load") or (args[0] == "compare" and len(args) < 3):
+        print("Usage:   python3 RagamBenchmark.py run output.json [paths...] [--repeat=n] [--sruthi=pitch]")
+        print("                                   [--baseline=baseline.json] [--threshold=fraction]")
+        print("                                   [--min-seconds=s] [--samplerate=hz] [--decimate=n] [--window=n]")
+        print("                                   [--hop=n] [--pitch=backend] [--cents=x] [--min-note=ms]")
+        print("         python3 RagamBenchmark.py compare baseline.json current.json [--threshold=fraction] [--min-seconds=s]")
+        print("         python3 RagamBenchmark.py pitch output.json [paths...] [--backends=name,...]")
+        print("         python3 RagamBenchmark.py load output.json [--ragam=name] [--sruthi=pitch] [--durations=d,...]")
+        print("                                   [--workers=n] [--keep=dir] [--seed=n] ...")
+        print("         run        : Benchmark the given audio files and directories (by default the bundled")
+        print("                      recordings) and save the results to output.json")
+        print("         compare    : Compare two saved results. Exits with an error if any stage got slower")
+        print("                      than the threshold or any file's transitions or ragams changed")
+        print("         pitch      : Compare the speed and accuracy of the pitch backends on the given audio files and")
+        print("                      directories (by default the bundled recordings), and save the results to output.json")
+        print("         load       : Analyze synthetic recordings of a ragam (see RagamGenerator.py) of growing")
+        print("                      durations, and save their throughput, peak memory and accuracy to output.json")
+        print("         --repeat   : The number of times to run every file, keeping the fastest (default: 1)")
+        print("         --sruthi   : The sruthi of files whose names do not start with one (default: C)")
+        print("         --baseline : Compare the results of the run to these saved results")
+        print("         --threshold: The slowdown flagged as a regression, as a fraction (default: 0.1)")
+        print("         --min-seconds: The smallest slowdown of a stage flagged as a regression (default: 0.05)")
+        print("         --samplerate, --decimate, --window, --hop: The front end settings, as in RagamFinder.py")
+        print("         --pitch, --cents, --min-note: The pitch backend and note settings, as in RagamFinder.py")
+        print("         --backends : The pitch backends to compare (default: %s)" % ",".join(PITCH_BACKENDS))
+        print("         --ragam    : The ragam sung in the synthetic recordings (default: Megha)")
+        print("         --durations: Their durations, in seconds or with m or h (default: 30s,2m,10m)")
+        print("         --workers  : Analyze them in n processes at once, as in RagamFinder.py (default: 1)")
+        print("         --keep     : Keep the recordings and their notes in the given directory")
+        print("         --seed, --harmonics, --drone, --noise, --vibrato, --gamaka, --note-seconds: The")
+        print("                      synthesizer settings, as in RagamGenerator.py")
+        print("Example: python3 RagamBenchmark.py run baseline.json --repeat=3")
+        return
+    threshold = float(options.get("threshold", 0.1))
+    if args[0] == "load":
+        durations = [parseDuration(duration) for duration in options.get("durations", "30s,2m,10m").split(",")]
+        workers = int(options["workers"]) if "workers" in options else None
+        results = runLoadTest(options.get("ragam", "Megha"), options.get("sruthi", "C"), durations,
+                              getSynthesizer(options), getFrontEnd(options), workers, options.get("keep"))
+        with open(args[1], 'w') as outputFile:
+            json.dump(results, outputFile, indent=1)
+        return
+    if args[0] == "pitch":
+        filenames = [filename for filename, sruthi in getJobs(args[2:] or DEFAULT_CORPORA, "C")]
+        backends = options.get("backends", ",".join(PITCH_BACKENDS)).split(",")
+        comparison = comparePitchBackends(filenames, backends, getFrontEnd(options))
+        with open(args[1], 'w') as outputFile:
+            json.dump(comparison, outputFile, indent=1)
+        printPitchComparison(comparison)
+        return
+    if args[0] == "run":
+        jobs = getJobs(args[2:] or DEFAULT_CORPORA, options.get("sruthi", "C"))
+        frontEnd = getFrontEnd(options)
+        pitchBackend = options.get("pitch", "fft")
+        if pitchBackend not in PITCH_BACKENDS:
+            print("Unknown pitch backend %s: use one of %s" % (pitchBackend, ", ".join(PITCH_BACKENDS)))
+            return
+        results = runBenchmark(jobs, int(options.get("repeat", 1)), frontEnd=frontEnd, pitchBackend=pitchBackend,
+                               segmenter=getNoteSegmenter(options, frontEnd.hop_s / frontEnd.rate))
+        with open(args[1], 'w') as outputFile:
+            json.dump(results, outputFile, indent=1)
+        printSummary(results["summary"])
+        print("peak RSS %.1f MB" % results["peak_rss_mb"])
+        if "baseline" not in options:
+            return
+        with open(options["baseline"]) as baselineFile:
+            baseline = json.load(baselineFile)
+        current = results
+    else:
+        with open(args[1]) as baselineFile:
+            baseline = json.load(baselineFile)
+        with open(args[2]) as currentFile:
+            current = json.load(currentFile)
+    problems = compareBenchmarks(baseline, current, threshold, float(options.get("min-seconds", 0.05)))
+    for problem in problems:
+        print("FAILED: " + problem)
+    if problems != []:
+        sys.exit(1)
+    print("No regressions, and all results are the same")
+
+if __name__ == '__main__':
+    main()
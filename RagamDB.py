@@ -3,9 +3,27 @@
 # These classes store information for various types of frequently used data, and also provide
 # methods that allow the structures to be converted to strings for easy debugging and printing.
 
+import os, hashlib, zipfile, unicodedata
+from functools import lru_cache
+import numpy as np
+
+# The notes in ascending order, as used by Note and by the note and transition encodings below.
+NOTE_NAMES = ["S", "R", "RG", "G", "M", "P", "D", "DN", "N"]
+
+# The (note, noteclass) of each of the twelve steps above S, in the order convertPitchFromSteps uses.
+SWARA_NAMES = [("S", 0), ("R", 1), ("RG", 1), ("RG", 2), ("G", 3), ("M", 1), 
+               ("M", 2), ("P", 0), ("D", 1), ("DN", 1), ("DN", 2), ("N", 3)]
+
+# Version of the compiled ragam database format written by RagamDB.saveCompiled.
+COMPILED_VERSION = 2
+
 # Represents a Note with a note class and an octave. 
 # Note classes are defined as the number denoting the kind of Carnatic note (i.e. M1 and M2)
+# A Note is stored as a single small integer, its code: (octave*9 + note index)*4 + noteclass. Notes are
+# immutable, hashable, and ordered by octave, then note, then note class, which is the order of their codes.
 class Note:
+    __slots__ = ("code",)
+    notes = NOTE_NAMES
     
     # constructor for Note that takes Note(note, noteclass, octave)
     # Notes are as follows:
@@ -13,49 +31,87 @@ class Note:
     # Octave 0 is lower than S0, Octave 1 is regular singing octave, octave 2 is highest.
     # Octave 1 starts at S0, octave 2 starts at S1
     def __init__(self, note, noteclass=0, octave=1):
-        self.note = note
-        self.noteclass = noteclass
-        self.octave = octave
-        self.notes = ["S", "R", "RG", "G", "M", "P", "D", "DN", "N"]
+        object.__setattr__(self, "code", (octave*len(NOTE_NAMES) + NOTE_NAMES.index(note))*4 + noteclass)
+
+    # Returns the shared Note instance with the given code.
+    @staticmethod
+    def fromCode(code):
+        return NOTES_BY_CODE[code]
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Note is immutable")
+
+    @property
+    def note(self):
+        return NOTE_NAMES[self.code // 4 % len(NOTE_NAMES)]
+
+    @property
+    def noteclass(self):
+        return self.code % 4
+
+    @property
+    def octave(self):
+        return self.code // (4*len(NOTE_NAMES))
+
+    # index of the note (without note class or octave) in NOTE_NAMES
+    @property
+    def noteIndex(self):
+        return self.code // 4 % len(NOTE_NAMES)
 
     def __eq__(self, other):
-        return False if other is None else self.note == other.note and self.noteclass == other.noteclass and self.octave == other.octave
+        return False if other is None else self.code == other.code
+
+    def __hash__(self):
+        return self.code
     
     def __repr__(self):
         return "%s%d: %d" % (self.note, self.noteclass, self.octave)
     
     # Greater than function
     def __gt__(self, other):
-        index1 = self.notes.index(self.note)
-        index2 = self.notes.index(other.note)
-        if self.octave > other.octave:
-            return True
-        if self.octave == other.octave:
-            if index1 > index2:
-                return True 
-            if index1 == index2:
-                if self.noteclass > other.noteclass:
-                    return True
-        return False
+        return self.code > other.code
     
     # Less than function
     def __lt__(self, other):
-        index1 = self.notes.index(self.note)
-        index2 = self.notes.index(other.note)
-        if self.octave < other.octave:
-            return True
-        if self.octave == other.octave:
-            if index1 < index2:
-                return True 
-            if index1 == index2:
-                if self.noteclass > other.noteclass:
-                    return True
-        return False
+        return self.code < other.code
+
+    def __ge__(self, other):
+        return self.code >= other.code
+
+    def __le__(self, other):
+        return self.code <= other.code
+
+    def __reduce__(self):
+        return (Note.fromCode, (self.code,))
+
+# Shared Note instances for every possible code, used by Note.fromCode.
+NOTES_BY_CODE = [Note(note, noteclass, octave) for octave in range(3) for note in NOTE_NAMES for noteclass in range(4)]
+
+# The step above S (see SWARA_NAMES) of every Note, indexed by its code modulo one octave, or -1 for the
+# note classes that are not swaras.
+SWARA_STEPS = np.full(4*len(NOTE_NAMES), -1, dtype=np.int8)
+for step, (note, noteclass) in enumerate(SWARA_NAMES):
+    SWARA_STEPS[NOTE_NAMES.index(note)*4 + noteclass] = step
+
+# Returns the swara set of the given Notes as a 12-bit mask, whose bit i is set if the swara i steps above S
+# (see SWARA_NAMES) is one of them, in any octave.
+def getSwaraMask(notes):
+    mask = 0
+    for code in SWARA_STEPS[np.array([note.code for note in notes], dtype=int) % (4*len(NOTE_NAMES))]:
+        if code >= 0:
+            mask |= 1 << int(code)
+    return mask
+
+# The number of possible transition keys (see Transition.key and Transition.code).
+NUM_TRANSITION_CODES = len(NOTE_NAMES)*len(NOTE_NAMES)*3
 
 # A Transition represents the movement between two notes (a base and an end note).
 # This class also stores the direction of the motion (down, up, or flat). Moving from
 # the same note between octaves is considered a flat motion.
+# Transitions are equal when their base notes, end notes and motion are, without considering note classes 
+# or octaves; their hash and code follow the same rule.
 class Transition():
+    __slots__ = ("base", "end", "motion")
     
     # base is the base note and end is the end note (both of type Note)
     def __init__(self, base, end):
@@ -80,17 +136,62 @@ class Transition():
     def __eq__(self, other):
         return self.motion == other.motion and self.base.note == other.base.note and self.end.note == other.end.note
 
+    def __hash__(self):
+        return self.code
+
+    # Returns the key that identifies this transition: two transitions are equal exactly when their keys are.
+    def key(self):
+        return (self.base.note, self.end.note, self.motion)
+
+    # The key of this transition encoded as a small integer: (base note index*9 + end note index)*3 + motion + 1.
+    @property
+    def code(self):
+        return (self.base.noteIndex*len(NOTE_NAMES) + self.end.noteIndex)*3 + self.motion + 1
+
+# Returns the arrays of indexes i and j of all pairs i <= j < length.
+@lru_cache(maxsize=None)
+def getPairIndexes(length):
+    return np.triu_indices(length)
+
+# Returns the codes (see Transition.code) of the transitions from each of the given base note codes to the
+# corresponding end note code.
+def getTransitionCodes(base, end):
+    base, end = np.asarray(base, dtype=int), np.asarray(end, dtype=int)
+    baseIndex, endIndex = base // 4 % len(NOTE_NAMES), end // 4 % len(NOTE_NAMES)
+    motion = np.where(baseIndex == endIndex, 0, np.sign(end - base))
+    return (baseIndex*len(NOTE_NAMES) + endIndex)*3 + motion + 1
+
+# Returns the codes of all transitions between notes i <= j of the given scale, given as an array of note
+# codes, like Ragam's transition list. Codes may repeat.
+def getScaleTransitionCodes(scaleCodes):
+    scaleCodes = np.asarray(scaleCodes, dtype=int)
+    base, end = getPairIndexes(len(scaleCodes))
+    return getTransitionCodes(scaleCodes[base], scaleCodes[end])
+
 # This class represents a Ragam, which contains a name, a list of ascending notes,
 # a list of descending notes, and the name of its parent ragam. The Ragam also calculates
-# its transition matrix, which is just a list of all possible ascending and descending transitions.
+# its transition matrix: the set of all possible ascending and descending transitions, stored as a packed 
+# bit array with one bit per transition code.
 class Ragam:
+    __slots__ = ("name", "ascending", "descending", "parent", "id", "transitionMask")
+
     def __init__(self, name, ascendingNotes, descendingNotes, parent=None):
         self.name = name
         self.ascending = ascendingNotes
         self.descending = descendingNotes
         self.parent = parent
-        # The transitions list is meant to demonstrate the relationships between notes
-        self.transitions = self.__getTransitions(self.ascending) + self.__getTransitions(self.descending)
+        # position of this ragam in the RagamDB it belongs to, and its bit in the RagamDB's bitsets
+        self.id = None
+        # The transition matrix is meant to demonstrate the relationships between notes
+        isTransition = np.zeros(NUM_TRANSITION_CODES, dtype=bool)
+        for scale in (self.ascending, self.descending):
+            isTransition[getScaleTransitionCodes([note.code for note in scale])] = True
+        self.transitionMask = np.packbits(isTransition, bitorder='little')
+
+    # Returns the list of all transitions between notes i <= j of the ascending and then the descending scale.
+    # The list is built anew on every call; use RagamDB.transitionIndex to check transitions.
+    def getTransitions(self):
+        return self.__getTransitions(self.ascending) + self.__getTransitions(self.descending)
         
     # Private method to calculate all transitions that are possible within the given scale. 
     def __getTransitions(self, scale):
@@ -109,28 +210,427 @@ class Ragam:
                                 
     def __eq__(self, other):
         return self.ascending == other.ascending and self.descending == other.descending and self.name == other.name 
+
+    def __hash__(self):
+        return hash((self.name, tuple(self.ascending), tuple(self.descending)))
     
 
 # Custom error for try/except blocks dealing with Ragams
 class RagamNotFoundError(Exception):
     pass
 
+# Returns the given ragam name folded for searching: in lower case, and without diacritics, so that Kalyani
+# and kalyāni are the same as Kalyāni.
+def foldName(name):
+    return "".join(c for c in unicodedata.normalize("NFKD", name) if not unicodedata.combining(c)).casefold()
+
+# Encodes a Note as a small integer (see Note.code).
+def encodeNote(note):
+    return note.code
+
+# Decodes a Note encoded by encodeNote, returning the shared instance for its code.
+def decodeNote(code):
+    return Note.fromCode(int(code))
+
+# Encodes a list of strings (without newlines) as one array of UTF-8 bytes, separated by newlines.
+def encodeStrings(strings):
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+# Decodes a list of strings encoded by encodeStrings.
+def decodeStrings(array):
+    return array.tobytes().decode("utf-8").split("\n")
+
+# Encodes a scale (a list of Notes) as a bytes object of its note codes, which is hashable and equal for two
+# scales exactly when their Notes are.
+def encodeScale(scale):
+    return bytes(encodeNote(note) for note in scale)
+
+# Returns the bitset of the ragams (see RagamDB) whose entries in the given boolean array are True.
+def getMaskFromBools(isInSet):
+    return int.from_bytes(np.packbits(isInSet, bitorder='little').tobytes(), 'little')
+
+# The number of notes in a phrase rule (see getScalePhrases).
+PHRASE_LENGTH = 3
+
+# Returns the windows of the given length of a cyclic sequence of swara steps, as tuples. The last step is
+# left out if it is the same as the first, since the sequence continues from it.
+def getCyclicWindows(steps, length):
+    if len(steps) > 1 and steps[-1] == steps[0]:
+        steps = steps[:-1]
+    if len(steps) < length:
+        return []
+    wrapped = steps + steps[:length - 1]
+    return [tuple(wrapped[i:i + length]) for i in range(len(steps))]
+
+# Returns the set of phrase rules of a ragam with the given arohanam and avarohanam, as lists of swara steps
+# (see SWARA_STEPS) with any repeated steps in a row merged: every sequence of PHRASE_LENGTH swaras in a
+# row that can be sung going up the arohanam, down the avarohanam, or turning from one to the other, where the
+# scales continue into the next octave. Unlike its transitions, these keep the order of the notes of vakra
+# (zig-zag) ragams.
+def getScalePhrases(arohanam, avarohanam):
+    def merge(steps):
+        return [step for i, step in enumerate(steps) if i == 0 or step != steps[i - 1]]
+    arohanam, avarohanam = merge(arohanam), merge(avarohanam)
+    phrases = set(getCyclicWindows(arohanam, PHRASE_LENGTH)) | set(getCyclicWindows(avarohanam, PHRASE_LENGTH))
+    return phrases | set(getCyclicWindows(merge(arohanam + avarohanam), PHRASE_LENGTH))
+
+# A multi-pattern automaton (Aho-Corasick) over sequences of swara steps, holding the phrase rules of every ragam
+# of a RagamDB. It is compiled into a DFA: a table with the next state for every state and step, so a sequence
+# of notes is matched against every phrase of every ragam with one table lookup per note. Each state has the
+# boolean row of the ragams that have a phrase ending at it, and the number of times each state is reached,
+# multiplied by the matrix of these rows, gives the number of phrases of the notes that every ragam allows.
+class PhraseAutomaton:
+    # phrases is a list with the set of phrase rules (tuples of swara steps) of every ragam.
+    def __init__(self, phrases):
+        self.numRagams = len(phrases)
+        goto = [{}]
+        outputs = [set()]
+        for id, ragamPhrases in enumerate(phrases):
+            for phrase in ragamPhrases:
+                state = 0
+                for step in phrase:
+                    if step not in goto[state]:
+                        goto[state][step] = len(goto)
+                        goto.append({})
+                        outputs.append(set())
+                    state = goto[state][step]
+                outputs[state].add(id)
+        # Breadth-first, every state's missing steps go where those of its failure state (the state of its
+        # longest proper suffix) go, and it has the outputs of its failure state as well
+        table = np.zeros((len(goto), len(SWARA_NAMES)), dtype=np.int32)
+        fail = [0]*len(goto)
+        queue = [0]
+        for state in queue:
+            for step in range(len(SWARA_NAMES)):
+                if step in goto[state]:
+                    child = goto[state][step]
+                    fail[child] = table[fail[state], step] if state != 0 else 0
+                    outputs[child] |= outputs[fail[child]]
+                    table[state, step] = child
+                    queue.append(child)
+                else:
+                    table[state, step] = table[fail[state], step] if state != 0 else 0
+        self.table = table
+        self.outputs = np.zeros((len(goto), self.numRagams), dtype=np.float32)
+        for state, ids in enumerate(outputs):
+            self.outputs[state, list(ids)] = 1
+
+    # Takes a stream of Notes, and returns the arrays of the number of phrases (sequences of PHRASE_LENGTH notes
+    # in a row) that every ragam allows and does not allow. Notes are matched by swara, in any octave, so a
+    # swara repeated in another octave (such as S1 to S2) is one step, as in the phrase rules (see getScalePhrases).
+    def countPhrases(self, notes):
+        table = self.table.tolist()
+        state = 0
+        states = []
+        lastStep = None
+        for note in notes:
+            step = int(SWARA_STEPS[note.code % (4*len(NOTE_NAMES))])
+            if step == lastStep:
+                continue
+            lastStep = step
+            state = table[state][step]
+            states.append(state)
+        numPhrases = max(len(states) - PHRASE_LENGTH + 1, 0)
+        # Every phrase rule has PHRASE_LENGTH steps, so only the states at the end of one have outputs
+        counts = np.bincount(np.array(states, dtype=int), minlength=len(self.table)).astype(np.float32)
+        matches = (counts @ self.outputs).astype(np.int64)
+        return matches, numPhrases - matches
+
 # This class is a wrapper class that simply stores the list of all ragams used for reference.
+# Sets of ragams are represented as bitsets: integers whose bit i is set if the ragam with id i is in the set.
+# Structural queries run over the whole database at once: every ragam's swara set is kept as a 12-bit mask (see
+# getSwaraMask), and the ragams with a given arohanam, or arohanam and avarohanam, are found through a hash index
+# of their encoded scales (see encodeScale), built the first time it is needed. The phrase rules of all the
+# ragams are compiled into one PhraseAutomaton the first time they are needed.
+# Parsing the ragam list is slow, so the database is compiled to a file next to it (see saveCompiled) and 
+# loaded from there by default, as long as the ragam list has not changed. A database loaded this way only 
+# builds the Ragam objects that are actually asked for.
 class RagamDB:
-    def __init__(self, filename):
-        self.ragamList = self.getRagamListFromFile(filename)
-        print("RAGAM LIST LENGTH: %d" % len(self.ragamList))
+    def __init__(self, filename, compiled=True):
+        if not compiled or not self.loadCompiled(filename):
+            self.setRagamList(self.getRagamListFromFile(filename))
+            if compiled:
+                self.saveCompiled(filename)
+        print("RAGAM LIST LENGTH: %d" % len(self.names))
+    
+    # Sets the ragams of this database, and builds their encoded scales and the transition index.
+    def setRagamList(self, ragamList):
+        self.__ragams = ragamList
+        self.__allBuilt = True
+        for i, ragam in enumerate(ragamList):
+            ragam.id = i
+        self.names = [ragam.name for ragam in ragamList]
+        self.parents = [ragam.parent for ragam in ragamList]
+        scales = [scale for ragam in ragamList for scale in (ragam.ascending, ragam.descending)]
+        self.scaleCodes = np.array([encodeNote(note) for scale in scales for note in scale], dtype=np.int8)
+        self.scaleOffsets = np.cumsum([0] + [len(scale) for scale in scales]).astype(np.int32)
+        self.allRagams = (1 << len(ragamList)) - 1
+        self.transitionIndex = self.buildTransitionIndex()
+        self.transitionMatrix = None
+        self.numAllowedTransitions = None
+        self.transitionWeights = None
+        self.swaraMasks = self.buildSwaraMasks()
+        self.scaleIndex = None
+        self.arohanamIndex = None
+        self.phraseAutomaton = None
+    
+    # The list of all ragams, in the order of the ragam list file.
+    @property
+    def ragamList(self):
+        if not self.__allBuilt:
+            for i in range(len(self.__ragams)):
+                self.getRagam(i)
+            self.__allBuilt = True
+        return self.__ragams
+    
+    # Returns the ragam with the given id, building it from its encoded scales if needed.
+    def getRagam(self, id):
+        if self.__ragams[id] is None:
+            ascending, descending = [[decodeNote(code) for code in self.scaleCodes[self.scaleOffsets[i]:self.scaleOffsets[i + 1]]] 
+                                     for i in (2*id, 2*id + 1)]
+            ragam = Ragam(self.names[id], ascending, descending, self.parents[id])
+            ragam.id = id
+            self.__ragams[id] = ragam
+        return self.__ragams[id]
+    
+    # Returns the filename of the compiled form of the given ragam list file.
+    @staticmethod
+    def getCompiledFilename(filename):
+        return os.path.splitext(filename)[0] + ".compiled.npz"
+    
+    # Returns the SHA-256 hash of the contents of the given file.
+    @staticmethod
+    def getFileHash(filename):
+        with open(filename, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    
+    # Writes the compiled form of this database for the given ragam list file: the ragam names and parents, 
+    # the encoded scales, and the transition index as a packed bit matrix with one row per transition code. 
+    # The file is replaced atomically, so concurrent readers never see a partial file. Failing to write 
+    # it (for example, in a read-only directory) is not an error.
+    def saveCompiled(self, filename):
+        compiledFilename = self.getCompiledFilename(filename)
+        keys = sorted(self.transitionIndex)
+        numBytes = (len(self.names) + 7) // 8
+        masks = np.array([np.frombuffer(self.transitionIndex[key].to_bytes(numBytes, 'little'), dtype=np.uint8) for key in keys],
+                         dtype=np.uint8).reshape(len(keys), numBytes)
+        tempFilename = "%s.%d.tmp" % (compiledFilename, os.getpid())
+        try:
+            with open(tempFilename, 'wb') as f:
+                np.savez(f, version=np.array(COMPILED_VERSION), source_hash=np.array(self.getFileHash(filename)),
+                         names=encodeStrings(self.names), parents=encodeStrings(self.parents),
+                         scale_codes=self.scaleCodes, scale_offsets=self.scaleOffsets,
+                         transition_keys=np.array(keys, dtype=np.int16),
+                         transition_masks=masks)
+            os.replace(tempFilename, compiledFilename)
+        except OSError:
+            if os.path.exists(tempFilename):
+                os.remove(tempFilename)
+    
+    # Loads this database from the compiled form of the given ragam list file. Returns False, without loading
+    # anything, if there is no compiled form, or if it is out of date or unreadable.
+    def loadCompiled(self, filename):
+        try:
+            with np.load(self.getCompiledFilename(filename), allow_pickle=False) as compiled:
+                if int(compiled["version"]) != COMPILED_VERSION or str(compiled["source_hash"]) != self.getFileHash(filename):
+                    return False
+                names = decodeStrings(compiled["names"])
+                parents = decodeStrings(compiled["parents"])
+                scaleCodes = compiled["scale_codes"]
+                scaleOffsets = compiled["scale_offsets"]
+                keys = compiled["transition_keys"]
+                masks = compiled["transition_masks"]
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return False
+        self.names = names
+        self.parents = parents
+        self.scaleCodes = scaleCodes
+        self.scaleOffsets = scaleOffsets
+        self.__ragams = [None]*len(names)
+        self.__allBuilt = False
+        self.allRagams = (1 << len(names)) - 1
+        self.transitionIndex = {int(key): int.from_bytes(mask.tobytes(), 'little') for key, mask in zip(keys, masks)}
+        self.transitionMatrix = None
+        self.numAllowedTransitions = None
+        self.transitionWeights = None
+        self.swaraMasks = self.buildSwaraMasks()
+        self.scaleIndex = None
+        self.arohanamIndex = None
+        self.phraseAutomaton = None
+        return True
+    
+    # Builds the inverted index from each transition code (see Transition.code) to the bitset of ragams
+    # that include that transition, by transposing the matrix of the ragams' packed transition masks.
+    def buildTransitionIndex(self):
+        if len(self.__ragams) == 0:
+            return {}
+        matrix = np.unpackbits(np.array([ragam.transitionMask for ragam in self.ragamList]), axis=1, 
+                               count=NUM_TRANSITION_CODES, bitorder='little')
+        columns = np.packbits(matrix.T, axis=1, bitorder='little')
+        return {int(code): int.from_bytes(columns[code].tobytes(), 'little') for code in np.flatnonzero(matrix.any(axis=0))}
+    
+    # Returns the array of the swara set of every ragam, as a 12-bit mask (see getSwaraMask) of the notes of both
+    # its scales, computed from the encoded scales at once.
+    def buildSwaraMasks(self):
+        steps = SWARA_STEPS[self.scaleCodes.astype(int) % (4*len(NOTE_NAMES))]
+        ids = np.repeat(np.arange(len(self.scaleOffsets) - 1) // 2, np.diff(self.scaleOffsets))
+        masks = np.zeros(len(self.names), dtype=np.uint16)
+        np.bitwise_or.at(masks, ids[steps >= 0], (1 << steps[steps >= 0].astype(np.uint16)).astype(np.uint16))
+        return masks
+
+    # Builds the hash indexes from the encoded arohanam and avarohanam (see encodeScale) of the ragams, and from
+    # their encoded arohanam alone, to the bitsets of the ragams that have them.
+    def buildScaleIndexes(self):
+        data = self.scaleCodes.astype(np.uint8).tobytes()
+        offsets = self.scaleOffsets.tolist()
+        self.scaleIndex = {}
+        self.arohanamIndex = {}
+        for id in range(len(self.names)):
+            arohanam = data[offsets[2*id]:offsets[2*id + 1]]
+            key = (arohanam, data[offsets[2*id + 1]:offsets[2*id + 2]])
+            self.scaleIndex[key] = self.scaleIndex.get(key, 0) | 1 << id
+            self.arohanamIndex[arohanam] = self.arohanamIndex.get(arohanam, 0) | 1 << id
+
+    # Returns the PhraseAutomaton of the phrase rules of all the ragams (see getScalePhrases), compiling it from
+    # the encoded scales the first time it is needed.
+    def getPhraseAutomaton(self):
+        if self.phraseAutomaton is None:
+            steps = SWARA_STEPS[self.scaleCodes.astype(int) % (4*len(NOTE_NAMES))].tolist()
+            offsets = self.scaleOffsets.tolist()
+            scales = [[step for step in steps[offsets[i]:offsets[i + 1]] if step >= 0] for i in range(len(offsets) - 1)]
+            self.phraseAutomaton = PhraseAutomaton([getScalePhrases(scales[2*id], scales[2*id + 1])
+                                                    for id in range(len(self.names))])
+        return self.phraseAutomaton
+
+    # Returns the boolean matrix with one row per transition code and one column per ragam, telling which
+    # ragams include which transitions. It is built from the transition index the first time it is needed.
+    def getTransitionMatrix(self):
+        if self.transitionMatrix is None:
+            numBytes = (len(self.names) + 7) // 8
+            packed = np.zeros((NUM_TRANSITION_CODES, numBytes), dtype=np.uint8)
+            for code, mask in self.transitionIndex.items():
+                packed[code] = np.frombuffer(mask.to_bytes(numBytes, 'little'), dtype=np.uint8)
+            self.transitionMatrix = np.unpackbits(packed, axis=1, count=len(self.names), bitorder='little').astype(bool)
+        return self.transitionMatrix
+    
+    # Returns the vector of the number of times each transition code (see Transition.code) occurs in the given
+    # transitions.
+    @staticmethod
+    def getTransitionCounts(transitions):
+        return np.bincount(np.array([transition.code for transition in transitions], dtype=int), 
+                           minlength=NUM_TRANSITION_CODES)
+    
+    # Takes a vector of transition counts (see getTransitionCounts), or a matrix with one such vector per row,
+    # and returns the support of every ragam: the number of the transitions that the ragam includes. This is
+    # a single product with the transition matrix, so every ragam is scored at once. The product is done in 
+    # float32, which is much faster than with integers and exact for any count below 2**24.
+    def scoreRagams(self, counts):
+        if self.transitionWeights is None:
+            self.transitionWeights = self.getTransitionMatrix().astype(np.float32)
+        return (np.asarray(counts, dtype=np.float32) @ self.transitionWeights).astype(np.int64)
+    
+    # Returns the number of transitions that every ragam allows.
+    def getNumAllowedTransitions(self):
+        if self.numAllowedTransitions is None:
+            self.numAllowedTransitions = self.getTransitionMatrix().sum(axis=0)
+        return self.numAllowedTransitions
+    
+    # Returns how specifically every ragam fits the given transition counts (see getTransitionCounts): the fraction
+    # of the transitions it allows that occur in them. A ragam that allows almost every transition includes those
+    # of any recording, so this tells apart ragams that include as many of its transitions.
+    def getSpecificity(self, counts):
+        return self.scoreRagams(np.asarray(counts) > 0) / np.maximum(self.getNumAllowedTransitions(), 1)
+    
+    # Ranks the ragams by how well they support the given transition counts (see getTransitionCounts), and
+    # returns the top k of them (or all, if k is None) as a list of (Ragam, score) pairs. The score of a ragam
+    # is the fraction of the transitions that it includes. Unlike filterRagams, a transition that no ragam
+    # includes only lowers every score a little. Ragams with the same score are ranked by how few transitions
+    # they allow, since a ragam that allows fewer transitions explains the recording more specifically. If the
+    # number of phrases of the recording that every ragam does not allow is given (see countPhrases), ties are
+    # first broken by fewest of these, which tells vakra ragams apart from their linear relatives.
+    def rankRagams(self, counts, k=10, violations=None):
+        total = int(np.sum(counts))
+        if total == 0 or len(self.names) == 0:
+            return []
+        support = self.scoreRagams(counts)
+        # lexsort sorts by its last key first; ties are finally broken by ragam id
+        keys = (np.arange(len(support)), self.getNumAllowedTransitions())
+        if violations is not None:
+            keys += (violations,)
+        order = np.lexsort(keys + (-support,))
+        if k is not None:
+            order = order[:k]
+        return [(self.getRagam(int(id)), int(support[id]) / total) for id in order]
+    
+    # Takes a stream of Notes, such as the notes of a recording, and returns the arrays of the number of its
+    # phrases that every ragam allows (matches) and does not allow (violations), in a single pass through the
+    # PhraseAutomaton.
+    def countPhrases(self, notes):
+        return self.getPhraseAutomaton().countPhrases(notes)
+
+    # Returns the bitset of all ragams that include the given transition.
+    def getRagamsMaskWithTransition(self, transition):
+        return self.transitionIndex.get(transition.code, 0)
+    
+    # Takes a list of transitions and a bitset of candidate ragams, and returns the bitset of the candidates
+    # that include every one of the transitions. A candidates value of None means that no filtering has been
+    # done yet, so every ragam is a candidate; 0 means that no ragam is left.
+    def filterRagams(self, transitions, candidates=None):
+        if candidates is None:
+            candidates = self.allRagams
+        for transition in transitions:
+            candidates &= self.transitionIndex.get(transition.code, 0)
+            if candidates == 0:
+                break
+        return candidates
+    
+    # Returns the bitset of the ragams with the given arohanam (a list of Notes), and the given avarohanam if
+    # it is not None.
+    def getScaleMask(self, ascendingScale, descendingScale=None):
+        if self.scaleIndex is None:
+            self.buildScaleIndexes()
+        if descendingScale is None:
+            return self.arohanamIndex.get(encodeScale(ascendingScale), 0)
+        return self.scaleIndex.get((encodeScale(ascendingScale), encodeScale(descendingScale)), 0)
+
+    # Returns the bitset of the ragams whose swaras include all of the given Notes (in any octave).
+    def getSupersetMask(self, notes):
+        swaraMask = getSwaraMask(notes)
+        return getMaskFromBools(self.swaraMasks & swaraMask == swaraMask)
+
+    # Returns the bitset of the ragams whose swaras are all among the given Notes (in any octave).
+    def getSubsetMask(self, notes):
+        return getMaskFromBools(self.swaraMasks & ~np.uint16(getSwaraMask(notes)) == 0)
+
+    # Returns the bitset of the janya ragams of the melakarta with the given name: the ragams listed under it,
+    # without the melakarta itself.
+    def getJanyaMask(self, parent):
+        names, parents = np.array(self.names, dtype=object), np.array(self.parents, dtype=object)
+        return getMaskFromBools((parents == parent) & (names != parent))
+
+    # Returns the bitset of the janya ragams of the melakarta with the given name whose swaras are all among
+    # the melakarta's, leaving out those with foreign notes (bhashanga ragams).
+    def getUpangaMask(self, parent):
+        melakarta = self.names.index(parent)
+        return self.getJanyaMask(parent) & self.getSubsetMask(self.getRagam(melakarta).ascending)
+
+    # Returns the list of ragams in the given bitset, in the order of the ragam list.
+    def getRagasFromMask(self, mask):
+        bits = bin(mask)[:1:-1]
+        return [self.getRagam(i) for i in range(len(bits)) if bits[i] == "1"]
+    
+    # Takes all the transitions of a recording and returns the list of ragams that include every one of
+    # them. Unlike getRagasWithTransition, an empty list always means that no ragam matches.
+    def getRagasWithTransitions(self, transitions):
+        return self.getRagasFromMask(self.filterRagams(transitions))
         
     # Takes a list of ragas and a transition, and returns a list of ragas from the original list that 
-    # include the transition.
+    # include the transition. An empty list of existing ragas is treated as all ragams.
     def getRagasWithTransition(self, existing_ragas, transition):
-        ragas = []
         if existing_ragas == []:
             existing_ragas = self.ragamList
-        for ragam in existing_ragas:
-            if transition in ragam.transitions:
-                ragas.append(ragam)
-        return ragas
+        mask = self.getRagamsMaskWithTransition(transition)
+        return [ragam for ragam in existing_ragas if mask >> ragam.id & 1]
         
     # Reads the given filename and returns a list of Ragam objects representing
     # each ragam in the file.
@@ -218,13 +718,24 @@ class RagamDB:
                     
         return ragamList
             
+    # Returns the ragam with the given name (the first one in the ragam list, if several have it). If no ragam
+    # has exactly that name, names are compared ignoring case and diacritics (see foldName).
+    def searchByName(self, name):
+        if name in self.names:
+            return self.getRagam(self.names.index(name))
+        folded = foldName(name)
+        for id, other in enumerate(self.names):
+            if foldName(other) == folded:
+                return self.getRagam(id)
+        raise RagamNotFoundError(name)
+
     ## Searches for a ragam based on ascending and descending scales
-    # Returns a Ragam object if it finds the appropriate ragam.
+    # Returns a Ragam object if it finds the appropriate ragam (the first one in the ragam list, if several
+    # have the same scales), found through the scale index (see getScaleMask).
     def searchByScales(self, ascendingScale, descendingScale):
-        for ragam in self.ragamList:
-            if ragam.ascending == ascendingScale and ragam.descending == descendingScale:
-                return ragam
-        else:
+        mask = self.getScaleMask(ascendingScale, descendingScale)
+        if mask == 0:
             raise RagamNotFoundError
+        return self.getRagam((mask & -mask).bit_length() - 1)
    
 
@@ -3,211 +3,328 @@
 # This file contains the main functions used for testing the Ragam Finder program, that operate on a 
 # high level.
 
-import sys, os, csv, traceback
-from aubio import source, pitch
+import sys, os, contextlib, itertools
+from collections import deque
+from multiprocessing import Pool, cpu_count
 import numpy as np
-import matplotlib.pyplot as plt
-from statistics import mode
 from RagamDB import *
 from musicFuncs import *
+from profileFuncs import getProfiler, timedStage, stageTimer, countEvent, recordValue, observeValues
+import profileFuncs
+from outputFuncs import OutputSink, OUTPUT_MODES
+from cacheFuncs import FeatureCache
+from arrayFuncs import RaggedArray
+from audioFuncs import FrontEnd, getFrontEnd
+from pitchFuncs import PITCH_BACKENDS, getPitchBackend, hasExactPitches
+from noteFuncs import NoteSegmenter, getNoteSegmenter
+
+# Generator that takes blocks of frames and yields a RaggedArray of the fundamental frequencies found in the
+# frames of each block. Every block is analyzed at once by the given pitch backend (see pitchFuncs), or by the
+# batched FFT engine if there is none. If diagnostics are given, their spectra are recorded. When
+# instrumentation is on, the frames are counted, and the distribution of the backend's confidence in every frame
+# is recorded, as a percentage.
+def getFramePitchBlocks(blocks, samplerate, diagnostics=None, backend=None):
+    for frames in blocks:
+        countEvent("frames", len(frames))
+        if backend is None:
+            yield RaggedArray.fromRows(getFrameFundamentals(samplerate, frames, diagnostics=diagnostics))
+            continue
+        pitches = backend.getFrameFundamentals(frames, diagnostics)
+        observeValues("pitch_confidence_percent", np.rint(100 * pitches.columns["confidence"]))
+        yield pitches
+
+# Generator that takes blocks of frames and yields the list of fundamental frequencies found in each frame, as
+# getFramePitchBlocks finds them.
+def analyzeFrameBlocks(blocks, samplerate, diagnostics=None, backend=None):
+    for pitches in getFramePitchBlocks(blocks, samplerate, diagnostics, backend):
+        yield from pitches
+
+# Generator that passes frames of fundamental frequencies through, writing the swaras found in each one
+# to the given OutputSink to see them easily.
+def printFrameSwaras(frames, swaraTable, output):
+    output.beginFrames()
+    for pitches in frames:
+        output.writeFrame(swaraTable.getSwaras(pitches))
+        yield pitches
+    output.flush()
+
+# Generator that takes the despeckled pitch of every frame (None for an empty frame), skips the empty frames,
+# and drops the first and last trim pitches, which are less reliable. Only the last trim pitches are held.
+def trimPitches(pitches, trim):
+    held = deque()
+    skipped = 0
+    for pitch in pitches:
+        if pitch is None:
+            continue
+        if skipped < trim:
+            skipped += 1
+            continue
+        held.append(pitch)
+        if len(held) > trim:
+            yield held.popleft()
+
+# Chains the analysis stages over a stream of frame blocks: fundamental frequency detection, despeckling,
+# note extraction and transition detection. Returns a generator of the Transitions found, which only holds
+# a few frames in memory at a time. The swaras of every frame are written to the given OutputSink if it is
+# verbose, or printed if printFrames is True and no OutputSink is given.
+# If diagnostics (see plotFuncs) are given, the spectra and notes of the frames are recorded to them. The
+# fundamental frequencies are found by the given pitch backend, or the batched FFT engine if there is none.
+def analyzeStream(blocks, samplerate, win_s, sruthi, superwindow_size=5, printFrames=False, diagnostics=None,
+                  output=None, backend=None):
+    frames = analyzeFrameBlocks(timedStage("decode", blocks), samplerate, diagnostics, backend)
+    return analyzeFrames(frames, samplerate, win_s, sruthi, superwindow_size, printFrames, diagnostics, output,
+                         bySemitone=backend is not None and backend.exactPitches)
+
+# Chains the analysis stages that come after fundamental frequency detection (see analyzeStream) over a stream
+# of frames, each being the list of fundamental frequencies found in it. Returns a generator of the Transitions found.
+# If the frames are a RaggedArray (of a whole file), the despeckled pitches are kept in an array, and are split into
+# notes all at once by the given NoteSegmenter (see noteFuncs), which by default has the original settings for
+# frames hop_s samples apart (win_s, if no hop is given, for frames that do not overlap), as in processFile.
+# Other streams of frames are split into notes as they are read, with the original rule.
+# If bySemitone is True, the frames hold exact pitches (see pitchFuncs.hasExactPitches), which are despeckled and
+# split into notes by semitone rather than by frequency.
+def analyzeFrames(frames, samplerate, win_s, sruthi, superwindow_size=5, printFrames=False, diagnostics=None,
+                  output=None, segmenter=None, hop_s=None, bySemitone=False):
+    swaraTable = getSwaraTable(sruthi)
+    isFile = isinstance(frames, RaggedArray)
+    if segmenter is None:
+        segmenter = NoteSegmenter((hop_s or win_s) / samplerate)
+    if isFile and diagnostics is None and not printFrames and (output is None or not output.traceFrames):
+        with stageTimer("despeckle"):
+            track = despeckleTrack(frames, superwindow_size, bySemitone)
+        return getSegmentTransitions(track, swaraTable, superwindow_size, segmenter, bySemitone)
+    if diagnostics is not None:
+        frames = timedStage("diagnostics", diagnostics.recordFrames(frames, swaraTable))
+    if printFrames and output is None:
+        output = OutputSink("verbose")
+    if output is not None and output.traceFrames:
+        frames = timedStage("print_frames", printFrameSwaras(frames, swaraTable, output))
+    pitches = timedStage("despeckle", despeckleFrames(frames, superwindow_size, bySemitone))
+    if diagnostics is not None:
+        pitches = timedStage("diagnostics", diagnostics.recordDespeckled(pitches, swaraTable))
+    if isFile:
+        return getSegmentTransitions(getPitchTrack(pitches), swaraTable, superwindow_size, segmenter, bySemitone)
+    pitches = trimPitches(pitches, superwindow_size)
+    notes = extractNotes(pitches, swaraTable, bySemitone)
+    return timedStage("notes_transitions", determineTransitions(notes))
+
+# Splits an array of despeckled pitches (see despeckleTrack) into notes with the given NoteSegmenter, leaving out
+# the first and last trim frames with a pitch, and returns an iterator over the Transitions between the notes,
+# whose swaras are looked up in the given SwaraTable. bySemitone is passed to NoteSegmenter.segment.
+def getSegmentTransitions(track, swaraTable, trim, segmenter, bySemitone=False):
+    with stageTimer("notes_transitions"):
+        notes = segmenter.segment(track, trim, bySemitone).getNotes(swaraTable)
+        return iter(determineTransitionsFromNotes(notes))
 
 # Handles all file processing - takes a filename and a sruthi, gets all the frequencies present in the file
 # using FFTs, determines the fundamental frequencies, despeckles these fundamental frequencies, and ultimately
 # extracts the notes and transitions present in the given file. Returns this list of transitions.
-def processFile(filename, sruthi):
+# superwindow_size is the number of frames that each frame is despeckled over. The swaras found in every frame
+# are written to the given OutputSink if it is verbose, or printed if printFrames is True.
+# If diagnostics are given, their plots are saved once the file is analyzed. If a FeatureCache is given, the
+# fundamental frequencies of the file are taken from it if the file was analyzed before (see getFileFrames).
+# The audio is read into frames by the given FrontEnd, which by default has the original settings (see audioFuncs),
+# and their fundamental frequencies are found by the pitch backend with the given name (see pitchFuncs). If a
+# number of workers is given, the file is split into chunks that are analyzed in parallel (see getParallelFileFrames).
+# The despeckled pitches are split into notes by the given NoteSegmenter, which by default has the original settings.
+def processFile(filename, sruthi, superwindow_size=5, printFrames=False, diagnostics=None, output=None, cache=None,
+                frontEnd=None, pitchBackend="fft", workers=None, segmenter=None):
     
-    downsample = 1
-    samplerate = 44100 // downsample
+    if frontEnd is None:
+        frontEnd = FrontEnd()
 
-    win_s = 4096 // downsample # fft size
-    hop_s = 512  // downsample # hop size
+    frames = getFileFrames(filename, frontEnd, cache, diagnostics, pitchBackend, workers)
+    
+    transitions = list(analyzeFrames(frames, frontEnd.rate, frontEnd.win_s, sruthi, superwindow_size, 
+                                     printFrames, diagnostics, output, segmenter, frontEnd.hop_s,
+                                     hasExactPitches(pitchBackend)))
+    
+    # GRAPHS OF NOTES BEFORE AND AFTER DESPECKLE
+    if diagnostics is not None:
+        for plotFile in diagnostics.save(os.path.splitext(os.path.basename(filename))[0]):
+            print("Saved diagnostics plot %s" % plotFile)
+    return transitions
 
-    s = source(filename, samplerate, win_s)
-    samplerate = s.samplerate
+# Handles the processing of a file whose sruthi is not known: gets the fundamental frequencies of the file and
+# despeckles them once, as processFile does, and then finds the notes and transitions of the file for every one of
+# the twelve possible sruthis (in the given octave) at once, and evaluates them against the given RagamDB. Returns
+# the list of results for each sruthi, best supported first (see evaluateSruthis). The FeatureCache, FrontEnd,
+# pitch backend, workers and NoteSegmenter are used as in processFile.
+def processFileAllSruthis(filename, ragamDB, superwindow_size=5, octave=3, cache=None, frontEnd=None,
+                          pitchBackend="fft", workers=None, segmenter=None):
+    if frontEnd is None:
+        frontEnd = FrontEnd()
+    frames = getFileFrames(filename, frontEnd, cache, pitchBackend=pitchBackend, workers=workers)
+    semitones = analyzeSemitones(frames, frontEnd.rate, frontEnd.win_s, superwindow_size, segmenter, frontEnd.hop_s,
+                                 hasExactPitches(pitchBackend))
+    return evaluateSruthis(semitones, ragamDB, octave)
 
+# Returns the fundamental frequencies found in every frame of the given audio file, read by the given FrontEnd,
+# by the pitch backend with the given name, as a RaggedArray. If a FeatureCache is given, the frames are
+# read from it if the file was already analyzed with the same FrontEnd and backend settings, skipping decoding
+# and fundamental frequency detection, and are saved to it otherwise. Diagnostics need the spectra of the frames,
+# so the cache is not used with them. If a number of workers above 1 is given, the frames are found by that many
+# worker processes (see getParallelFileFrames), unless there are diagnostics, which are recorded in this process.
+def getFileFrames(filename, frontEnd, cache=None, diagnostics=None, pitchBackend="fft", workers=None):
+    backend = getPitchBackend(pitchBackend, frontEnd.rate, frontEnd.win_s)
+    key = None
+    if cache is not None and diagnostics is None:
+        key = cache.getKey(filename, pitch=backend.getParameters(), **frontEnd.getParameters())
+        frames = cache.load(key)
+        if frames is not None:
+            countEvent("feature_cache_hits")
+            return frames
+        countEvent("feature_cache_misses")
+    if workers is not None and workers > 1 and diagnostics is None:
+        with stageTimer("parallel_front_end"):
+            frames = getParallelFileFrames(filename, frontEnd, pitchBackend, workers)
+    else:
+        blocks = frontEnd.getFrameBlocks(frontEnd.readSourceHops(frontEnd.openSource(filename)))
+        frames = RaggedArray.concatenate(getFramePitchBlocks(timedStage("decode", blocks), frontEnd.rate, diagnostics,
+                                                             backend))
+    if key is not None:
+        cache.save(key, frames)
+    return frames
 
-    accumulated_pitches = {}
-   
-    print("|============================================|")
+# Returns the RaggedArray of the fundamental frequencies found in every frame of the given audio file, as
+# getFileFrames does, using a pool of the given number of worker processes. The file is split into chunks of
+# chunkSeconds of audio, which the workers decode and analyze on their own (see analyzeChunk), and the frames of
+# the chunks are concatenated in order. Each frame only depends on the samples around it, so the frames are
+# the same as when the file is read from the start, and so is everything found from them. Despeckling depends on
+# the frames that were already despeckled, so it is not split into chunks: the frames of all the chunks are
+# stitched back together before it, and it is done once over the whole file.
+def getParallelFileFrames(filename, frontEnd, pitchBackend="fft", workers=None, chunkSeconds=30):
+    numHops = frontEnd.openSource(filename).duration // frontEnd.inputHop + 1
+    chunkHops = max(1, int(chunkSeconds * frontEnd.samplerate) // frontEnd.inputHop)
+    # the last chunk is read up to the end of the file, in case its length was not exact
+    chunks = [(filename, frontEnd, pitchBackend, firstHop, chunkHops if firstHop + chunkHops < numHops else None)
+              for firstHop in range(0, numHops, chunkHops)]
+    with Pool(min(workers or cpu_count(), len(chunks))) as pool:
+        return RaggedArray.concatenate(pool.imap(analyzeChunk, chunks))
 
-    output_list = []
-    pitchDict = {"S" : 0, "R": 1, "RG": 2, "G": 3, "M": 4, "P": 5, "D": 6, "DN": 7, "N": 8}
-    
-    while True: # For loop that iterates over every frame in the given file.
-        samples, read = s()
-        if read < hop_s:
-            break
-        pitches = getFrequencies(44100, samples)
-                    
-        newNotes = [freqToPitch(freq) for freq in pitches]
-        
-        output_list.append(pitches)
-        
-        # Printing rough approximation of all notes to see easily
-        for note in newNotes:
-            swara = convertPitchToSwara(note, sruthi)
-            print("\t" * pitchDict[swara.note[0]], end='')
-            print("%s" % swara)
-            # if note in oldNotes:
-            if note not in accumulated_pitches:
-                accumulated_pitches[note] = 1
-            else:
-                accumulated_pitches[note] += 1
-
-        print("|============================================|")
-        # oldNotes = newNotes
-    
-    superwindow_size = 5
-        
-    # plotNotes(output_list, sruthi, filename, False)
-    
-    output_list = despecklePitches(output_list, superwindow_size, sruthi)
-    
-    note_list = extractNotesFromDespeckledFreqs(output_list[superwindow_size:len(output_list) - superwindow_size], sruthi)
-    
-    transition_list = determineTransitionsFromNotes(note_list)
-    
-    #-----------------------------------------------------------------------------------
+# Finds the fundamental frequencies of the frames of one chunk of an audio file in a worker process. The chunk is
+# a tuple of the filename, the FrontEnd, the name of the pitch backend, the first hop of the chunk and its number
+# of hops (None to read to the end of the file). Reading starts the FrontEnd's number of warm-up hops before the
+# chunk, so that its first frames have the same samples and decimation filter history as when the file is read
+# from the start, and the frames of the warm-up hops are dropped. Returns a RaggedArray of the frames'
+# fundamental frequencies.
+def analyzeChunk(chunk):
+    filename, frontEnd, pitchBackend, firstHop, numHops = chunk
+    warmupHops = min(firstHop, frontEnd.getWarmupHops())
+    s = frontEnd.openSource(filename)
+    if firstHop > warmupHops:
+        s.seek((firstHop - warmupHops) * frontEnd.inputHop)
+    hops = frontEnd.readSourceHops(s)
+    if numHops is not None:
+        hops = itertools.islice(hops, warmupHops + numHops)
+    backend = getPitchBackend(pitchBackend, frontEnd.rate, frontEnd.win_s)
+    frames = RaggedArray.concatenate(getFramePitchBlocks(frontEnd.getFrameBlocks(hops), frontEnd.rate, backend=backend))
+    return frames[warmupHops:].compact()
 
-    # GRAPH OF NOTES AFTER DESPECKLE    
-    # plotNotes(output_list, sruthi, filename, True)
-    
-    #-----------------------------------------------------------------------------------
+# Takes a stream of frames of fundamental frequencies and analyzes them as analyzeFrames does, up to the point
+# where the sruthi is needed. Returns the array of the semitone numbers (see freqToSemitones) of the note segments
+# found by the given NoteSegmenter, which by default has the original settings for frames hop_s samples apart (see
+# analyzeFrames), by semitone if bySemitone is True. This is all that is needed to find the notes for any sruthi.
+def analyzeSemitones(frames, samplerate, win_s, superwindow_size=5, segmenter=None, hop_s=None, bySemitone=False):
+    with stageTimer("despeckle"):
+        track = despeckleTrack(frames, superwindow_size, bySemitone)
+    if segmenter is None:
+        segmenter = NoteSegmenter((hop_s or win_s) / samplerate)
+    return segmenter.segment(track, superwindow_size, bySemitone).getSemitones()
 
-    return transition_list
+# Generator that despeckles a stream of frames, where each frame is a list of the pitches found in it. For every 
+# frame, yields the single pitch it is despeckled to, or None if it has no pitch. Each frame becomes the most common 
+# pitch of the super window around it: the superwindow_size // 2 frames before it (which are already despeckled), 
+# itself, and the frames after it. If the super window has no pitches, the frame is left empty. Ties between 
+# pitches go to the one appearing first in the super window, oldest frame first. Frames at the start and the end 
+# that have no complete super window around them keep their first pitch.
+# If bySemitone is True, pitches are counted by semitone (see freqToSemitones), and a frame becomes the first pitch
+# of the most common semitone.
+# When instrumentation is on, the frames falling back to their first pitch, the super windows without any
+# pitch, and the frames whose pitch was changed are counted.
+def despeckleFrames(frames, superwindow_size=5, bySemitone=False):
+    profiler = getProfiler()
+    before = superwindow_size // 2
+    superwindow = FrameWindow(freqToSemitones if bySemitone else None)
+    started = False
+    for frame in frames:
+        if len(superwindow) == superwindow_size:
+            superwindow.pop()
+        superwindow.push(list(frame))
+        if len(superwindow) < superwindow_size:
+            continue
+        if not started:
+            # the first frames never have a complete super window around them
+            for index in range(before):
+                yield firstPitch(superwindow[index])
+            countEvent("despeckle_edge_frames", before)
+            started = True
+        most_common_freq = superwindow.mode()
+        if profiler is not None:
+            if most_common_freq is None:
+                countEvent("despeckle_empty_windows")
+            elif most_common_freq != firstPitch(superwindow[before]):
+                countEvent("despeckle_changed_frames")
+        superwindow.replace(before, [] if most_common_freq is None else [most_common_freq])
+        yield most_common_freq
+    # neither do the last ones (or any frame, if there were fewer frames than the super window size)
+    countEvent("despeckle_edge_frames", len(superwindow) - (before + 1 if started else 0))
+    for index in range(before + 1 if started else 0, len(superwindow)):
+        yield firstPitch(superwindow[index])
+
+# Despeckles a stream of frames (such as a RaggedArray) as despeckleFrames does, and returns an array holding the
+# pitch that every frame is despeckled to, or NaN if it has none.
+def despeckleTrack(frames, superwindow_size=5, bySemitone=False):
+    return getPitchTrack(despeckleFrames(frames, superwindow_size, bySemitone))
+
+# Takes a stream of despeckled pitches (see despeckleFrames), and returns them in an array, with NaN for None.
+def getPitchTrack(pitches):
+    return np.fromiter((np.nan if pitch is None else pitch for pitch in pitches), dtype=float)
+
+# Returns the first pitch of a frame, or None if the frame is empty.
+def firstPitch(frame):
+    return frame[0] if len(frame) > 0 else None
 
-# Given a set of frequencies, a sruthi, a filename, and a boolean value representing whether
-# this list of freqs has been despeckled, plots the given notes.
-def plotNotes(original_freq_list, sruthi, filename, despeckled):
-    notes_to_graph = []
-    
-    # Convert all original_freq_list to notes
-    for freq in original_freq_list:
-        if type(freq) == list:
-            if len(freq) >= 1:
-                freq = freq[0]
-            elif len(freq) == 0:
-                continue
-        pitch = freqToPitch(freq)
-        note = convertPitchToSwara(pitch, sruthi)
-        notes_to_graph.append(note)
-    y = []
-    count = 0;
-    noteToNums = {"S0": 0, "R1": 1, "RG1": 2, "RG2": 3, "G3": 4, "M1": 5, "M2": 6, "P0": 7, 
-                  "D1": 8, "DN1": 9, "DN2": 10, "N3": 11}
-    for note in notes_to_graph: 
-        frame_notes = []
-        val_to_append = noteToNums[note.note + str(note.noteclass)]
-        if note.octave > 1:
-            val_to_append += 12
-        frame_notes.append(val_to_append)
-        y.append(tuple(frame_notes))
-        count += 1
-    x = list(range(count))
-    for xe, ye in zip(x, y):
-        plt.scatter([xe]*len(ye), ye, c=[[0, 0, 0]])
-    plt.title("Plot of all frames' notes for %s %s" % (filename, "(after despeckle)" if despeckled else "(before despeckle)"))
-    plt.xlabel("Frame number")
-    plt.ylabel("Note(s) identified for frame")
-    plt.xticks(np.arange(0, count, 4))
-    plt.yticks(np.arange(0, max(max(y)), 1))
-
-    # plt.show()
-    
 # Takes a list of lists of pitches, a super window size, and a sruthi. Each list of pitches represents all the pitches
 # discovered in one frame. So if there are 5 frames analyzed in total, and 1 pitch found per frame, then the pitchList 
-# would be [[a], [b], [c], [d], [e]], where a, b, c, d, and e represent frequencies. 
-def despecklePitches(pitchList, superwindow_size, sruthi):
-    middle_frame_index = int(superwindow_size/2)
-    superwindow = pitchList[:superwindow_size] # if x is superwindow size, take the first x elements from the input list
-    dataIndex = superwindow_size # dataIndex is used to get the next pitch when sliding the superwindow
-    while dataIndex <= len(pitchList):
-        all_superwindow_freqs = [] # will contain all the frequencies for the entire superwindow
-        for frame in superwindow:
-            for pitch in frame:
-                all_superwindow_freqs.append(pitch)
-        try:
-            most_common_freq = mode(all_superwindow_freqs)
-            most_common_note = convertPitchToSwara(freqToPitch(most_common_freq), sruthi)
-        except:
-            # traceback.print_exc()
-            # superwindow = []
-            # print()
-            # print("+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=")
-            # print("No most common swara found.")
-            # print("+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=")
-            # print()
-            # Remove the first element of the superwindow and add the next element
-            old_mid_frame = pitchList[middle_frame_index]
-            
-            # since no most common freq, just going to pick the second half of the superwindow.
-            defaultPitch = pitchList[middle_frame_index + 1]
-            if defaultPitch != []:
-                defaultPitch = [defaultPitch[0]]
-            pitchList[middle_frame_index] = defaultPitch
-            # print("Swapped %s with %s" % (old_mid_frame, pitchList[middle_frame_index]))
-            
-            # Now, remove first element from superwindow to move the window by 1 frame
-            
-            # This makes sure that the first element of new superwindow is the second element of old superwindow
-            new_low_index = (middle_frame_index - int(superwindow_size/2)) + 1 
-            new_high_index = middle_frame_index + int(superwindow_size/2) + 1
-            superwindow = pitchList[new_low_index:new_high_index]
-            middle_frame_index += 1 # superwindow will be offset by 1; move the middle index pointer up 1 frame.
-            # add the next frame's data to the superwindow
-            if dataIndex < len(pitchList):
-                superwindow.append(pitchList[dataIndex])
-            else:
-                break
-            dataIndex += 1
-            continue
-            
-        # print()
-        # print("+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=")
-        # print("Most common swara for this superwindow: %s" % most_common_note)
-        # print("+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=")
-        # print()
-        old_mid_frame = pitchList[middle_frame_index]
-        pitchList[middle_frame_index] = [most_common_freq]
-        # print("Swapped %s with %s" % (old_mid_frame, pitchList[middle_frame_index]))
-        
-        # Now, remove first element from superwindow to move the window by 1 frame
-        
-        # This makes sure that the first element of new superwindow is the second element of old superwindow
-        new_low_index = (middle_frame_index - int(superwindow_size/2)) + 1 
-        new_high_index = middle_frame_index + int(superwindow_size/2) + 1
-        superwindow = pitchList[new_low_index:new_high_index]
-        middle_frame_index += 1 # superwindow will be offset by 1; move the middle index pointer up 1 frame.
-        # add the next frame's data to the superwindow
-        if dataIndex < len(pitchList):
-            superwindow.append(pitchList[dataIndex])
-        dataIndex += 1
-    print("Finished despeckling.")
-    return [x[0] for x in pitchList if x != []]
+# would be [[a], [b], [c], [d], [e]], where a, b, c, d, and e represent frequencies. Returns the list of despeckled
+# pitches, skipping frames that have none (see despeckleFrames). The sruthi is not needed, and is kept for compatibility.
+def despecklePitches(pitchList, superwindow_size, sruthi=None):
+    return [pitch for pitch in despeckleFrames(pitchList, superwindow_size) if pitch is not None]
     
 # Takes a list of pitch frequencies (after despeckling) and returns a list of Notes
 # in the order that they are given in the input frequencies.
-def extractNotesFromDespeckledFreqs(freqs, sruthi):
-    currentFreq = None
-    extractedNotes = []
-    lastAddedNote = None
-    if freqs == []:
-        return extractedNotes
+# If a SwaraTable is given, it is used to look up the swaras of the frequencies.
+def extractNotesFromDespeckledFreqs(freqs, sruthi, swaraTable=None):
+    freqs = np.asarray(freqs, dtype=float)
+    if len(freqs) < 2:
+        return []
     
     # Notes are only extracted if there are at least two instances of a frequency in a row
-    currentFreq = freqs[0]
-    for i in range(1, len(freqs)):
-        freq = freqs[i]
-        if freq == currentFreq and freq != None:
-            pitch = freqToPitch(freq)
-            note = convertPitchToSwara(pitch, sruthi)
-            if lastAddedNote != note:
-                extractedNotes.append(note)
-                lastAddedNote = note 
-        else:
-            currentFreq = freq 
-    
-    return extractedNotes
+    repeatedFreqs = freqs[1:][freqs[1:] == freqs[:-1]]
+    if swaraTable is not None:
+        swaraIndexes = swaraTable.getSwaraIndexes(repeatedFreqs)
+    else:
+        swaraIndexes = freqsToSwaraIndexes(repeatedFreqs, sruthi)
+    # A note is only added if it differs from the last added note
+    isNewNote = np.ones(len(swaraIndexes), dtype=bool)
+    isNewNote[1:] = swaraIndexes[1:] != swaraIndexes[:-1]
+    return list(SWARA_NOTES[swaraIndexes[isNewNote]])
+
+# Generator version of extractNotesFromDespeckledFreqs: takes a stream of despeckled pitch frequencies and 
+# yields each new Note as soon as it is found. If bySemitone is True, frequencies of the same semitone (see
+# freqToSemitones) count as the same.
+def extractNotes(freqs, swaraTable, bySemitone=False):
+    currentKey = None
+    lastAddedSwara = None
+    for freq in freqs:
+        key = freqToSemitones(freq) if bySemitone else freq
+        if key == currentKey:
+            swaraIndex = swaraTable.getSwaraIndexes(freq)
+            if swaraIndex != lastAddedSwara:
+                lastAddedSwara = swaraIndex
+                yield SWARA_NOTES[swaraIndex]
+        currentKey = key
 
 # Returns True if the given note (not considering the note class) exists in the given
 # list of transitions. Returns False otherwise.
@@ -230,55 +347,315 @@ def determineTransitionsFromNotes(noteList):
         
     return transitions 
 
+# Generator version of determineTransitionsFromNotes: yields the Transition into every note of the given
+# stream of notes after the first.
+def determineTransitions(notes):
+    previousNote = None
+    for note in notes:
+        if previousNote is not None:
+            yield Transition(previousNote, note)
+        previousNote = note
+
+# Generator that narrows down the candidate ragams of the given RagamDB with each transition of the
+# given stream, yielding each transition along with the list of ragams that are still candidates.
+# If a transition leaves no candidates, the next one is checked against all ragams again.
+# When instrumentation is on, the number of candidates after each transition is recorded.
+def narrowRagams(ragamDB, transitions):
+    candidates = None
+    for transition in transitions:
+        with stageTimer("ragam_filter"):
+            if candidates == 0:
+                countEvent("candidate_resets")
+                candidates = None
+            candidates = ragamDB.filterRagams([transition], candidates)
+            ragas = ragamDB.getRagasFromMask(candidates)
+        recordValue("candidates_after_transition", len(ragas))
+        yield transition, ragas
+
+    
+# Returns the list of ragams of the given RagamDB that are still candidates after narrowing them down
+# with all of the given transitions (see narrowRagams).
+def getPossibleRagas(ragamDB, transitions):
+    ragas_that_meet_criteria = []
+    for transition, ragas_that_meet_criteria in narrowRagams(ragamDB, transitions):
+        pass
+    return ragas_that_meet_criteria
+
+# Writes the given transitions of a file to the given OutputSink, along with the ragams of the given RagamDB that
+# are still candidates after each one, and then the possible ragas left after all of them along with the top
+# ragams by score (see RagamDB.rankRagams). If phrases is True, the notes of the transitions are also matched
+# against the phrase rules of every ragam (see RagamDB.countPhrases), ties in the ranking are broken by fewest
+# phrases that a ragam does not allow, and the number of these is written along with the ranking.
+def writeRagamResults(ragamDB, transitions, output, top=10, phrases=False):
+    ragas_that_meet_criteria = []
+    output.writeTransitions(transitions)
+    for transition, ragas_that_meet_criteria in narrowRagams(ragamDB, transitions):
+        output.writeCandidates(transition, ragas_that_meet_criteria)
+    violations = None
+    if phrases:
+        with stageTimer("phrase_matching"):
+            matches, violations = ragamDB.countPhrases(getTransitionNotes(transitions))
+    with stageTimer("ragam_ranking"):
+        ranking = ragamDB.rankRagams(ragamDB.getTransitionCounts(transitions), top, violations)
+    output.writeResult(ragas_that_meet_criteria, transitions, ranking, violations)
+
+# Returns the list of notes that the given list of transitions goes through, from the base of the first one.
+def getTransitionNotes(transitions):
+    return [transitions[0].base] + [transition.end for transition in transitions] if transitions != [] else []
+
+# Takes the semitone numbers of the pitches of a recording (see analyzeSemitones), and evaluates all twelve
+# sruthis of the given octave against the given RagamDB in a single pass. The swaras of every pitch are found
+# for all sruthis at once, as a matrix with one row per sruthi, and the transitions between them are counted
+# per sruthi. Multiplying these counts by the RagamDB's transition matrix gives the support of every ragam
+# under every sruthi: the number of transitions of the recording it includes. Returns a list with a
+# dictionary for each sruthi holding:
+#  - sruthi: the name of the sruthi (without octave)
+#  - transitions: the list of Transitions found with this sruthi, the same as processFile would find
+#  - ragams: the ragams left after narrowing down the candidates with these transitions (see getPossibleRagas)
+#  - support: the largest number of these transitions that a single ragam includes
+#  - coverage: support as a fraction of the number of transitions
+#  - best_ragams: the ragams with that support
+#  - specificity: the highest specificity of the best ragams (see RagamDB.getSpecificity), the fraction of the
+#    transitions they allow that were found
+# The list is sorted with the best supported sruthis first: by coverage, then by specificity, then by number of
+# transitions. Coverage alone cannot tell a sruthi from the other tonics of the same notes, since some ragam
+# allows the transitions of every one of them; the true sruthi is the one whose ragam allows little else.
+def evaluateSruthis(semitones, ragamDB, octave=3):
+    sruthis = [name + str(octave) for name in PITCH_NAMES]
+    swaraIndexes = getSwaraIndexesForSruthis(semitones, [pitchToSemitones(sruthi) for sruthi in sruthis])
+    
+    # A note is added every time the swara changes (see extractNotes)
+    if len(semitones) > 0:
+        isNewNote = np.ones(swaraIndexes.shape, dtype=bool)
+        isNewNote[:, 1:] = swaraIndexes[:, 1:] != swaraIndexes[:, :-1]
+    else:
+        isNewNote = np.zeros(swaraIndexes.shape, dtype=bool)
+    noteIndexes = [row[isNew] for row, isNew in zip(swaraIndexes, isNewNote)]
+    counts = np.zeros((len(sruthis), NUM_TRANSITION_CODES), dtype=np.int64)
+    for i, notes in enumerate(noteIndexes):
+        codes = getTransitionCodes(SWARA_CODES[notes[:-1]], SWARA_CODES[notes[1:]])
+        counts[i] = np.bincount(codes, minlength=NUM_TRANSITION_CODES)
+    with stageTimer("ragam_filter"):
+        support = ragamDB.scoreRagams(counts)
+        specificity = ragamDB.getSpecificity(counts)
+    numTransitions = counts.sum(axis=1)
     
+    results = []
+    for i, sruthi in enumerate(sruthis):
+        transitions = list(determineTransitions(SWARA_NOTES[noteIndexes[i]]))
+        best = int(support[i].max()) if support.shape[1] > 0 else 0
+        bestIds = np.flatnonzero(support[i] == best) if best > 0 else np.zeros(0, dtype=np.int64)
+        results.append({"sruthi": PITCH_NAMES[i], "transitions": transitions, 
+                        "ragams": getPossibleRagas(ragamDB, transitions), "support": best,
+                        "coverage": float(best / numTransitions[i]) if numTransitions[i] > 0 else 0.0,
+                        "specificity": float(specificity[i][bestIds].max()) if len(bestIds) > 0 else 0.0,
+                        "best_ragams": [ragamDB.getRagam(int(id)) for id in bestIds]})
+    results.sort(key=getSruthiRank)
+    return results
+
+# Returns the key that evaluateSruthis sorts the result of a sruthi by, best supported first.
+def getSruthiRank(result):
+    return (-result["coverage"], -result["specificity"], -len(result["transitions"]))
+
+# Returns the results of evaluateSruthis that are as well supported as the best one.
+def getBestSruthis(results):
+    return [result for result in results if getSruthiRank(result) == getSruthiRank(results[0])]
+
+# Analyzes the given stream of frame blocks while it is being read, writing each transition to the given
+# OutputSink (stdout in summary mode by default) as soon as it is found, along with the candidate ragams left.
+# Returns the list of ragams that are still candidates at the end. If a vector of transition counts is given,
+# the transitions found are counted into it (see RagamDB.getTransitionCounts), to rank the ragams at the end.
+# The fundamental frequencies are found by the given pitch backend, or the batched FFT engine if there is none.
+def analyzeLive(blocks, samplerate, win_s, sruthi, ragamDB, diagnostics=None, output=None, counts=None, backend=None):
+    if output is None:
+        output = OutputSink()
+    output.beginLive()
+    ragas_that_meet_criteria = []
+    transitions = analyzeStream(blocks, samplerate, win_s, sruthi, diagnostics=diagnostics, output=output,
+                                backend=backend)
+    for transition, ragas_that_meet_criteria in narrowRagams(ragamDB, transitions):
+        output.writeCandidates(transition, ragas_that_meet_criteria, live=True)
+        if counts is not None:
+            counts[transition.code] += 1
+    return ragas_that_meet_criteria
+
 def main():
     
     if len(sys.argv) < 3:
-        print("Usage:   python3 RagamFinder.py audio_filename sruthi")
-        print("         audio_filename : The music file that contains ragam to be identified")
-        print("         sruthi         : The tonic pitch of the given audio file")
+        print("Usage:   python3 RagamFinder.py audio_filename sruthi [--stream] [--output=mode] [--diagnostics=dir]")
+        print("                [--top=k] [--cache=dir] [--profile=report.json] [--profile-hook=cprofile|sample]")
+        print("                [--samplerate=hz] [--decimate=n] [--window=n] [--hop=n] [--pitch=backend]")
+        print("                [--workers=n] [--cents=x] [--min-note=ms] [--phrases]")
+        print("         audio_filename : The music file that contains ragam to be identified, or - to read raw")
+        print("                          PCM audio (mono, 16-bit signed little-endian, at --samplerate) from stdin")
+        print("         sruthi         : The tonic pitch of the given audio file, or auto to try all twelve and")
+        print("                          report the best supported ones")
+        print("         --stream       : Report the candidate ragams while the audio is being analyzed")
+        print("                          (always on when reading from stdin)")
+        print("         --output       : quiet (only the ragam names), summary (the default), verbose (the swaras")
+        print("                          of every frame and the candidates after every transition as well), or")
+        print("                          json (one JSON object per line for every transition and the result)")
+        print("         --top          : The number of best scoring ragams to list (default: 10)")
+        print("         --cache        : Keep the fundamental frequencies of analyzed files in the given directory,")
+        print("                          so that analyzing a file again skips straight to despeckling")
+        print("         --diagnostics  : Save plots of the spectra and notes of the audio to the given directory")
+        print("         --profile      : Time every stage and count peaks, fundamentals, despeckle fallbacks and")
+        print("                          candidates, and save the report to the given JSON file")
+        print("         --profile-hook : Also run the analysis under cProfile (saving its stats next to the report")
+        print("                          as a .prof file) or a sampling profiler, adding the top functions to the report")
+        print("         --samplerate   : The sample rate the audio is decoded at (default: 44100)")
+        print("         --decimate     : Low-pass filter the audio and keep one sample in n before analyzing it, so")
+        print("                          that smaller windows give the same frequency resolution (default: 1)")
+        print("         --window       : The number of samples in every frame, after decimation (default: 4096)")
+        print("         --hop          : The number of samples between the starts of frames, after decimation")
+        print("                          (default: the window size, so that frames do not overlap)")
+        print("         --pitch        : The pitch estimator: fft (FFT peaks and harmonic sieve, the default), yin or")
+        print("                          yinfft (aubio's detectors), or autocorrelation")
+        print("         --workers      : Split the file into chunks and analyze them in n processes at once (default:")
+        print("                          1, or the number of CPUs if n is 0); not used with --stream")
+        print("         --cents        : Join frames whose pitches differ by up to x cents into one note (default: 0,")
+        print("                          only equal pitches); not used with --stream")
+        print("         --min-note     : The shortest note, in milliseconds (default: two frames); not used with")
+        print("                          --stream")
+        print("         --phrases      : Match the notes against the arohanam and avarohanam phrases of every ragam,")
+        print("                          ranking ragams that break fewer of them first; not used with --stream")
         print("Example: python3 RagamFinder.py kalyani.mp3 G")
         return
     # Parse arguments
     
     # Given filename
     file = sys.argv[1]
-    # Manually input sruthi
-    sruthi = str(sys.argv[2]) + "3"
+    # Manually input sruthi, or auto to find it
+    sruthi = None if sys.argv[2] == "auto" else str(sys.argv[2]) + "3"
     
-   
+    stream = file == "-" or "--stream" in sys.argv[3:]
+    phrases = "--phrases" in sys.argv[3:]
+    if sruthi is None and stream:
+        print("The sruthi must be given to analyze a stream")
+        return
+    outputMode = "summary"
+    top = 10
+    cache = None
+    diagnostics = None
+    profileReport = None
+    profileHook = None
+    frontEndOptions = {}
+    segmenterOptions = {}
+    pitchBackend = "fft"
+    workers = None
+    for arg in sys.argv[3:]:
+        if arg.startswith("--output="):
+            outputMode = arg[len("--output="):]
+        elif arg.startswith("--top="):
+            top = int(arg[len("--top="):])
+        elif arg.startswith("--cache="):
+            cache = FeatureCache(arg[len("--cache="):])
+        elif arg.startswith("--diagnostics="):
+            # Only import the plotting code when it is needed
+            from plotFuncs import Diagnostics
+            diagnostics = Diagnostics(arg[len("--diagnostics="):])
+        elif arg.startswith("--profile="):
+            profileReport = arg[len("--profile="):]
+        elif arg.startswith("--profile-hook="):
+            profileHook = arg[len("--profile-hook="):]
+        elif arg.startswith("--pitch="):
+            pitchBackend = arg[len("--pitch="):]
+        elif arg.startswith("--workers="):
+            workers = int(arg[len("--workers="):]) or cpu_count()
+        elif arg.split("=")[0] in ("--samplerate", "--decimate", "--window", "--hop"):
+            frontEndOptions[arg[2:].split("=")[0]] = arg.split("=", 1)[1]
+        elif arg.split("=")[0] in ("--cents", "--min-note"):
+            segmenterOptions[arg[2:].split("=")[0]] = arg.split("=", 1)[1]
+    if outputMode not in OUTPUT_MODES:
+        print("Unknown output mode %s: use one of %s" % (outputMode, ", ".join(OUTPUT_MODES)))
+        return
+    if pitchBackend not in PITCH_BACKENDS:
+        print("Unknown pitch backend %s: use one of %s" % (pitchBackend, ", ".join(PITCH_BACKENDS)))
+        return
+    if profileHook is not None and profileHook not in profileFuncs.PROFILE_HOOKS:
+        print("Unknown profiling hook %s: use one of %s" % (profileHook, ", ".join(profileFuncs.PROFILE_HOOKS)))
+        return
+    try:
+        frontEnd = getFrontEnd(frontEndOptions)
+        segmenter = getNoteSegmenter(segmenterOptions, frontEnd.hop_s / frontEnd.rate)
+    except ValueError as e:
+        print(e)
+        return
+    output = OutputSink(outputMode)
+    if profileReport is not None:
+        profileFuncs.enableProfiling()
+    else:
+        profileHook = None
     
-    print()
-    print("Beginning ragam analysis...")
-    print()
+    # In the quiet and json modes, only the output sink writes to stdout, and anything else printed goes to stderr
+    if outputMode in ("quiet", "json"):
+        with contextlib.redirect_stdout(sys.stderr):
+            runAnalysis(file, sruthi, stream, output, diagnostics, profileReport, profileHook, top, cache, frontEnd,
+                        pitchBackend, workers, segmenter, phrases)
+    else:
+        runAnalysis(file, sruthi, stream, output, diagnostics, profileReport, profileHook, top, cache, frontEnd,
+                    pitchBackend, workers, segmenter, phrases)
+
+# Runs the analysis of the given file (or stdin, for -) as set up by main, writing the results to the given
+# OutputSink, along with the top ragams by score (see RagamDB.rankRagams). Diagnostics plots and the profiling report are saved at the end, if they are turned on.
+# The audio is read into frames by the given FrontEnd, and their pitches found by the named pitch backend, in the
+# given number of worker processes for files that are not streamed, whose notes are found by the given NoteSegmenter
+# and matched against phrase rules if phrases is True (see writeRagamResults).
+def runAnalysis(file, sruthi, stream, output, diagnostics=None, profileReport=None, profileHook=None, top=10,
+                cache=None, frontEnd=None, pitchBackend="fft", workers=None, segmenter=None, phrases=False):
+    if frontEnd is None:
+        frontEnd = FrontEnd()
+    statsFilename = None if profileReport is None else os.path.splitext(profileReport)[0] + ".prof"
     
+    output.writeMessage("")
+    output.writeMessage("Beginning ragam analysis...")
+    output.writeMessage("")
     
-    filename = file[:file.index('.')]
-    transitions = processFile(file, sruthi)
+    if sruthi is None:
+        ragamDB = RagamDB("reference/ragam_list.txt")
+        results = profileFuncs.runWithHook(profileHook, processFileAllSruthis, (file, ragamDB), 
+                                           {"cache": cache, "frontEnd": frontEnd, "pitchBackend": pitchBackend,
+                                            "workers": workers, "segmenter": segmenter},
+                                           statsFilename)
+        output.writeSruthiResults(results, getBestSruthis(results))
+    elif stream:
+        # Initialize the Ragam Database first, so that candidates can be narrowed down as the audio is read
+        ragamDB = RagamDB("reference/ragam_list.txt")
+        if file == "-":
+            hops = frontEnd.readPcmHops(sys.stdin.buffer)
+        else:
+            hops = frontEnd.readSourceHops(frontEnd.openSource(file))
+        blocks = frontEnd.getFrameBlocks(hops, block_size=8)
+        counts = np.zeros(NUM_TRANSITION_CODES, dtype=np.int64)
+        ragas_that_meet_criteria = profileFuncs.runWithHook(profileHook, analyzeLive, 
+                                                           (blocks, frontEnd.rate, frontEnd.win_s, sruthi, ragamDB, 
+                                                            diagnostics, output, counts,
+                                                            getPitchBackend(pitchBackend, frontEnd.rate, frontEnd.win_s)),
+                                                           statsFilename=statsFilename)
+        if diagnostics is not None:
+            name = "stdin" if file == "-" else os.path.splitext(os.path.basename(file))[0]
+            for plotFile in diagnostics.save(name):
+                print("Saved diagnostics plot %s" % plotFile)
+        with stageTimer("ragam_ranking"):
+            ranking = ragamDB.rankRagams(counts, top)
+        output.writeResult(ragas_that_meet_criteria, None, ranking)
+    else:
+        transitions = profileFuncs.runWithHook(profileHook, processFile, (file, sruthi), 
+                                               {"diagnostics": diagnostics, "output": output, "cache": cache, 
+                                                "frontEnd": frontEnd, "pitchBackend": pitchBackend,
+                                                "workers": workers, "segmenter": segmenter}, 
+                                               statsFilename)
+        
+         # Initialize the Ragam Database
+        ragamDB = RagamDB("reference/ragam_list.txt")
+        writeRagamResults(ragamDB, transitions, output, top, phrases)
+    output.flush()
     
-     # Initialize the Ragam Database
-    ragamDB = RagamDB("reference/ragam_list.txt")
-    ragas_that_meet_criteria = []
-    print()
-    print("|=======================================|")
-    print("|         Transitions Discovered        |")
-    print("|=======================================|")
-    for transition in transitions:
-        print(" "*12 + str(transition))
-
-    print()
-    print()
-    for transition in transitions:
-        ragas_that_meet_criteria = ragamDB.getRagasWithTransition(ragas_that_meet_criteria, transition)
-        print(len(ragas_that_meet_criteria)) # for debugging 
-            
-    print()
-    print()
-    print("|================================================================|")
-    print("|                         Possible Ragas                         |")
-    print("|================================================================|")
-    for ragam in ragas_that_meet_criteria:
-        print("  " + str(ragam))
+    if profileReport is not None:
+        report = profileFuncs.disableProfiling().getReport()
+        profileFuncs.saveReport(report, profileReport)
+        profileFuncs.printReport(report)
+        print("Saved profiling report %s" % profileReport)
     
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
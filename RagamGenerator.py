@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+# This file generates synthetic recordings of ragams for testing the Ragam Finder (see synthFuncs): random phrases
+# of any ragam of the ragam list, sung at a given sruthi with harmonics, vibrato and gamakas over a tambura drone,
+# for any length of time, along with a CSV file of the notes that were sung. RagamBenchmark.py load uses them to
+# measure how the analysis scales with the length of a recording.
+
+import sys, os, io, time, contextlib
+from RagamDB import RagamDB, RagamNotFoundError, foldName
+from musicFuncs import PITCH_NAMES
+from synthFuncs import RagamSynthesizer, parseDuration
+
+# Returns the RagamSynthesizer for the given command line options (a dictionary of option names to values):
+# samplerate, harmonics, drone, noise, vibrato, gamaka, note-seconds and seed. Options that are not given keep
+# their defaults.
+def getSynthesizer(options):
+    return RagamSynthesizer(int(options.get("samplerate", 44100)), int(options.get("harmonics", 6)),
+                            float(options.get("drone", 0.1)), float(options.get("noise", 0.01)),
+                            float(options.get("vibrato", 15)), float(options.get("gamaka", 0.2)),
+                            float(options.get("note-seconds", 0.4)), int(options.get("seed", 0)))
+
+# Returns the ragam of the given RagamDB with the given name, ignoring case and diacritics (see
+# RagamDB.searchByName). Raises RagamNotFoundError, with the names that contain it or start like it, if there
+# is none.
+def getRagamByName(ragamDB, name):
+    try:
+        return ragamDB.searchByName(name)
+    except RagamNotFoundError:
+        folded = foldName(name)
+        similar = [other for other in ragamDB.names if folded in foldName(other)]
+        similar += [other for other in ragamDB.names
+                    if foldName(other).startswith(folded[:3]) and other not in similar]
+        raise RagamNotFoundError("No ragam is named %s%s" % (name, "; did you mean %s?" % ", ".join(similar[:5])
+                                                            if similar != [] else ""))
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    if len(args) < 4:
+        print("Usage:   python3 RagamGenerator.py ragam sruthi duration output.wav [--notes=notes.csv] [--seed=n]")
+        print("                                   [--samplerate=hz] [--harmonics=n] [--drone=level] [--noise=level]")
+        print("                                   [--vibrato=cents] [--gamaka=fraction] [--note-seconds=s]")
+        print("         ragam          : The name of a ragam in reference/ragam_list.txt")
+        print("         sruthi         : The tonic pitch to sing at (without octave)")
+        print("         duration       : The length of the recording, in seconds, or with m or h (such as 5m or 2h)")
+        print("         output.wav     : The WAV file to write (mono, 16-bit)")
+        print("         --notes        : Write the notes sung, with their start and end times, to this CSV file")
+        print("                          (default: output.csv, next to the WAV file)")
+        print("         --seed         : The seed of the random phrases, vibrato and noise (default: 0)")
+        print("         --samplerate   : The sample rate of the recording (default: 44100)")
+        print("         --harmonics    : The number of harmonics of every note (default: 6)")
+        print("         --drone        : The level of the tambura drone, relative to the voice (default: 0.1)")
+        print("         --noise        : The level of the white noise, relative to the voice (default: 0.01)")
+        print("         --vibrato      : The depth of the vibrato, in cents (default: 15)")
+        print("         --gamaka       : The fraction of every note spent gliding from the note before (default: 0.2)")
+        print("         --note-seconds : The mean length of a note, in seconds (default: 0.4)")
+        print("Example: python3 RagamGenerator.py Megha G 10m megha.wav")
+        return
+    name, sruthi, duration, output = args[:4]
+    if sruthi not in PITCH_NAMES:
+        print("Unknown sruthi %s: use one of %s" % (sruthi, ", ".join(PITCH_NAMES)))
+        return
+    try:
+        synthesizer = getSynthesizer(options)
+        seconds = parseDuration(duration)
+        with contextlib.redirect_stdout(io.StringIO()):
+            ragamDB = RagamDB("reference/ragam_list.txt")
+        ragam = getRagamByName(ragamDB, name)
+    except (ValueError, RagamNotFoundError) as e:
+        print(e)
+        return
+    notesFilename = options.get("notes", os.path.splitext(output)[0] + ".csv")
+    start = time.time()
+    notes = synthesizer.render(ragam, sruthi + "3", seconds, output, notesFilename)
+    print("Wrote %.0f seconds of %s at sruthi %s (%d notes) to %s in %.1f seconds, and its notes to %s" %
+          (seconds, ragam.name, sruthi, len(notes), output, time.time() - start, notesFilename))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+#! /usr/bin/env python
+# This file runs the Ragam Finder as a long-running local server, so that interactive tools do not pay for
+# starting Python, importing numpy, scipy and aubio and loading the ragam database every time they analyze a
+# recording. The server keeps a pool of worker processes that have all of these loaded (along with the front
+# ends and FFT plans of the settings they have seen), and accepts analysis jobs over a Unix domain socket.
+# Requests and responses are JSON objects, one per line. A job is a request such as
+#   {"id": "job1", "file": "/path/to/kalyani.mp3", "sruthi": "G", "options": {"window": 1024, "decimate": 4}}
+# where the sruthi can be auto to try all twelve, and the options are those of RagamFinder.py (samplerate,
+# decimate, window, hop, pitch, top, cents, min-note, and the flags phrases and stream, which are on for true, yes
+# or 1). Every job gets an "accepted" event as soon as it is read, then the events of RagamFinder.py's json output
+# (transition and result, or sruthis), or an "error" event, and finally a "done" event. The workers put events on
+# a queue shared with the server as soon as they write them, and the server sends them on as they arrive. With
+# stream, the audio is analyzed as RagamFinder.py --stream does, so every transition is sent as soon as it is
+# found, while the rest of the file is still being read. Every event has the id of its job, so a client can send
+# several jobs at once over one connection, and their events may come back interleaved. Jobs without an id are
+# numbered.
+# Each connection can only have a limited number of jobs whose results it has not read yet, and the server
+# only hands a limited number of jobs to the workers at once: past these, it stops reading new jobs until
+# some are done, so that clients sending jobs faster than they can be analyzed are slowed down.
+
+import sys, os, json, time, io, contextlib, asyncio, socket, itertools, functools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager, cpu_count
+
+DEFAULT_SOCKET = "/tmp/ragamfinder.sock"
+JOB_OPTIONS = ["samplerate", "decimate", "window", "hop", "pitch", "top", "cents", "min-note", "phrases", "stream"]
+
+# The RagamDB of a worker process, loaded once when the worker starts, its FeatureCache (or None), the FrontEnds
+# it has used, by their options, and the queue it puts the events of its jobs on.
+workerRagamDB = None
+workerCache = None
+workerFrontEnds = {}
+workerEvents = None
+
+# Initializes a worker process: imports the analysis code, loads the ragam database, opens the feature cache in
+# the given directory if there is one, and analyzes a frame of silence with the default settings so that the
+# FFT plans and lookup tables are ready for the first job. The events of its jobs are put on the given queue.
+def initWorker(ragamListFilename, cacheDirectory=None, events=None):
+    global workerRagamDB, workerCache, workerEvents
+    workerEvents = events
+    # Only import the analysis code in the workers, so that the server and clients start quickly
+    import numpy as np
+    from RagamDB import RagamDB
+    from cacheFuncs import FeatureCache
+    from pitchFuncs import getPitchBackend
+    with contextlib.redirect_stdout(io.StringIO()):
+        workerRagamDB = RagamDB(ragamListFilename)
+    if cacheDirectory is not None:
+        workerCache = FeatureCache(cacheDirectory)
+    frontEnd = getWorkerFrontEnd({})
+    getPitchBackend("fft", frontEnd.rate, frontEnd.win_s).getFrameFundamentals(np.zeros((1, frontEnd.win_s),
+                                                                                      dtype=np.float32))
+
+# Returns True if the given job option (a string from the command line, or any JSON value) turns a flag on.
+def isFlagOn(value):
+    return str(value).lower() in ("1", "true", "yes")
+
+# Returns the process id of the worker running it. Used to start all the workers up front.
+def pingWorker():
+    return os.getpid()
+
+# Returns the FrontEnd of a worker for the given job options (see audioFuncs.getFrontEnd), which is only made
+# the first time the options are seen.
+def getWorkerFrontEnd(options):
+    from audioFuncs import getFrontEnd
+    key = tuple(sorted((name, str(options[name])) for name in ("samplerate", "decimate", "window", "hop")
+                       if name in options))
+    if key not in workerFrontEnds:
+        workerFrontEnds[key] = getFrontEnd(dict(key))
+    return workerFrontEnds[key]
+
+# A text stream for the json output of a job in a worker process, which puts every event written to it on the
+# worker's event queue, along with the key of the job, as soon as the output is flushed.
+class EventStream:
+    def __init__(self, key):
+        self.key = key
+
+    def write(self, text):
+        for line in text.splitlines():
+            if line != "":
+                workerEvents.put((self.key, json.loads(line)))
+
+    def flush(self):
+        pass
+
+# Analyzes one job (see the top of this file) in a worker process, putting its events on the worker's event queue
+# as they are written, the last one being "done" with the time it took. Errors are reported as an "error" event
+# instead of being raised.
+def analyzeServerJob(job):
+    import numpy as np
+    from RagamFinder import processFile, processFileAllSruthis, getBestSruthis, writeRagamResults, analyzeLive
+    from RagamDB import NUM_TRANSITION_CODES
+    from outputFuncs import OutputSink
+    from musicFuncs import PITCH_NAMES
+    from pitchFuncs import PITCH_BACKENDS, getPitchBackend
+    from noteFuncs import getNoteSegmenter
+    start = time.time()
+    output = OutputSink("json", EventStream(job["key"]))
+    options = job["options"]
+    try:
+        pitchBackend = options.get("pitch", "fft")
+        if pitchBackend not in PITCH_BACKENDS:
+            raise ValueError("Unknown pitch backend %r: use one of %s" % (pitchBackend, ", ".join(PITCH_BACKENDS)))
+        if job["sruthi"] != "auto" and job["sruthi"] not in PITCH_NAMES:
+            raise ValueError("Unknown sruthi %r: use one of %s or auto" % (job["sruthi"], ", ".join(PITCH_NAMES)))
+        stream = isFlagOn(options.get("stream", False))
+        if stream and job["sruthi"] == "auto":
+            raise ValueError("The sruthi must be given to analyze a stream")
+        frontEnd = getWorkerFrontEnd(options)
+        segmenter = getNoteSegmenter(options, frontEnd.hop_s / frontEnd.rate)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if job["sruthi"] == "auto":
+                results = processFileAllSruthis(job["file"], workerRagamDB, cache=workerCache, frontEnd=frontEnd,
+                                                pitchBackend=pitchBackend, segmenter=segmenter)
+                output.writeSruthiResults(results, getBestSruthis(results))
+            elif stream:
+                blocks = frontEnd.getFrameBlocks(frontEnd.readSourceHops(frontEnd.openSource(job["file"])),
+                                                 block_size=8)
+                counts = np.zeros(NUM_TRANSITION_CODES, dtype=np.int64)
+                ragams = analyzeLive(blocks, frontEnd.rate, frontEnd.win_s, job["sruthi"] + "3", workerRagamDB,
+                                     output=output, counts=counts,
+                                     backend=getPitchBackend(pitchBackend, frontEnd.rate, frontEnd.win_s))
+                output.writeResult(ragams, None, workerRagamDB.rankRagams(counts, int(options.get("top", 10))))
+            else:
+                transitions = processFile(job["file"], job["sruthi"] + "3", cache=workerCache, frontEnd=frontEnd,
+                                          pitchBackend=pitchBackend, segmenter=segmenter)
+                writeRagamResults(workerRagamDB, transitions, output, int(options.get("top", 10)),
+                                  isFlagOn(options.get("phrases", False)))
+        output.flush()
+    except Exception as e:
+        workerEvents.put((job["key"], {"event": "error", "error": "%s: %s" % (type(e).__name__, e)}))
+    workerEvents.put((job["key"], {"event": "done", "seconds": round(time.time() - start, 3)}))
+
+# Puts an "error" and a "done" event on the given asyncio queue of a job's events if the given future of its
+# analysis failed, which only happens if the workers could not run it (such as when a worker process died), since
+# analyzeServerJob reports errors as events. start is the time the job was handed to the workers.
+def reportFailure(events, start, analysis):
+    if not analysis.cancelled() and analysis.exception() is not None:
+        error = analysis.exception()
+        events.put_nowait({"event": "error", "error": "%s: %s" % (type(error).__name__, error)})
+        events.put_nowait({"event": "done", "seconds": round(time.time() - start, 3)})
+
+# Returns the job in the given request line, with its id (or the given default id), file, sruthi and options.
+# Raises ValueError if it is not a valid job.
+def parseJob(line, defaultId):
+    try:
+        request = json.loads(line)
+    except ValueError:
+        raise ValueError("Requests must be JSON objects, one per line")
+    if not isinstance(request, dict) or not isinstance(request.get("file"), str) or \
+       not isinstance(request.get("sruthi"), str):
+        raise ValueError("A job needs a file and a sruthi")
+    options = request.get("options", {})
+    if not isinstance(options, dict) or any(name not in JOB_OPTIONS for name in options):
+        raise ValueError("The options of a job can only be %s" % ", ".join(JOB_OPTIONS))
+    return {"id": request.get("id", defaultId), "file": request["file"], "sruthi": request["sruthi"],
+            "options": options}
+
+# The analysis server, listening on the Unix domain socket at the given path, with the given number of worker
+# processes (one per core by default). The workers are given at most maxQueued jobs at once (twice the number of
+# workers by default), and each connection can have at most maxPending jobs whose events have not been sent yet.
+class RagamServer:
+    def __init__(self, socketPath=DEFAULT_SOCKET, workers=None, maxQueued=None, maxPending=16,
+                 ragamListFilename="reference/ragam_list.txt", cacheDirectory=None):
+        self.socketPath = socketPath
+        self.workers = workers or cpu_count()
+        self.maxQueued = maxQueued or 2 * self.workers
+        self.maxPending = maxPending
+        self.ragamListFilename = ragamListFilename
+        self.cacheDirectory = cacheDirectory
+
+    # Starts the workers and serves connections until the server is interrupted. The events that the workers put
+    # on their shared queue are read by a thread (see dispatchEvents) and handed to the jobs they belong to.
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.queued = asyncio.Semaphore(self.maxQueued)
+        self.jobKeys = itertools.count()
+        self.jobEvents = {}
+        with Manager() as manager:
+            self.events = manager.Queue()
+            dispatcher = loop.run_in_executor(None, self.dispatchEvents, loop)
+            try:
+                with ProcessPoolExecutor(self.workers, initializer=initWorker,
+                                         initargs=(self.ragamListFilename, self.cacheDirectory, self.events)) \
+                     as self.executor:
+                    start = time.time()
+                    await asyncio.gather(*[loop.run_in_executor(self.executor, pingWorker)
+                                           for i in range(self.workers)])
+                    print("Started %d workers in %.1f seconds" % (self.workers, time.time() - start), flush=True)
+                    server = await asyncio.start_unix_server(self.handleConnection, self.socketPath)
+                    print("Listening on %s" % self.socketPath, flush=True)
+                    try:
+                        async with server:
+                            await server.serve_forever()
+                    finally:
+                        if os.path.exists(self.socketPath):
+                            os.remove(self.socketPath)
+            finally:
+                self.events.put(None)
+                await dispatcher
+
+    # Reads the (job key, event) pairs that the workers put on the event queue, in a thread of its own, and hands
+    # every event to the job it belongs to on the given event loop, until it reads None.
+    def dispatchEvents(self, loop):
+        while True:
+            item = self.events.get()
+            if item is None:
+                return
+            loop.call_soon_threadsafe(self.routeEvent, *item)
+
+    # Queues an event for the running job with the given key (see runJob).
+    def routeEvent(self, key, event):
+        if key in self.jobEvents:
+            self.jobEvents[key].put_nowait(event)
+
+    # Reads the jobs sent over a connection and runs them, until the client stops sending. Before reading each
+    # job, waits until the connection has fewer than maxPending jobs and the workers have fewer than maxQueued.
+    async def handleConnection(self, reader, writer):
+        pending = asyncio.Semaphore(self.maxPending)
+        lock = asyncio.Lock()
+        tasks = set()
+        numJobs = 0
+        try:
+            while True:
+                await pending.acquire()
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip() == b"":
+                    pending.release()
+                    continue
+                numJobs += 1
+                try:
+                    job = parseJob(line, numJobs)
+                except ValueError as e:
+                    await self.send(writer, lock, [{"event": "error", "error": str(e)}])
+                    pending.release()
+                    continue
+                job["key"] = next(self.jobKeys)
+                await self.queued.acquire()
+                task = asyncio.ensure_future(self.runJob(job, writer, lock, pending))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError) as e:
+            # ValueError: a request line longer than the reader's limit
+            print("Connection closed: %s" % e, flush=True)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    # Runs a job on the workers and sends its events back to the client as they arrive, until the "done" event.
+    async def runJob(self, job, writer, lock, pending):
+        events = self.jobEvents[job["key"]] = asyncio.Queue()
+        try:
+            await self.send(writer, lock, [{"id": job["id"], "event": "accepted"}])
+            loop = asyncio.get_running_loop()
+            try:
+                analysis = loop.run_in_executor(self.executor, analyzeServerJob, job)
+            except Exception as e:
+                # such as when a worker died earlier, which breaks the pool
+                analysis = loop.create_future()
+                analysis.set_exception(e)
+            analysis.add_done_callback(lambda analysis: self.queued.release())
+            analysis.add_done_callback(functools.partial(reportFailure, events, time.time()))
+            status = "done"
+            while True:
+                event = await events.get()
+                await self.send(writer, lock, [dict({"id": job["id"]}, **event)])
+                if event["event"] == "error":
+                    status = event["error"]
+                elif event["event"] == "done":
+                    break
+            print("%s (%s): %s in %.1f seconds" % (job["file"], job["sruthi"], status, event["seconds"]), flush=True)
+        finally:
+            del self.jobEvents[job["key"]]
+            pending.release()
+
+    # Writes the given events to a client, one JSON object per line, and waits until they can be sent. A
+    # client that disconnected is ignored.
+    async def send(self, writer, lock, events):
+        async with lock:
+            if writer.is_closing():
+                return
+            writer.write("".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode("utf-8"))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+# Sends the given job to the server listening on the given socket, and yields its events as they come back,
+# until it is done.
+def submitJob(job, socketPath=DEFAULT_SOCKET):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socketPath)
+        client.sendall((json.dumps(job) + "\n").encode("utf-8"))
+        with client.makefile("r", encoding="utf-8") as responses:
+            for line in responses:
+                event = json.loads(line)
+                yield event
+                if event["event"] == "done" or event.get("id") is None:
+                    return
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    # flags given without a value, such as --phrases, are on
+    options.update((arg[2:], "true") for arg in sys.argv[1:] if arg.startswith("--") and "=" not in arg)
+    socketPath = options.pop("socket", DEFAULT_SOCKET)
+    if args[:1] == ["serve"]:
+        server = RagamServer(socketPath, int(options.get("workers", 0)), int(options.get("queue", 0)),
+                             cacheDirectory=options.get("cache"))
+        try:
+            asyncio.run(server.serve())
+        except KeyboardInterrupt:
+            pass
+    elif args[:1] == ["submit"] and len(args) == 3:
+        job = {"file": os.path.abspath(args[1]), "sruthi": args[2],
+               "options": {name: value for name, value in options.items() if name in JOB_OPTIONS}}
+        for event in submitJob(job, socketPath):
+            print(json.dumps(event, ensure_ascii=False))
+    else:
+        print("Usage:   python3 RagamServer.py serve [--socket=path] [--workers=n] [--queue=n] [--cache=dir]")
+        print("         python3 RagamServer.py submit audio_filename sruthi [--socket=path] [--window=n] ...")
+        print("         serve     : Run the analysis server until it is interrupted")
+        print("         submit    : Send a job to the server and print its events as JSON lines. The sruthi can")
+        print("                     be auto, and the options of RagamFinder.py (--samplerate, --decimate, --window,")
+        print("                     --hop, --pitch, --top, --cents, --min-note, --phrases and --stream) are passed on")
+        print("         --socket  : The path of the server's Unix domain socket (default: %s)" % DEFAULT_SOCKET)
+        print("         --workers : The number of worker processes (default: one per core)")
+        print("         --queue   : The number of jobs given to the workers at once (default: twice the workers)")
+        print("         --cache   : Keep the fundamental frequencies of analyzed files in the given directory")
+        print("Example: python3 RagamServer.py submit kalyani.mp3 G")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# This file holds the columnar store of the pitches found in every frame, which is what the front end hands to
+# the rest of the analysis. Rather than a Python list of floats per frame (over a hundred bytes each), a
+# RaggedArray holds the pitches of all its frames in one flat float32 array, along with the offset of every
+# frame's pitches in it and optional columns with a value per frame (such as the confidence of the pitch
+# backend). Pitches are FFT bin frequencies or exact pitches (see pitchFuncs), which float32 holds to well under
+# a cent.
+# Slicing a RaggedArray gives a view of the same arrays, and RaggedArrays can be concatenated, saved and loaded
+# without going through Python lists.
+
+import itertools
+import numpy as np
+
+# The number of rows whose values are converted to Python floats at once when iterating over a RaggedArray.
+ITERATION_CHUNK = 4096
+
+# A list of lists of numbers, stored as one flat array of all the values and an array of offsets: row i is
+# values[offsets[i]:offsets[i + 1]]. Rows are returned as lists of Python floats, like the lists of fundamental
+# frequencies that musicFuncs.getFrameFundamentals returns. columns is a dictionary of arrays with one value per row.
+class RaggedArray:
+    def __init__(self, offsets, values, columns=None):
+        self.offsets = offsets
+        self.values = values
+        self.columns = columns if columns is not None else {}
+
+    # Returns a RaggedArray holding the given list of rows, with values of the given type, and the given columns.
+    @staticmethod
+    def fromRows(rows, dtype=np.float32, columns=None):
+        lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        values = np.fromiter(itertools.chain.from_iterable(rows), dtype=dtype, count=int(lengths.sum()))
+        return RaggedArray.fromLengths(lengths, values, columns)
+
+    # Returns a RaggedArray with the given number of values in each row, taken in order from the given values.
+    @staticmethod
+    def fromLengths(lengths, values, columns=None):
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return RaggedArray(offsets, values, columns)
+
+    # Returns a RaggedArray holding the rows of all the given RaggedArrays, one after the other. Only the columns
+    # that all of them have are kept.
+    @staticmethod
+    def concatenate(arrays):
+        arrays = list(arrays)
+        if arrays == []:
+            return RaggedArray(np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        names = set.intersection(*[set(ragged.columns) for ragged in arrays])
+        return RaggedArray.fromLengths(np.concatenate([ragged.getLengths() for ragged in arrays]),
+                                       np.concatenate([ragged.getValues() for ragged in arrays]),
+                                       {name: np.concatenate([ragged.columns[name] for ragged in arrays])
+                                        for name in sorted(names)})
+
+    # Returns a RaggedArray saved by save.
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as data:
+            return RaggedArray(data["offsets"], data["values"],
+                               {name[len("column_"):]: data[name] for name in data.files if name.startswith("column_")})
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Returns row i as a list (counting from the end if i is negative, as for lists), or a RaggedArray viewing the
+    # given slice of rows.
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                raise ValueError("RaggedArrays can only be sliced with a step of 1")
+            stop = max(start, stop)
+            return RaggedArray(self.offsets[start:stop + 1], self.values,
+                               {name: column[start:stop] for name, column in self.columns.items()})
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("RaggedArray index out of range")
+        return self.values[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+    # Yields every row as a list. The values are turned into Python floats ITERATION_CHUNK rows at a time, which
+    # is much faster than converting every row on its own.
+    def __iter__(self):
+        offsets = self.offsets
+        for start in range(0, len(self), ITERATION_CHUNK):
+            rowOffsets = offsets[start:start + ITERATION_CHUNK + 1].tolist()
+            first = rowOffsets[0]
+            values = self.values[first:rowOffsets[-1]].tolist()
+            for i in range(len(rowOffsets) - 1):
+                yield values[rowOffsets[i] - first:rowOffsets[i + 1] - first]
+
+    # Returns the number of values in each row.
+    def getLengths(self):
+        return np.diff(self.offsets)
+
+    # Returns the values of the rows, in order (a view of the values that the rows of a slice use).
+    def getValues(self):
+        return self.values[self.offsets[0]:self.offsets[-1]]
+
+    # Returns a copy of the RaggedArray that holds nothing but its own rows, with offsets starting from 0.
+    def compact(self):
+        return RaggedArray(self.offsets - self.offsets[0], np.array(self.getValues()),
+                           {name: np.array(column) for name, column in self.columns.items()})
+
+    # Saves the RaggedArray, with its columns, to the given .npz file.
+    def save(self, filename):
+        compact = self.compact()
+        np.savez(filename, offsets=compact.offsets, values=compact.values,
+                 **{"column_" + name: column for name, column in compact.columns.items()})
@@ -0,0 +1,141 @@
+# This file holds the front end of the Ragam Finder, which turns decoded audio into the frames that are analyzed.
+# The audio is read in hops, optionally low-pass filtered and decimated to a lower analysis sample rate, and
+# every hop moves a window of win_s samples (at the analysis rate) forward, giving one frame. The fundamental
+# frequencies of Carnatic vocals are well under 2 kHz, so decimating by 4 (to 11025 Hz) keeps them all while
+# making the FFT of every frame 4 times smaller for the same frequency resolution.
+
+from aubio import source
+import numpy as np
+from scipy.signal import firwin
+from musicFuncs import getSpectrumParameters, getOvertoneTolerance
+
+# The analysis settings of a recording: the sample rate audio is decoded at, the decimation factor, and the
+# window and hop sizes in samples at the analysis rate (samplerate / decimation). A last, partial hop is only
+# analyzed (zero-padded) if it has at least minRead samples at the decoding rate (or is a full hop, if hops are
+# shorter than that).
+# The defaults are the original settings of the Ragam Finder, whose frames do not overlap: each one is a
+# new block of 4096 samples, read until a block has less than 512 samples.
+class FrontEnd:
+    def __init__(self, samplerate=44100, win_s=4096, hop_s=None, decimation=1, minRead=512):
+        if hop_s is None:
+            hop_s = win_s
+        if decimation < 1 or not 1 <= hop_s <= win_s:
+            raise ValueError("The decimation must be at least 1 and the hop size between 1 and the window size")
+        self.samplerate = samplerate
+        self.decimation = decimation
+        self.win_s = win_s
+        self.hop_s = hop_s
+        self.rate = samplerate // decimation if samplerate % decimation == 0 else samplerate / decimation
+        # the number of samples read for every hop, at the decoding rate
+        self.inputHop = hop_s * decimation
+        # a hop of fewer than minRead samples would never be analyzed, so a full hop is always enough
+        self.minRead = min(minRead, self.inputHop)
+        self.nfft = getSpectrumParameters(self.rate, win_s)[0]
+        # the anti-aliasing filter, a Hamming windowed FIR filter cutting off at the new Nyquist frequency. It is
+        # shorter than the one scipy.signal.decimate uses, since only the band of the fundamentals (far below the
+        # cutoff) has to be kept clean, and filtering is most of the cost of decimating. Its length minus one is a
+        # multiple of the decimation (see decimate).
+        self.filter = firwin(8 * decimation + 1, 1.0 / decimation) if decimation > 1 else None
+        # the polyphase components of the filter: phase p holds taps p, p + decimation, p + 2*decimation...
+        self.phases = [] if self.filter is None else [self.filter[p::decimation] for p in range(decimation)]
+
+    # Returns the settings as a dictionary, to be saved with results or used as a FeatureCache key.
+    def getParameters(self):
+        return {"samplerate": self.samplerate, "decimation": self.decimation, "win_s": self.win_s,
+                "hop_s": self.hop_s, "min_read": self.minRead}
+
+    # Returns the tolerance used to decide whether a pitch is an overtone of another (see musicFuncs.checkIfOvertone).
+    def getOvertoneTolerance(self):
+        return getOvertoneTolerance(self.rate, self.nfft)
+
+    # Returns the number of hops that have to be read before a frame for it to be the same as when the audio is
+    # read from the start: enough for the part of the window overlapping earlier frames, and for the history
+    # of the decimation filter.
+    def getWarmupHops(self):
+        warmupHops = -(-(self.win_s - self.hop_s) // self.hop_s)
+        if self.filter is not None:
+            warmupHops += -(-(len(self.filter) - 1) // self.inputHop)
+        return warmupHops
+
+    # Opens the given audio file as an aubio source reading a hop at a time at the decoding rate.
+    def openSource(self, filename):
+        return source(filename, self.samplerate, self.inputHop)
+
+    # Generator that yields the hops of samples read from the given aubio source (see openSource). aubio reuses
+    # the same buffer for every read, so each hop has to be used (or copied) before the next one is read.
+    def readSourceHops(self, s):
+        while True:
+            samples, read = s()
+            if read < self.minRead:
+                return
+            yield samples
+
+    # Generator that reads raw PCM audio (mono, 16-bit signed little-endian samples at the decoding rate) from a
+    # binary stream such as stdin, and yields its hops of samples. A last, partial hop is zero-padded.
+    def readPcmHops(self, stream):
+        while True:
+            data = b""
+            # reads from pipes can return fewer bytes than asked for, so keep reading until a hop is full
+            while len(data) < 2*self.inputHop:
+                chunk = stream.read(2*self.inputHop - len(data))
+                if not chunk:
+                    break
+                data += chunk
+            samples = np.frombuffer(data[:len(data) - len(data) % 2], dtype='<i2')
+            if len(samples) < self.minRead:
+                return
+            hop = np.zeros(self.inputHop, dtype=np.float32)
+            hop[:len(samples)] = samples / 32768.0
+            yield hop
+            if len(samples) < self.inputHop:
+                return
+
+    # Generator that takes hops of samples (see readSourceHops and readPcmHops) and yields the frames of win_s
+    # samples they make, in 2-D arrays of up to block_size frames (one frame per row). The first frames of
+    # overlapping windows are zero-padded on the left until enough hops have been read.
+    def getFrameBlocks(self, hops, block_size=256):
+        samples = np.zeros((block_size, self.inputHop), dtype=np.float32)
+        # the end of the last frame that the next frame overlaps, and the history of the decimation filter
+        tail = np.zeros(self.win_s - self.hop_s, dtype=np.float32)
+        history = np.zeros(0 if self.filter is None else len(self.filter) - 1, dtype=np.float32)
+        numHops = 0
+        for hop in hops:
+            samples[numHops] = hop
+            numHops += 1
+            if numHops == block_size:
+                frames, tail, history = self.getFrames(samples, tail, history)
+                yield frames
+                numHops = 0
+        if numHops > 0:
+            yield self.getFrames(samples[:numHops], tail, history)[0]
+
+    # Takes a 2-D array of hops (one per row) at the decoding rate, along with the tail and filter history left
+    # by the hops before them, and returns the frames they make along with the new tail and history. All the
+    # hops are decimated at once, and frames are cut out of the decimated samples with a strided view.
+    def getFrames(self, samples, tail, history):
+        samples = samples.ravel()
+        if self.filter is not None:
+            samples, history = self.decimate(samples, history)
+        samples = np.concatenate((tail, samples))
+        frames = np.lib.stride_tricks.sliding_window_view(samples, self.win_s)[::self.hop_s].copy()
+        return frames, samples[len(samples) - len(tail):], history
+
+    # Low-pass filters and decimates the given samples, given the history of the samples before them (the last
+    # len(self.filter) - 1 samples at the decoding rate, zeros at the start). Returns the decimated samples and
+    # the history for the next ones. Only the filter outputs that are kept are computed: each polyphase component
+    # of the filter is convolved with the samples it multiplies, which are one in every decimation samples.
+    def decimate(self, samples, history):
+        extended = np.concatenate((history, samples))
+        numOutputs = len(samples) // self.decimation
+        decimated = np.zeros(numOutputs)
+        for p, taps in enumerate(self.phases):
+            phaseSamples = extended[(len(history) - p) % self.decimation::self.decimation]
+            decimated += np.convolve(phaseSamples, taps, 'valid')[:numOutputs]
+        return decimated.astype(np.float32), extended[len(extended) - len(history):]
+
+# Returns the FrontEnd for the given command line options (a dictionary of option names to values): samplerate,
+# window, hop and decimate. Options that are not given keep their defaults; the hop is the window size by default.
+def getFrontEnd(options):
+    win_s = int(options.get("window", 4096))
+    return FrontEnd(int(options.get("samplerate", 44100)), win_s, int(options.get("hop", win_s)),
+                    int(options.get("decimate", 1)))
@@ -0,0 +1,90 @@
+# This file holds the on-disk cache of the fundamental frequencies found in every frame of an audio file, which
+# is the slowest part of the analysis to compute (decoding, FFTs and fundamental frequency detection) and does
+# not depend on the sruthi, the despeckling or the ragam list. Entries are keyed by a hash of the contents of
+# the audio file and of the analysis parameters, and are stored as ragged arrays that are memory-mapped when
+# read. The cache has a maximum size, and the least recently used entries are removed to stay under it.
+
+import os, hashlib, json
+import numpy as np
+from arrayFuncs import RaggedArray
+
+# Version of the cached features. It is part of every key, so it must be changed whenever a change to the
+# analysis changes the fundamental frequencies found, to stop old entries from being used.
+FEATURE_VERSION = 3
+
+# The cache of per-frame fundamental frequencies, in the given directory, holding at most maxBytes of entries.
+# Each entry is a pair of .npy files: <key>.values.npy and <key>.offsets.npy (see RaggedArray). The offsets
+# are written last, so an entry is only complete once its offsets file exists. The last time an entry was
+# used is the modification time of its offsets file.
+class FeatureCache:
+    def __init__(self, directory, maxBytes=512*1024*1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory, exist_ok=True)
+
+    # Returns the key of the features of the given audio file analyzed with the given parameters (such as the
+    # samplerate, window and hop sizes): the SHA-256 hash of the file's contents, the parameters and FEATURE_VERSION.
+    @staticmethod
+    def getKey(filename, **parameters):
+        h = hashlib.sha256()
+        h.update(json.dumps(dict(parameters, version=FEATURE_VERSION), sort_keys=True).encode("utf-8"))
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def getFilenames(self, key):
+        return (os.path.join(self.directory, key + ".offsets.npy"), os.path.join(self.directory, key + ".values.npy"))
+
+    # Returns the cached features with the given key as a memory-mapped RaggedArray, or None if they are not in
+    # the cache (or cannot be read).
+    def load(self, key):
+        offsetsFilename, valuesFilename = self.getFilenames(key)
+        try:
+            offsets = np.load(offsetsFilename, mmap_mode='r')
+            values = np.load(valuesFilename, mmap_mode='r')
+            os.utime(offsetsFilename)
+        except (OSError, ValueError):
+            return None
+        return RaggedArray(offsets, values)
+
+    # Saves the given RaggedArray of features (without its columns) with the given key, and then removes the least
+    # recently used entries if the cache is over its maximum size. Each file is replaced atomically, so concurrent
+    # readers never see a partial entry. Failing to write the entry is not an error.
+    def save(self, key, features):
+        offsetsFilename, valuesFilename = self.getFilenames(key)
+        features = features.compact()
+        try:
+            for filename, data in ((valuesFilename, features.values), (offsetsFilename, features.offsets)):
+                tempFilename = "%s.%d.tmp" % (filename, os.getpid())
+                with open(tempFilename, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(data))
+                os.replace(tempFilename, filename)
+        except OSError:
+            return
+        self.evict()
+
+    # Removes the least recently used entries until the cache is no larger than its maximum size.
+    def evict(self):
+        entries = []
+        totalBytes = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".offsets.npy"):
+                continue
+            offsetsFilename, valuesFilename = self.getFilenames(name[:-len(".offsets.npy")])
+            try:
+                lastUsed = os.path.getmtime(offsetsFilename)
+                size = os.path.getsize(offsetsFilename) + os.path.getsize(valuesFilename)
+            except OSError:
+                continue
+            entries.append((lastUsed, size, offsetsFilename, valuesFilename))
+            totalBytes += size
+        for lastUsed, size, offsetsFilename, valuesFilename in sorted(entries):
+            if totalBytes <= self.maxBytes:
+                break
+            for filename in (offsetsFilename, valuesFilename):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+            totalBytes -= size
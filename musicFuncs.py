@@ -3,15 +3,19 @@
 # to notes. These utility functions are used for fundamental frequency analysis and note extraction.
 
 from math import log2, pow
+from functools import lru_cache
+from collections import Counter, deque
+from bisect import insort, bisect_left
 import numpy as np
 from RagamDB import *
 import peakutils, os
+from profileFuncs import stageTimer, observeValues
 from numpy import array, ma
-import matplotlib.pyplot as plt
 
 
 # Returns the number of steps between a start pitch and end pitch.
 # The number of steps is positive if the end pitch is higher than the starting pitch. Negative if otherwise. 0 if the same frequency.
+# This is the reference string implementation; getStepsFromSruthi does the same on semitone numbers.
 def getNumSteps(start, end):
     startPitch = start[:len(start) - 1]
     startClass = int(start[len(start)-1:])
@@ -39,51 +43,13 @@ def getNumSteps(start, end):
     return steps
 
 # Given a number of steps, assuming numSteps = 0 represents S, return the corresponding note.
-# Assume numSteps will always be an integer from 0-11.
+# Steps of 12 or more are in the upper octave, and steps of -12 or less are in the lower octave.
+# The returned Note is one of the shared instances in SWARA_NOTES, so it must not be modified.
 def convertPitchFromSteps(numSteps):
-    octave = 1
-    if numSteps >= 12:
-        octave = 2
-    elif numSteps <= -12:
-        octave = 0
-    numSteps %= 12
-    if numSteps == 0:
-        return Note(note="S", octave=octave)
-    elif abs(numSteps) == 12:
-        if numSteps == 12:
-            return Note(note="S", octave=octave)
-        else:
-            return Note(note="S", octave=octave)
-    elif abs(numSteps) == 1 or abs(numSteps) == 11:
-        if numSteps == -1 or numSteps == 11:
-            return Note(note="N", noteclass=3, octave=octave)
-        else:
-            return Note(note="R", noteclass=1, octave=octave)
-    elif abs(numSteps) == 2 or abs(numSteps) == 10:
-        if numSteps == -2 or numSteps == 10:
-            return Note(note="DN", noteclass=2, octave=octave)
-        else:
-            return Note(note="RG", noteclass=1, octave=octave)
-    elif abs(numSteps) == 3 or abs(numSteps) == 9:
-        if numSteps == -3 or numSteps == 9:
-            return Note(note="DN", noteclass=1, octave=octave)
-        else:
-            return Note(note="RG", noteclass=2, octave=octave)
-    elif abs(numSteps) == 4 or abs(numSteps) == 8:
-        if numSteps == -4 or numSteps == 8:
-            return Note(note="D", noteclass=1, octave=octave)
-        else:
-            return Note(note="G", noteclass=3, octave=octave)
-    elif abs(numSteps) == 5 or abs(numSteps) == 7:
-        if numSteps == -5 or numSteps == 7:
-            return Note(note="P", octave=octave)
-        else:
-            return Note(note="M", noteclass=1, octave=octave)
-    elif abs(numSteps) == 6:
-            return Note(note="M", noteclass=2, octave=octave)
-    return []
+    return SWARA_NOTES[getSwaraIndexes(numSteps)]
     
-# Converts a frequency to a pitch. 
+# Converts a frequency to a pitch. Pitch strings are only used for display; the analysis itself works
+# on semitone numbers (see freqToSemitones).
 def freqToPitch(freq):
     A4 = 440
     C0 = A4*pow(2, -4.75)
@@ -93,20 +59,108 @@ def freqToPitch(freq):
     n = h % 12
     return name[n] + str(octave)
 
+# The names of the twelve pitches of an octave, and the frequency of C0 that freqToPitch measures from.
+PITCH_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+C0 = 440*pow(2, -4.75)
+
+# Interned Notes for every swara (see RagamDB.SWARA_NAMES) in octaves 0, 1 and 2. A swara index is octave*12 + step, and indexes
+# this list. These instances are shared, so they must never be modified.
+SWARA_NOTES = np.empty(36, dtype=object)
+SWARA_NOTES[:] = [Note(note=note, noteclass=noteclass, octave=octave) 
+                  for octave in range(3) for note, noteclass in SWARA_NAMES]
+# The Note codes (see Note) of SWARA_NOTES.
+SWARA_CODES = np.array([note.code for note in SWARA_NOTES])
+
+# Converts a frequency, or an array of frequencies, to semitone numbers counted from C0, rounding to the
+# nearest semitone exactly like freqToPitch does. So a semitone number h is the pitch 
+# PITCH_NAMES[h % 12] + str(h // 12).
+def freqToSemitones(freqs):
+    if np.ndim(freqs) == 0:
+        return round(12*log2(freqs/C0))
+    with np.errstate(divide='ignore'):
+        semitones = 12*np.log2(np.asarray(freqs, dtype=float)/C0)
+    # frequencies of 0 Hz have no pitch; they map far below any real note
+    return np.rint(np.where(np.isfinite(semitones), semitones, -1000)).astype(int)
+
+# Converts a frequency, or an array of frequencies, to cents counted from C0, without rounding: a hundredth of
+# the semitone numbers of freqToSemitones.
+def freqToCents(freqs):
+    return 1200*np.log2(np.asarray(freqs, dtype=float)/C0)
+
+# Converts cents counted from C0 (see freqToCents) back to frequencies.
+def centsToFreq(cents):
+    return C0*np.exp2(np.asarray(cents, dtype=float)/1200)
+
+# Converts a pitch string such as "C#3" to its semitone number.
+def pitchToSemitones(pitch):
+    i = len(pitch.rstrip("-0123456789"))
+    return 12*int(pitch[i:]) + PITCH_NAMES.index(pitch[:i])
+
+# Returns the number of steps from the sruthi to the given semitone number(s), as getNumSteps does for
+# pitch strings. Like getNumSteps, a pitch in the same octave as the sruthi is always counted upwards from it.
+def getStepsFromSruthi(semitones, sruthiSemitones):
+    steps = np.subtract(semitones, sruthiSemitones)
+    sameOctave = np.floor_divide(semitones, 12) == sruthiSemitones // 12
+    steps = np.where(sameOctave, np.abs(steps), steps)
+    return int(steps) if steps.ndim == 0 else steps
+
+# Returns the swara index (see SWARA_NOTES) for the given number(s) of steps from S.
+def getSwaraIndexes(numSteps):
+    octave = np.where(np.greater_equal(numSteps, 12), 2, np.where(np.less_equal(numSteps, -12), 0, 1))
+    swaraIndexes = 12*octave + np.mod(numSteps, 12)
+    return int(swaraIndexes) if swaraIndexes.ndim == 0 else swaraIndexes
+
+# Returns the swara indexes of the given semitone numbers for every one of the given sruthi semitone numbers,
+# as a matrix with one row per sruthi.
+def getSwaraIndexesForSruthis(semitones, sruthiSemitones):
+    steps = getStepsFromSruthi(np.asarray(semitones)[np.newaxis, :], np.asarray(sruthiSemitones)[:, np.newaxis])
+    return getSwaraIndexes(steps)
+
+# Vectorized conversion of an array of frequencies to swara indexes for the given sruthi pitch.
+def freqsToSwaraIndexes(freqs, sruthi):
+    return getSwaraIndexes(getStepsFromSruthi(freqToSemitones(np.asarray(freqs, dtype=float)), pitchToSemitones(sruthi)))
+
+# Looks up the swaras of frequencies for a sruthi: every frequency is rounded to its semitone number (see
+# freqToSemitones), whether it is that of an FFT bin or an exact pitch, and counted in steps from the sruthi.
+class SwaraTable:
+    def __init__(self, sruthi):
+        self.sruthi = sruthi
+        self.sruthiSemitones = pitchToSemitones(sruthi)
+
+    # Returns the swara index (see SWARA_NOTES) of the given frequency, or the array of those of the given frequencies.
+    def getSwaraIndexes(self, freqs):
+        return getSwaraIndexes(getStepsFromSruthi(freqToSemitones(freqs), self.sruthiSemitones))
+
+    # Returns the list of swaras (Notes) of the given frequencies.
+    def getSwaras(self, freqs):
+        return list(SWARA_NOTES[self.getSwaraIndexes(freqs)])
+
+# Returns the SwaraTable for the given sruthi, building it the first time it is needed.
+@lru_cache(maxsize=64)
+def getSwaraTable(sruthi):
+    return SwaraTable(sruthi)
+
+# Returns the smallest tolerance, in Hz, used to decide whether a pitch is an overtone of another when the
+# spectrum has nfft bins at the given sample rate. This was 10 Hz at 44100 Hz with 4096-point FFTs, just under
+# the spacing of the bins, and scales with that spacing.
+def getOvertoneTolerance(rate, nfft):
+    return 10 * rate * 4096 / (44100 * nfft)
+
 # Takes two pitch frequencies, and determines if the second is an overtone (an integer multiple of the first)
-# Returns True if pitchB is an overtone of pitchA
-def checkIfOvertone(pitchA, pitchB):
+# Returns True if pitchB is an overtone of pitchA. tolerance is the smallest difference in Hz allowed between
+# pitchB and a harmonic of pitchA (see getOvertoneTolerance).
+def checkIfOvertone(pitchA, pitchB, tolerance=10):
     epsilon = 0.03*pitchB # arbitrary value that scales with the pitches so that values are caught about halfway between other pitch frequencies
     for harmonic in range(2, 21): # checking 20 harmonics
         theoreticalOvertoneValue = harmonic*pitchA
         if theoreticalOvertoneValue > 2*pitchB:
             return False
-        if epsilon >= 10:
+        if epsilon >= tolerance:
             if theoreticalOvertoneValue <= pitchB + epsilon and theoreticalOvertoneValue >= pitchB-epsilon:
                 return True
         else:
-            # frequency resolution is 10 Hz; if epsilon is less than this, then just check at a minimum of 10 hz range
-            if theoreticalOvertoneValue <= pitchB + 10 and theoreticalOvertoneValue >= pitchB-10:
+            # if epsilon is less than the frequency resolution, then just check at a minimum of the tolerance
+            if theoreticalOvertoneValue <= pitchB + tolerance and theoreticalOvertoneValue >= pitchB-tolerance:
                 return True
     return False
 
@@ -114,12 +168,13 @@ def checkIfOvertone(pitchA, pitchB):
 # the swara for that pitch.
 def convertPitchToSwara(pitch, sruthi):
 
-    numSteps = getNumSteps(sruthi, pitch) # Will be positive, negative, or zero.
+    numSteps = getStepsFromSruthi(pitchToSemitones(pitch), pitchToSemitones(sruthi)) # Will be positive, negative, or zero.
     return convertPitchFromSteps(numSteps)
 
 
 # Takes a ascended-sorted list of pitch frequencies from FFT analysis, and returns a list of the fundamental frequencies found.
-def getFundamentalFrequencies(pitchFrequencies):
+# This is the reference implementation of the harmonic sieve; getFundamentalFrequenciesBatch is the vectorized version.
+def getFundamentalFrequencies(pitchFrequencies, tolerance=10):
     if len(pitchFrequencies) < 0:
         return []
     if len(pitchFrequencies) == 1:
@@ -138,9 +193,9 @@ def getFundamentalFrequencies(pitchFrequencies):
             low_freq = pitchFrequencies[low_freq_index]
             if low_freq == freq:
                 continue
-            if low_freq not in funFreqs and checkIfOvertone(low_freq, freq): # this means that the freq pitch is an overtone of low_freq
+            if low_freq not in funFreqs and checkIfOvertone(low_freq, freq, tolerance): # this means that the freq pitch is an overtone of low_freq
                 curFunFreq = low_freq
-        if curFunFreq is not None and [checkIfOvertone(i, curFunFreq) for i in funFreqs] == [False]*len(funFreqs):
+        if curFunFreq is not None and [checkIfOvertone(i, curFunFreq, tolerance) for i in funFreqs] == [False]*len(funFreqs):
             funFreqs.append(curFunFreq)
             funFreqs = sorted(funFreqs)
             
@@ -148,19 +203,15 @@ def getFundamentalFrequencies(pitchFrequencies):
     return funFreqs
 
 # Returns a list of all frequencies found, given the given sample rate and a list of samples.
+# This is the per-frame reference version of getFrameFundamentals. To plot spectra, see plotFuncs.
 def getFrequencies(rate, samples):
-        # plt.figure(1)
-        # plt.xlabel('samples')
-        # plt.ylabel('amplitude')
-        # plt.plot(samples)
-        # plt.show()
         len_data = len(samples)
 
         channel_1 = np.zeros(2**(int(np.ceil(np.log2(len_data)))))
         channel_1[0:len_data] = samples
 
         fourier = np.fft.fft(channel_1)
-        w = np.linspace(0, 44100, len(fourier))
+        w = np.linspace(0, rate, len(fourier))
 
         # First half is the real component, second half is imaginary
         fourier_to_plot = abs(fourier[0:len(fourier)//2])
@@ -169,21 +220,264 @@ def getFrequencies(rate, samples):
         indexesOfPeaks = peakutils.indexes(fourier_to_plot)
         peakFrequencies = [w[u] for u in indexesOfPeaks]
         
-        xxx = peakutils.interpolate(w, fourier_to_plot, ind=indexesOfPeaks)
-        pitchPeaks = [freqToPitch(freq) for freq in peakFrequencies]
-        funFreqs = getFundamentalFrequencies(peakFrequencies)
+        funFreqs = getFundamentalFrequencies(peakFrequencies, getOvertoneTolerance(rate, len(fourier)))
         if os.getenv("PRINT_FREQS") is not None:
             print("Peaks: %s" % str(peakFrequencies))
 
             print("\n---------------------------------------------------------------------")
             print("========> FFs: %s" % str(funFreqs))
             print("---------------------------------------------------------------------\n")
-        # print("XXX: %s" % str([freqToPitch(freq) for freq in xxx]))
-        # print("Peak Frequencies: %s" % str(pitchPeaks))
-        # print()
-        plt.figure(1)
-        plt.xlabel('frequency')
-        plt.ylabel('amplitude')
-        plt.plot(w[:int(len(w)/10)], fourier_to_plot[:int(len(fourier_to_plot)/10)])
-        # plt.show()
-        return funFreqs
\ No newline at end of file
+        return funFreqs
+
+# Returns the (FFT size, window, frequency axis) used to analyze frames of the given length at the given
+# sample rate. These only depend on the frame length and rate, so they are computed once and cached for
+# every batch of frames. The window is rectangular and the axis matches the one getFrequencies builds,
+# so that the batched spectra are identical to the per-frame ones.
+@lru_cache(maxsize=None)
+def getSpectrumParameters(rate, frameLength):
+    nfft = 2**(int(np.ceil(np.log2(frameLength))))
+    window = np.ones(frameLength)
+    w = np.linspace(0, rate, nfft)[0:nfft//2]
+    w.flags.writeable = False
+    return nfft, window, w
+
+# Takes a 2-D array of frames (one frame per row) and returns the frequency axis along with a 2-D array
+# holding the magnitude spectrum of every frame, computed with a single real FFT over the whole matrix.
+def getSpectra(rate, frames):
+    frames = np.atleast_2d(frames)
+    nfft, window, w = getSpectrumParameters(rate, frames.shape[1])
+    spectra = np.abs(np.fft.rfft(frames * window, n=nfft, axis=1))[:, 0:nfft//2]
+    return w, spectra
+
+# Vectorized version of peakutils.indexes (with its default threshold and min_dist=1) over every row of
+# the given spectra. Returns a list holding an array of peak indexes for each row. Rows that contain a
+# plateau (two equal neighbouring bins) need peakutils' plateau handling, so those few rows fall back
+# to peakutils itself.
+def getPeakIndexes(spectra, thres=0.3):
+    if spectra.shape[0] == 0:
+        return []
+    lows = spectra.min(axis=1, keepdims=True)
+    highs = spectra.max(axis=1, keepdims=True)
+    thresholds = thres*(highs - lows) + lows
+    dy = np.diff(spectra, axis=1)
+    isPeak = np.zeros(spectra.shape, dtype=bool)
+    isPeak[:, 1:-1] = (dy[:, :-1] > 0) & (dy[:, 1:] < 0) & (spectra[:, 1:-1] > thresholds)
+    rows, columns = np.nonzero(isPeak)
+    peakIndexes = np.split(columns, np.searchsorted(rows, np.arange(1, spectra.shape[0])))
+    for row in np.flatnonzero((dy == 0).any(axis=1)):
+        peakIndexes[row] = peakutils.indexes(spectra[row], thres=thres)
+    return peakIndexes
+
+# Broadcast version of checkIfOvertone: returns a boolean array that is True wherever pitchB is an
+# overtone of pitchA, using the same 3% / tolerance and 20 harmonic limit. Rather than looping
+# over every harmonic, only the two harmonics closest to pitchB / pitchA are tested: if any harmonic
+# from 2 to 20 falls within the tolerance, so does the closest one on the same side of pitchB.
+def getOvertoneMask(pitchA, pitchB, tolerance=10):
+    pitchA = np.asarray(pitchA, dtype=float)
+    pitchB = np.asarray(pitchB, dtype=float)
+    epsilon = 0.03*pitchB
+    epsilon = np.where(epsilon >= tolerance, epsilon, tolerance)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = pitchB / pitchA
+    isOvertone = np.zeros(np.broadcast(pitchA, pitchB).shape, dtype=bool)
+    for harmonic in (np.floor(ratio), np.ceil(ratio)):
+        theoreticalOvertoneValue = np.clip(harmonic, 2, 20)*pitchA
+        isOvertone |= ((theoreticalOvertoneValue <= 2*pitchB) &
+                       (theoreticalOvertoneValue <= pitchB + epsilon) &
+                       (theoreticalOvertoneValue >= pitchB - epsilon))
+    return isOvertone
+
+# Vectorized harmonic sieve over a batch of frames. Takes a list of ascended-sorted lists of peak
+# frequencies (one list per frame) and returns the list of fundamental frequencies for each frame,
+# exactly as getFundamentalFrequencies would. Frames are grouped by their number of peaks so that each
+# group forms a dense 2-D array, and groups are split into blocks of at most maxBlockSize overtone
+# matrix entries to bound memory use. tolerance is as in getFundamentalFrequencies.
+def getFundamentalFrequenciesBatch(peakLists, maxBlockSize=2**22, tolerance=10):
+    fundamentals = [[] for _ in peakLists]
+    counts = np.array([len(peaks) for peaks in peakLists], dtype=int)
+    for numPeaks in np.unique(counts):
+        if numPeaks == 0:
+            continue
+        group = np.flatnonzero(counts == numPeaks)
+        blockSize = max(1, maxBlockSize // (numPeaks*numPeaks))
+        for start in range(0, len(group), blockSize):
+            block = group[start:start + blockSize]
+            peaks = np.array([peakLists[frame] for frame in block], dtype=float)
+            for frame, funFreqs in zip(block, sieveFundamentals(peaks, tolerance)):
+                fundamentals[frame] = funFreqs
+    return fundamentals
+
+# Runs the harmonic sieve on a 2-D array of ascended-sorted peaks (one frame per row). The overtone
+# relation between every pair of peaks of every frame is computed in one broadcast; the sieve then walks
+# the peak positions from highest to lowest for all frames at once. Returns a list of fundamentals per row.
+def sieveFundamentals(peaks, tolerance=10):
+    numFrames, numPeaks = peaks.shape
+    if numPeaks == 1:
+        return peaks.tolist()
+    rows = np.arange(numFrames)
+    # overtones[f, j, i] is True if peak i of frame f is an overtone of a lower peak j of that frame
+    overtones = getOvertoneMask(peaks[:, :, np.newaxis], peaks[:, np.newaxis, :], tolerance)
+    overtones &= np.triu(np.ones((numPeaks, numPeaks), dtype=bool), k=1)
+    isFundamental = np.zeros(peaks.shape, dtype=bool)
+    for i in range(numPeaks - 1, -1, -1):
+        candidates = overtones[:, :, i] & ~isFundamental
+        # the lowest non-fundamental peak that peak i is an overtone of
+        curFunFreq = np.argmax(candidates, axis=1)
+        accept = ~isFundamental[:, i] & candidates.any(axis=1)
+        accept &= ~(overtones[rows, :, curFunFreq] & isFundamental).any(axis=1)
+        isFundamental[rows[accept], curFunFreq[accept]] = True
+    return [peaks[row, isFundamental[row]].tolist() for row in rows]
+
+# Batched equivalent of getFrequencies: takes a 2-D array of frames and returns a list containing the
+# fundamental frequencies found in each frame. If reference is True, the per-frame
+# getFundamentalFrequencies is used instead of the vectorized harmonic sieve.
+# If diagnostics (see plotFuncs.Diagnostics) are given, the spectra are passed on to them. The overtone
+# tolerance of the harmonic sieve follows the resolution of the spectra (see getOvertoneTolerance).
+def getFrameFundamentals(rate, frames, reference=False, diagnostics=None):
+    frames = np.atleast_2d(frames)
+    tolerance = getOvertoneTolerance(rate, getSpectrumParameters(rate, frames.shape[1])[0])
+    return getFundamentalsFromPeaks(getFramePeaks(rate, frames, diagnostics), tolerance, reference)
+
+# Takes a 2-D array of frames and returns a list with the ascended-sorted peak frequencies of each frame's
+# spectrum. If diagnostics are given, the spectra are passed on to them.
+def getFramePeaks(rate, frames, diagnostics=None):
+    with stageTimer("fft_peaks"):
+        w, spectra = getSpectra(rate, frames)
+        if diagnostics is not None:
+            diagnostics.addSpectra(w, spectra)
+        peakLists = [w[indexes].tolist() for indexes in getPeakIndexes(spectra)]
+    observeValues("peaks_per_frame", map(len, peakLists))
+    return peakLists
+
+# Runs the harmonic sieve, with the given overtone tolerance, on a list of the peak frequencies of every frame
+# (see getFramePeaks), and returns the list of fundamental frequencies of every frame. If reference is True,
+# the per-frame getFundamentalFrequencies is used instead of the vectorized harmonic sieve.
+def getFundamentalsFromPeaks(peakLists, tolerance=10, reference=False):
+    with stageTimer("fundamentals"):
+        if reference:
+            fundamentals = [getFundamentalFrequencies(peaks, tolerance) for peaks in peakLists]
+        else:
+            fundamentals = getFundamentalFrequenciesBatch(peakLists, tolerance=tolerance)
+    observeValues("fundamentals_per_frame", map(len, fundamentals))
+    return fundamentals
+
+# Returns an array with the fraction of the peaks of every frame that are one of its fundamental frequencies
+# or an overtone of one, given the lists of peaks and of fundamentals of every frame. This is how well the
+# fundamentals explain the spectrum of a frame, from 0 (no fundamentals, or no peaks) to 1.
+def getHarmonicConfidence(peakLists, fundamentals, tolerance=10):
+    numPeaks = np.array([len(peaks) for peaks in peakLists], dtype=int)
+    numFundamentals = np.array([len(funFreqs) for funFreqs in fundamentals], dtype=int)
+    peaks = np.array([peak for peaks in peakLists for peak in peaks], dtype=float)
+    funFreqs = np.array([funFreq for frameFundamentals in fundamentals for funFreq in frameFundamentals], dtype=float)
+    peakFrames = np.repeat(np.arange(len(peakLists)), numPeaks)
+    # every (peak, fundamental) pair of the same frame
+    pairsPerPeak = numFundamentals[peakFrames]
+    pairPeaks = np.repeat(np.arange(len(peaks)), pairsPerPeak)
+    fundamentalStarts = np.cumsum(numFundamentals) - numFundamentals
+    pairStarts = np.cumsum(pairsPerPeak) - pairsPerPeak
+    pairFundamentals = (np.arange(len(pairPeaks)) - np.repeat(pairStarts, pairsPerPeak) +
+                        np.repeat(fundamentalStarts[peakFrames], pairsPerPeak))
+    explained = ((peaks[pairPeaks] == funFreqs[pairFundamentals]) |
+                 getOvertoneMask(funFreqs[pairFundamentals], peaks[pairPeaks], tolerance))
+    isExplained = np.bincount(pairPeaks[explained], minlength=len(peaks)) > 0
+    numExplained = np.bincount(peakFrames, weights=isExplained, minlength=len(peakLists))
+    return numExplained / np.maximum(numPeaks, 1)
+
+# A sliding window of frames (lists of frequencies) that keeps a running count of every frequency in it, and the
+# positions of its occurrences, so that frames can be pushed, popped and replaced in time proportional to their
+# number of frequencies (times the log of the occurrences of each), independent of the window size. The most common
+# frequency is tracked through the number of frequencies having each count. Ties are broken in favor of the frequency
+# that occurs first in the window, scanning frames from oldest to newest; this is the same tie-breaking that
+# statistics.mode uses. The mode is kept up to date as frequencies are added, and is only searched for again, among
+# the distinct frequencies of the window, after one of its own occurrences is removed.
+# If a key function is given, frequencies are counted by their key instead (such as their semitone number, see
+# freqToSemitones), and the mode is the frequency that first occurs in the window with the most common key.
+class FrameWindow:
+    def __init__(self, key=None):
+        self.key = key
+        self.frames = deque()
+        self.counts = Counter()
+        self.numWithCount = Counter()
+        self.maxCount = 0
+        # the sorted positions of the occurrences of every frequency: (frame number, index in the frame), where
+        # frames are numbered in the order they were pushed
+        self.positions = {}
+        self.firstFrame = 0
+        # the most common frequency, or None if it has to be found again (see mode)
+        self.currentMode = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def __add(self, freq, position):
+        if self.key is not None:
+            freq = self.key(freq)
+        count = self.counts[freq]
+        self.numWithCount[count] -= 1
+        self.numWithCount[count + 1] += 1
+        self.counts[freq] = count + 1
+        insort(self.positions.setdefault(freq, []), position)
+        if count + 1 > self.maxCount:
+            self.maxCount = count + 1
+            self.currentMode = freq
+        elif count + 1 == self.maxCount and self.currentMode is not None and \
+             self.positions[freq][0] < self.positions[self.currentMode][0]:
+            self.currentMode = freq
+
+    def __remove(self, freq, position):
+        if self.key is not None:
+            freq = self.key(freq)
+        count = self.counts[freq]
+        self.numWithCount[count] -= 1
+        self.numWithCount[count - 1] += 1
+        positions = self.positions[freq]
+        del positions[bisect_left(positions, position)]
+        if count == 1:
+            del self.counts[freq]
+            del self.positions[freq]
+        else:
+            self.counts[freq] = count - 1
+        if count == self.maxCount and self.numWithCount[count] == 0:
+            self.maxCount -= 1
+        if freq == self.currentMode:
+            self.currentMode = None
+
+    # Adds a frame to the newest end of the window.
+    def push(self, frame):
+        number = self.firstFrame + len(self.frames)
+        self.frames.append(frame)
+        for i, freq in enumerate(frame):
+            self.__add(freq, (number, i))
+
+    # Removes and returns the oldest frame of the window.
+    def pop(self):
+        frame = self.frames.popleft()
+        for i, freq in enumerate(frame):
+            self.__remove(freq, (self.firstFrame, i))
+        self.firstFrame += 1
+        return frame
+
+    # Replaces the frame at the given position of the window.
+    def replace(self, index, frame):
+        number = self.firstFrame + index
+        for i, freq in enumerate(self.frames[index]):
+            self.__remove(freq, (number, i))
+        self.frames[index] = frame
+        for i, freq in enumerate(frame):
+            self.__add(freq, (number, i))
+
+    # Returns the most common frequency in the window (the first occurrence of the most common key, if there is a
+    # key function), or None if the window holds no frequencies.
+    def mode(self):
+        if self.maxCount == 0:
+            return None
+        if self.currentMode is None:
+            self.currentMode = min((freq for freq, count in self.counts.items() if count == self.maxCount),
+                                   key=lambda freq: self.positions[freq][0])
+        if self.key is None:
+            return self.currentMode
+        number, index = self.positions[self.currentMode][0]
+        return self.frames[number - self.firstFrame][index]
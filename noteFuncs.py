@@ -0,0 +1,86 @@
+# This file holds the segmentation of despeckled pitches into notes. The despeckled pitch of every frame is
+# turned into cents, and runs of frames whose pitches stay within a tolerance of each other become note segments,
+# all in one vectorized pass. Segments that last long enough are the notes of the recording; each one has a start
+# and end time and a pitch (the mean of its frames), so notes no longer depend on the FFT bin grid or the frame
+# rate. Exact pitches (see pitchFuncs.hasExactPitches) are joined by semitone rather than only when equal. The
+# defaults are the original rule of the Ragam Finder: a note is a pitch found in at least two frames in a row, and
+# a new note is only added when its swara differs from the last one.
+
+import numpy as np
+from musicFuncs import freqToSemitones, freqToCents, centsToFreq, SWARA_NOTES
+
+# Note segments: the start and end time (in seconds) of every segment, its number of voiced frames, and its mean
+# pitch in cents from C0 (see musicFuncs.freqToCents).
+class NoteSegments:
+    def __init__(self, start, end, numFrames, cents):
+        self.start = start
+        self.end = end
+        self.numFrames = numFrames
+        self.cents = cents
+
+    def __len__(self):
+        return len(self.cents)
+
+    # Returns the pitch of every segment, in Hz.
+    def getFrequencies(self):
+        return centsToFreq(self.cents)
+
+    # Returns the semitone number (see musicFuncs.freqToSemitones) of every segment.
+    def getSemitones(self):
+        return freqToSemitones(self.getFrequencies())
+
+    # Returns the list of Notes of the segments, whose swaras are looked up in the given SwaraTable. Segments
+    # with the same swara as the one before them are left out, as they continue the same note.
+    def getNotes(self, swaraTable):
+        swaraIndexes = swaraTable.getSwaraIndexes(self.getFrequencies())
+        isNewNote = np.ones(len(swaraIndexes), dtype=bool)
+        isNewNote[1:] = swaraIndexes[1:] != swaraIndexes[:-1]
+        return list(SWARA_NOTES[swaraIndexes[isNewNote]])
+
+# Splits despeckled pitches into note segments, for frames hopSeconds apart. Consecutive voiced frames are in the
+# same segment while their pitches differ by at most centsTolerance cents (0 only joins equal pitches, or pitches
+# of the same semitone when segmenting by semitone), and frames without a pitch are skipped, so they do not end a
+# segment. A segment is a note if it lasts at least minDuration milliseconds, from the start of its first frame to
+# the start of the frame after its last one, or, by default, if it has at least two frames.
+class NoteSegmenter:
+    def __init__(self, hopSeconds, centsTolerance=0, minDuration=None):
+        if centsTolerance < 0 or (minDuration is not None and minDuration < 0):
+            raise ValueError("The cents tolerance and minimum note duration cannot be negative")
+        self.hopSeconds = hopSeconds
+        self.centsTolerance = centsTolerance
+        self.minDuration = minDuration
+
+    # Returns the settings as a dictionary, to be saved with results.
+    def getParameters(self):
+        return {"cents_tolerance": self.centsTolerance, "min_duration_ms": self.minDuration}
+
+    # Takes an array of the despeckled pitch of every frame, NaN for frames without one (see
+    # RagamFinder.despeckleTrack), and returns the NoteSegments that are notes. The first and last trim voiced
+    # frames are less reliable, and are left out, as trimPitches does. If bySemitone is True, consecutive pitches
+    # that round to the same semitone are also in the same segment.
+    def segment(self, track, trim=0, bySemitone=False):
+        frames = np.flatnonzero(~np.isnan(track))
+        frames = frames[trim:len(frames) - trim] if len(frames) > 2*trim else frames[:0]
+        cents = freqToCents(track[frames])
+        isStart = np.ones(len(cents), dtype=bool)
+        isStart[1:] = np.abs(np.diff(cents)) > self.centsTolerance
+        if bySemitone:
+            isStart[1:] &= np.diff(freqToSemitones(track[frames])) != 0
+        starts = np.flatnonzero(isStart)
+        numFrames = np.diff(np.append(starts, len(cents)))
+        start = frames[starts] * self.hopSeconds
+        end = (frames[starts + numFrames - 1] + 1) * self.hopSeconds
+        if self.minDuration is None:
+            isNote = numFrames >= 2
+        else:
+            isNote = 1000 * (end - start) >= self.minDuration - 1e-9
+        meanCents = np.add.reduceat(cents, starts) / numFrames if len(starts) > 0 else cents
+        return NoteSegments(start[isNote], end[isNote], numFrames[isNote], meanCents[isNote])
+
+# Returns the NoteSegmenter for the given command line options (a dictionary of option names to values), for
+# frames hopSeconds apart: cents (the tolerance, 0 by default) and min-note (the minimum duration in milliseconds,
+# or at least two frames if it is not given).
+def getNoteSegmenter(options, hopSeconds):
+    minDuration = options.get("min-note")
+    return NoteSegmenter(hopSeconds, float(options.get("cents", 0)),
+                         None if minDuration is None else float(minDuration))
@@ -0,0 +1,171 @@
+# This file holds the output of the Ragam Finder. Everything the program reports goes through an OutputSink,
+# which writes it in one of these modes:
+#  - quiet:   only the names of the possible ragams, one per line
+#  - summary: the transitions discovered and the possible ragams (the default)
+#  - verbose: the swaras found in every frame and the candidates left after every transition as well
+#  - json:    one JSON object per line for every transition and for the final result, to be parsed by other programs
+# Output is written through a BufferedLineWriter, so that long frame traces are written in large batches.
+
+import sys, json
+
+OUTPUT_MODES = ["quiet", "summary", "verbose", "json"]
+
+# Writes lines to a stream, holding up to maxLines of them and writing them all at once.
+class BufferedLineWriter:
+    def __init__(self, stream, maxLines=4096):
+        self.stream = stream
+        self.maxLines = maxLines
+        self.lines = []
+
+    def writeLine(self, line=""):
+        self.lines.append(line)
+        if len(self.lines) >= self.maxLines:
+            self.flush()
+
+    def flush(self):
+        if self.lines != []:
+            self.stream.write("\n".join(self.lines) + "\n")
+            self.lines = []
+        self.stream.flush()
+
+# Writes the output of the program in the given mode (see OUTPUT_MODES) to the given stream (stdout by default).
+# Call flush once everything is written.
+class OutputSink:
+    def __init__(self, mode="summary", stream=None):
+        if mode not in OUTPUT_MODES:
+            raise ValueError("Unknown output mode %r: use one of %s" % (mode, ", ".join(OUTPUT_MODES)))
+        self.mode = mode
+        self.writer = BufferedLineWriter(stream if stream is not None else sys.stdout)
+        # True if the swaras of every frame should be given to writeFrame
+        self.traceFrames = mode == "verbose"
+
+    # Writes a message about the progress of the program, in the summary and verbose modes. Messages are
+    # written at once, so that they appear in order with anything else printed.
+    def writeMessage(self, message):
+        if self.mode in ("summary", "verbose"):
+            self.writer.writeLine(message)
+            self.writer.flush()
+
+    # Writes the separator before the first frame's swaras.
+    def beginFrames(self):
+        if self.traceFrames:
+            self.writer.writeLine("|============================================|")
+
+    # Writes the given swaras of a frame, each indented by its note so that they are easy to follow.
+    def writeFrame(self, swaras):
+        if self.traceFrames:
+            for swara in swaras:
+                self.writer.writeLine("\t" * NOTE_INDENTS[swara.note[0]] + str(swara))
+            self.writer.writeLine("|============================================|")
+
+    # Writes the list of all transitions discovered, in the summary and verbose modes.
+    def writeTransitions(self, transitions):
+        if self.mode in ("summary", "verbose"):
+            writeBanner(self.writer, "Transitions Discovered", 39)
+            for transition in transitions:
+                self.writer.writeLine(" "*12 + str(transition))
+
+    # Writes the header before transitions are reported live (see writeCandidates).
+    def beginLive(self):
+        if self.mode in ("summary", "verbose"):
+            writeBanner(self.writer, "Live Transitions", 39)
+            self.writer.flush()
+
+    # Writes a transition along with the ragams that are still candidates after it. If live is True, the
+    # transition was just found in audio that is still being analyzed, so it is written at once with the
+    # number of candidates (and their names, once there are only a few). Otherwise only the verbose and
+    # json modes write it.
+    def writeCandidates(self, transition, ragas, live=False):
+        if self.mode == "json":
+            self.writer.writeLine(json.dumps({"event": "transition", "transition": str(transition),
+                                              "candidates": len(ragas)}, ensure_ascii=False))
+        elif live and self.mode in ("summary", "verbose"):
+            line = " "*12 + "%s\t%d candidate ragams" % (transition, len(ragas))
+            if len(ragas) <= 5:
+                line += ": " + ", ".join(ragam.name for ragam in ragas)
+            self.writer.writeLine(line)
+        elif self.mode == "verbose":
+            self.writer.writeLine(" "*12 + "%s\t%d candidate ragams" % (transition, len(ragas)))
+        if live:
+            self.writer.flush()
+
+    # Writes the possible ragas found, along with all the transitions they were found from in json mode. If a
+    # ranking of the ragams is given (see RagamDB.rankRagams), it is written as well, except in quiet mode, with
+    # the number of phrases each ragam does not allow if the array of these (by ragam id) is given.
+    def writeResult(self, ragas, transitions=None, ranking=None, violations=None):
+        if self.mode == "quiet":
+            for ragam in ragas:
+                self.writer.writeLine(ragam.name)
+        elif self.mode == "json":
+            result = {"event": "result", "ragams": [ragam.name for ragam in ragas]}
+            if transitions is not None:
+                result["transitions"] = [str(transition) for transition in transitions]
+            if ranking is not None:
+                result["ranking"] = [{"ragam": ragam.name, "score": score} for ragam, score in ranking]
+                if violations is not None:
+                    for entry, (ragam, score) in zip(result["ranking"], ranking):
+                        entry["phrase_violations"] = int(violations[ragam.id])
+            self.writer.writeLine(json.dumps(result, ensure_ascii=False))
+        else:
+            self.writer.writeLine()
+            writeBanner(self.writer, "Possible Ragas", 64)
+            for ragam in ragas:
+                self.writer.writeLine("  " + str(ragam))
+            if ranking is not None:
+                self.writer.writeLine()
+                writeBanner(self.writer, "Top Ragas by Score", 64)
+                for rank, (ragam, score) in enumerate(ranking, 1):
+                    line = "  %2d. %5.1f%%  %s" % (rank, 100 * score, ragam.name)
+                    if violations is not None:
+                        line += " (%d phrases not allowed)" % violations[ragam.id]
+                    self.writer.writeLine(line)
+
+    # Writes the results of evaluating every sruthi (see RagamFinder.evaluateSruthis), of which the given best
+    # results are the best supported. For each best sruthi, the possible ragas are those left after narrowing
+    # down the candidates with its transitions or, if there are none, the ragams including the most transitions.
+    def writeSruthiResults(self, results, best):
+        if self.mode == "json":
+            self.writer.writeLine(json.dumps({"event": "sruthis", "best": [result["sruthi"] for result in best],
+                "results": [{"sruthi": result["sruthi"], "coverage": result["coverage"], "support": result["support"],
+                             "specificity": result["specificity"],
+                             "transitions": [str(transition) for transition in result["transitions"]],
+                             "ragams": [ragam.name for ragam in result["ragams"]],
+                             "best_ragams": [ragam.name for ragam in result["best_ragams"]]} for result in results]},
+                ensure_ascii=False))
+            return
+        if self.mode == "quiet":
+            for result in best:
+                ragas = result["ragams"] or result["best_ragams"]
+                self.writer.writeLine("%s: %s" % (result["sruthi"], ", ".join(ragam.name for ragam in ragas)))
+            return
+        writeBanner(self.writer, "Sruthis", 51)
+        self.writer.writeLine("  %-6s %9s %12s %12s %10s" % ("sruthi", "coverage", "specificity", "transitions",
+                                                            "ragams"))
+        for result in results:
+            self.writer.writeLine("  %-6s %8.0f%% %11.0f%% %12d %10d" % (result["sruthi"], 100 * result["coverage"],
+                                  100 * result["specificity"], len(result["transitions"]),
+                                  len(result["ragams"] or result["best_ragams"])))
+        for result in best:
+            self.writer.writeLine()
+            writeBanner(self.writer, "Possible Ragas (sruthi %s)" % result["sruthi"], 64)
+            if result["ragams"] == [] and result["best_ragams"] != []:
+                self.writer.writeLine("  No ragam includes every transition. These include %d of the %d:" % 
+                                      (result["support"], len(result["transitions"])))
+            if self.mode == "verbose":
+                for transition in result["transitions"]:
+                    self.writer.writeLine(" "*12 + str(transition))
+            for ragam in result["ragams"] or result["best_ragams"]:
+                self.writer.writeLine("  " + str(ragam))
+
+    def flush(self):
+        self.writer.flush()
+
+# The number of tabs each swara is indented by in a frame trace.
+NOTE_INDENTS = {"S" : 0, "R": 1, "RG": 2, "G": 3, "M": 4, "P": 5, "D": 6, "DN": 7, "N": 8}
+
+# Writes a title in a box of the given width to the given BufferedLineWriter.
+def writeBanner(writer, title, width):
+    writer.writeLine()
+    writer.writeLine("|" + "=" * width + "|")
+    writer.writeLine("|" + title.center(width) + "|")
+    writer.writeLine("|" + "=" * width + "|")
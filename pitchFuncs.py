@@ -0,0 +1,164 @@
+# This file holds the pitch estimators (backends) that the Ragam Finder can find the fundamental frequencies of
+# frames with: the original FFT peak picking and harmonic sieve (fft), aubio's YIN (yin) and spectral YIN
+# (yinfft) detectors, and a vectorized autocorrelation method (autocorrelation). Every backend returns the
+# fundamental frequencies of each frame as a RaggedArray with a "confidence" column: its confidence in each frame,
+# from 0 to 1. Frames whose confidence is below a backend's minimum have no pitch. The fft backend finds the
+# frequencies of FFT bins; the others find exact frequencies, finer than the bins, which the analysis groups by
+# semitone wherever it compares pitches (see hasExactPitches).
+
+import numpy as np
+import scipy.fft
+import aubio
+from musicFuncs import (getSpectrumParameters, getOvertoneTolerance, getFramePeaks, getFundamentalsFromPeaks,
+                        getHarmonicConfidence)
+from profileFuncs import stageTimer
+from arrayFuncs import RaggedArray
+
+PITCH_BACKENDS = ["fft", "yin", "yinfft", "autocorrelation"]
+
+# The base of the pitch backends, for frames of win_s samples at the given rate. exactPitches is True for the
+# backends whose frequencies are not those of FFT bins.
+class PitchBackend:
+    name = None
+    exactPitches = True
+
+    def __init__(self, rate, win_s, minConfidence=0.0):
+        self.rate = rate
+        self.win_s = win_s
+        self.minConfidence = minConfidence
+        self.nfft, window, self.frequencies = getSpectrumParameters(rate, win_s)
+
+    # Returns the settings of the backend as a dictionary, to be saved with results or used in FeatureCache keys.
+    def getParameters(self):
+        return {"backend": self.name, "min_confidence": self.minConfidence}
+
+    # Takes a 2-D array of frames (one frame per row) and returns a RaggedArray of the fundamental frequencies
+    # found in each frame, with the confidence in each frame as its "confidence" column. If diagnostics (see
+    # plotFuncs.Diagnostics) are given, backends that compute spectra pass them on.
+    def getFrameFundamentals(self, frames, diagnostics=None):
+        raise NotImplementedError
+
+    # Takes an array holding a single pitch for every frame (0 if there is none) and an array of the confidence in
+    # each, and returns the RaggedArray of the fundamental frequencies of every frame: its exact pitch, if it has
+    # one below the Nyquist frequency that is confident enough, and nothing otherwise.
+    def getPitchFrames(self, pitches, confidences):
+        voiced = (pitches > 0) & (pitches < self.rate / 2) & (confidences >= self.minConfidence)
+        return RaggedArray.fromLengths(voiced.astype(np.int64), pitches[voiced].astype(np.float32),
+                                       {"confidence": confidences.astype(np.float32)})
+
+# The original backend: the peaks of every frame's spectrum are found, and the harmonic sieve keeps those that
+# are not overtones of others (see musicFuncs.getFrameFundamentals). A frame may have several fundamentals. The
+# confidence is the fraction of the peaks that are fundamentals or their overtones (see getHarmonicConfidence).
+class FftPeaksBackend(PitchBackend):
+    name = "fft"
+    exactPitches = False
+
+    def getFrameFundamentals(self, frames, diagnostics=None):
+        tolerance = getOvertoneTolerance(self.rate, self.nfft)
+        peakLists = getFramePeaks(self.rate, frames, diagnostics)
+        fundamentals = getFundamentalsFromPeaks(peakLists, tolerance)
+        with stageTimer("pitch_confidence"):
+            confidences = getHarmonicConfidence(peakLists, fundamentals, tolerance)
+        if self.minConfidence > 0:
+            fundamentals = [funFreqs if confidence >= self.minConfidence else []
+                            for funFreqs, confidence in zip(fundamentals, confidences.tolist())]
+        return RaggedArray.fromRows(fundamentals, columns={"confidence": confidences.astype(np.float32)})
+
+# aubio's pitch detectors, run on every frame: yin (with aubio's FFT-based implementation of it, yinfast, which
+# gives the same pitches) or yinfft. The confidence of yin is aubio's (one minus the aperiodicity of the frame);
+# aubio does not give one for yinfft, so its confidence is the periodicity of the frame at the pitch found (see
+# getPeriodicity). aubio only takes one frame at a time, so this calls it once per frame from Python, which makes
+# these the slowest backends (see RagamBenchmark.py's pitch comparison); the block is converted to single
+# precision once, so at least each call does not copy its frame.
+class AubioBackend(PitchBackend):
+    def __init__(self, rate, win_s, method="yin", minConfidence=0.5):
+        PitchBackend.__init__(self, rate, win_s, minConfidence)
+        self.name = method
+        self.detector = aubio.pitch("yinfast" if method == "yin" else method, win_s, win_s, int(rate))
+        self.detector.set_unit("Hz")
+
+    def getFrameFundamentals(self, frames, diagnostics=None):
+        with stageTimer("pitch"):
+            pitches = np.zeros(len(frames))
+            confidences = np.zeros(len(frames))
+            for i, frame in enumerate(np.ascontiguousarray(frames, dtype=np.float32)):
+                pitches[i] = self.detector(frame)[0]
+                confidences[i] = self.detector.get_confidence()
+            if self.name == "yinfft":
+                confidences = getPeriodicity(frames, pitches, self.rate)
+        return self.getPitchFrames(pitches, confidences)
+
+# Finds the pitch of every frame of a block at once from its normalized autocorrelation (see getAutocorrelation):
+# the period is the shortest lag, between those of maxFrequency and minFrequency, at which the autocorrelation has
+# a local maximum of at least 90% of the highest one, which avoids picking a multiple of the period. The period
+# is refined by fitting a parabola through its neighbours, and the confidence is the autocorrelation there.
+class AutocorrelationBackend(PitchBackend):
+    name = "autocorrelation"
+
+    def __init__(self, rate, win_s, minConfidence=0.5, minFrequency=60, maxFrequency=1200):
+        PitchBackend.__init__(self, rate, win_s, minConfidence)
+        self.minLag = max(2, int(np.ceil(rate / maxFrequency)))
+        self.maxLag = min(win_s // 2, int(rate / minFrequency))
+
+    def getParameters(self):
+        return dict(PitchBackend.getParameters(self), min_lag=self.minLag, max_lag=self.maxLag)
+
+    def getFrameFundamentals(self, frames, diagnostics=None):
+        with stageTimer("pitch"):
+            acf = getAutocorrelation(frames, self.maxLag + 2)
+            lags = np.arange(self.minLag, self.maxLag + 1)
+            values = acf[:, lags]
+            isPeak = (values > acf[:, lags - 1]) & (values >= acf[:, lags + 1])
+            highest = np.where(isPeak, values, -np.inf).max(axis=1, keepdims=True)
+            # the first peak close enough to the highest one, for the frames that have any
+            hasPeak = np.isfinite(highest[:, 0])
+            first = np.argmax(isPeak & (values >= 0.9*highest), axis=1)
+            rows = np.arange(len(frames))
+            lag = lags[first]
+            before, at, after = acf[rows, lag - 1], acf[rows, lag], acf[rows, lag + 1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                shift = np.where(before - 2*at + after < 0, 0.5*(before - after) / (before - 2*at + after), 0.0)
+            pitches = np.where(hasPeak, self.rate / (lag + np.clip(shift, -0.5, 0.5)), 0.0)
+            confidences = np.where(hasPeak, np.clip(at, 0, 1), 0.0)
+        return self.getPitchFrames(pitches, confidences)
+
+# Returns the normalized autocorrelation of every frame (row) of the given 2-D array at the lags from 0 to
+# numLags - 1, computed with one FFT per frame. Each lag is averaged over the samples that overlap at it and
+# divided by the energy of the frame, so a periodic frame reaches 1 at its period. Silent frames are all 0.
+# scipy's FFTs keep single precision frames in single precision, which makes them about twice as fast as numpy's
+# here, and the FFTs are only as long as the lags need: the shortest of 2**k, 1.25 * 2**k and 1.5 * 2**k.
+def getAutocorrelation(frames, numLags):
+    frames = np.atleast_2d(frames)
+    length = frames.shape[1]
+    n = 2**int(np.ceil(np.log2(length + numLags)))
+    n = min(size for size in (n, 5*n//8, 3*n//4) if size >= length + numLags)
+    spectra = scipy.fft.rfft(frames, n=n, axis=1)
+    acf = scipy.fft.irfft(spectra.real**2 + spectra.imag**2, n=n, axis=1)[:, :numLags]
+    acf *= length / (length - np.arange(numLags))
+    energy = acf[:, :1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(energy > 0, acf / energy, 0.0)
+
+# Returns the normalized autocorrelation (see getAutocorrelation) of every frame at the period of its pitch, a
+# measure of how periodic the frame is at that pitch, from 0 to 1. Frames without a pitch (0) get 0.
+def getPeriodicity(frames, pitches, rate):
+    with np.errstate(divide='ignore'):
+        lags = np.where(pitches > 0, np.rint(rate / pitches), 0).astype(int)
+    lags = np.clip(lags, 0, frames.shape[1] // 2)
+    acf = getAutocorrelation(frames, lags.max() + 1 if len(lags) else 1)
+    return np.where(lags > 0, np.clip(acf[np.arange(len(lags)), lags], 0, 1), 0.0)
+
+# Returns True if the pitch backend with the given name finds exact frequencies rather than those of FFT bins.
+# Exact frequencies are hardly ever the same in two frames, so the analysis compares them by semitone instead.
+def hasExactPitches(name):
+    return name != FftPeaksBackend.name
+
+# Returns the pitch backend with the given name (see PITCH_BACKENDS) for frames of win_s samples at the given rate.
+def getPitchBackend(name, rate, win_s):
+    if name == "fft":
+        return FftPeaksBackend(rate, win_s)
+    if name in ("yin", "yinfft"):
+        return AubioBackend(rate, win_s, name)
+    if name == "autocorrelation":
+        return AutocorrelationBackend(rate, win_s)
+    raise ValueError("Unknown pitch backend %r: use one of %s" % (name, ", ".join(PITCH_BACKENDS)))
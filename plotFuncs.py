@@ -0,0 +1,147 @@
+# This file holds the optional diagnostics plotting for the Ragam Finder. Nothing in it is used unless
+# diagnostics are turned on, and matplotlib is only imported when a plot is actually rendered. Plots are
+# drawn headlessly (without pyplot) and saved as PNG files, each with a single draw call per series.
+
+import os
+from array import array
+import numpy as np
+from musicFuncs import SWARA_NOTES, freqsToSwaraIndexes
+
+# Returns a new headless matplotlib Figure of the given size in inches.
+def createFigure(width, height):
+    from matplotlib.figure import Figure
+    return Figure(figsize=(width, height))
+
+# Collects diagnostics while a file is being analyzed, and saves them as plots to the given directory:
+#  - the magnitude spectra of a sample of frames, below maxFrequency. At most maxSpectra spectra are kept:
+#    whenever there are more, every other one is dropped and only every other frame is sampled from then on.
+#  - a piano roll of the notes found in every frame, before and after despeckling. This is sampled the
+#    same way, keeping at most maxNotes notes.
+# So the memory used stays bounded however long the recording is.
+class Diagnostics:
+    def __init__(self, outputDir, maxSpectra=64, maxFrequency=2000, maxNotes=200000):
+        self.outputDir = outputDir
+        self.maxSpectra = maxSpectra
+        self.maxFrequency = maxFrequency
+        self.maxNotes = maxNotes
+        self.frequencies = None
+        self.spectra = []
+        self.spectrumFrames = []
+        self.spectrumStride = 1
+        self.numSpectrumFrames = 0
+        self.notes = {"before": NoteSamples(maxNotes), "after": NoteSamples(maxNotes)}
+
+    # Takes the frequency axis and the 2-D array of magnitude spectra of a block of frames, and keeps a sample.
+    def addSpectra(self, w, spectra):
+        if self.frequencies is None:
+            self.frequencies = w[w <= self.maxFrequency]
+        numBins = len(self.frequencies)
+        for row in range(len(spectra)):
+            frame = self.numSpectrumFrames + row
+            if frame % self.spectrumStride != 0:
+                continue
+            self.spectra.append(spectra[row, :numBins].astype(np.float32))
+            self.spectrumFrames.append(frame)
+            if len(self.spectra) > self.maxSpectra:
+                self.spectra = self.spectra[::2]
+                self.spectrumFrames = self.spectrumFrames[::2]
+                self.spectrumStride *= 2
+        self.numSpectrumFrames += len(spectra)
+
+    # Generator that passes frames of fundamental frequencies through, recording their notes.
+    def recordFrames(self, frames, swaraTable):
+        for frame, pitches in enumerate(frames):
+            if len(pitches) > 0:
+                self.notes["before"].add(frame, swaraTable.getSwaraIndexes(pitches))
+            yield pitches
+
+    # Generator that passes despeckled pitches (one per frame, or None) through, recording their notes.
+    def recordDespeckled(self, pitches, swaraTable):
+        for frame, pitch in enumerate(pitches):
+            if pitch is not None:
+                self.notes["after"].add(frame, [swaraTable.getSwaraIndexes(pitch)])
+            yield pitch
+
+    # Saves the plots of everything collected, to <name>_spectra.png and <name>_notes.png in the output
+    # directory. Returns the list of files written.
+    def save(self, name):
+        from matplotlib.collections import LineCollection
+        os.makedirs(self.outputDir, exist_ok=True)
+        written = []
+        if self.spectra != []:
+            figure = createFigure(10, 5)
+            axes = figure.subplots()
+            lines = np.stack([np.broadcast_to(self.frequencies, (len(self.spectra), len(self.frequencies))),
+                              np.array(self.spectra)], axis=-1)
+            axes.add_collection(LineCollection(lines, linewidths=0.5, array=np.array(self.spectrumFrames), cmap="viridis"))
+            axes.autoscale()
+            axes.set_title("Spectra of %d of %d frames of %s" % (len(self.spectra), self.numSpectrumFrames, name))
+            axes.set_xlabel("frequency")
+            axes.set_ylabel("amplitude")
+            written.append(self.__saveFigure(figure, name + "_spectra.png"))
+        figure = createFigure(12, 8)
+        for axes, (stage, title) in zip(figure.subplots(2, 1, sharex=True),
+                                        [("before", "before despeckle"), ("after", "after despeckle")]):
+            self.notes[stage].plot(axes)
+            axes.set_title("Plot of all frames' notes for %s (%s)" % (name, title))
+            axes.set_ylabel("Note(s) identified for frame")
+        axes.set_xlabel("Frame number")
+        written.append(self.__saveFigure(figure, name + "_notes.png"))
+        return written
+
+    def __saveFigure(self, figure, filename):
+        path = os.path.join(self.outputDir, filename)
+        figure.savefig(path, dpi=100)
+        return path
+
+# A bounded sample of (frame, swara index) points for a piano roll of notes. Points are kept for every
+# stride-th frame; whenever there are more than maxNotes points, the stride doubles and the points of
+# the frames that are no longer sampled are dropped.
+class NoteSamples:
+    def __init__(self, maxNotes):
+        self.maxNotes = maxNotes
+        self.frames = array('i')
+        self.swaras = array('b')
+        self.stride = 1
+
+    # Adds the given swara indexes found in the given frame.
+    def add(self, frame, swaraIndexes):
+        if frame % self.stride != 0:
+            return
+        for swaraIndex in swaraIndexes:
+            self.frames.append(frame)
+            self.swaras.append(int(swaraIndex))
+        if len(self.frames) > self.maxNotes:
+            self.stride *= 2
+            frames = np.frombuffer(self.frames, dtype=np.int32)
+            keep = frames % self.stride == 0
+            swaras = np.frombuffer(self.swaras, dtype=np.int8)[keep]
+            self.frames = array('i', frames[keep].tobytes())
+            self.swaras = array('b', swaras.tobytes())
+
+    # Plots the notes on the given axes with a single scatter call.
+    def plot(self, axes):
+        axes.scatter(np.frombuffer(self.frames, dtype=np.int32), np.frombuffer(self.swaras, dtype=np.int8),
+                     c="black", s=4, marker="s")
+        axes.set_yticks(np.arange(len(SWARA_NOTES)))
+        axes.set_yticklabels([str(note) for note in SWARA_NOTES], fontsize=6)
+        axes.set_ylim(-0.5, len(SWARA_NOTES) - 0.5)
+
+# Given a set of frequencies, a sruthi, a filename, and a boolean value representing whether
+# this list of freqs has been despeckled, plots the given notes to the given PNG file.
+def plotNotes(original_freq_list, sruthi, filename, despeckled, outputFilename):
+    freqs = [freq[0] if type(freq) == list else freq for freq in original_freq_list if type(freq) != list or len(freq) >= 1]
+
+    # Convert all original_freq_list to note numbers: 0-11 for S0 through N3, plus 12 above the middle octave
+    swaraIndexes = freqsToSwaraIndexes(freqs, sruthi)
+    y = swaraIndexes % 12 + np.where(swaraIndexes >= 24, 12, 0)
+    count = len(y)
+    figure = createFigure(10, 5)
+    axes = figure.subplots()
+    axes.scatter(np.arange(count), y, c=[[0, 0, 0]])
+    axes.set_title("Plot of all frames' notes for %s %s" % (filename, "(after despeckle)" if despeckled else "(before despeckle)"))
+    axes.set_xlabel("Frame number")
+    axes.set_ylabel("Note(s) identified for frame")
+    axes.set_xticks(np.arange(0, count, 4))
+    axes.set_yticks(np.arange(0, max(y, default=0) + 1, 1))
+    figure.savefig(outputFilename)
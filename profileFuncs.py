@@ -0,0 +1,235 @@
+# This file holds the instrumentation of the Ragam Finder: timers for every stage of the analysis, counters and
+# distributions of values (such as the number of peaks found in each frame), and hooks that run cProfile or a
+# sampling profiler around the analysis. Instrumentation is off unless enableProfiling is called; until then,
+# the functions here do nothing (or return their input unchanged), so the analysis code can call them freely.
+
+import sys, os, time, json, threading, cProfile, pstats, io, contextlib
+from collections import Counter, defaultdict
+import numpy as np
+
+# The Profiler collecting measurements, or None when instrumentation is off.
+activeProfiler = None
+
+# The profiling hooks that runWithHook can run a function under.
+PROFILE_HOOKS = ["cprofile", "sample"]
+
+# Collects the time spent in every stage, counters, distributions and series of values, and the results of
+# profiling hooks. Stage times are exclusive: when a timed stage pulls from another timed stage (as the
+# generator stages of the analysis do), the time spent in the inner stage is only counted for the inner one.
+class Profiler:
+    def __init__(self):
+        self.startTime = time.perf_counter()
+        self.stageSeconds = defaultdict(float)
+        self.stageCalls = Counter()
+        self.counters = Counter()
+        self.distributions = defaultdict(Counter)
+        self.series = defaultdict(list)
+        self.hooks = {}
+        # the time spent in the inner stages of every stage that is currently running
+        self.childSeconds = []
+
+    # Starts timing a stage, and returns the start time to be given to stopStage.
+    def startStage(self):
+        self.childSeconds.append(0.0)
+        return time.perf_counter()
+
+    # Stops timing the given stage, started at the given time.
+    def stopStage(self, stage, start):
+        elapsed = time.perf_counter() - start
+        self.stageSeconds[stage] += elapsed - self.childSeconds.pop()
+        self.stageCalls[stage] += 1
+        if self.childSeconds:
+            self.childSeconds[-1] += elapsed
+
+    # Context manager that times the code it runs as the given stage.
+    @contextlib.contextmanager
+    def stageTimer(self, stage):
+        start = self.startStage()
+        try:
+            yield
+        finally:
+            self.stopStage(stage, start)
+
+    # Generator that passes the items of the given iterable through, timing the work of producing each
+    # one as the given stage.
+    def timedStage(self, stage, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = self.startStage()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.stopStage(stage, start)
+            yield item
+
+    # Returns the report of everything measured so far as a dictionary, ready to be saved as JSON.
+    def getReport(self):
+        wallSeconds = time.perf_counter() - self.startTime
+        stages = {stage: {"seconds": seconds, "calls": self.stageCalls[stage],
+                          "share": seconds / wallSeconds if wallSeconds > 0 else 0.0}
+                  for stage, seconds in sorted(self.stageSeconds.items(), key=lambda item: -item[1])}
+        distributions = {}
+        for name, histogram in self.distributions.items():
+            total = sum(histogram.values())
+            distributions[name] = {"count": total, "mean": sum(value * n for value, n in histogram.items()) / total,
+                                   "min": min(histogram), "max": max(histogram),
+                                   "histogram": {str(value): histogram[value] for value in sorted(histogram)}}
+        return {"wall_seconds": wallSeconds, "stages": stages, "counters": dict(self.counters),
+                "distributions": distributions, "series": dict(self.series), "hooks": self.hooks}
+
+# Turns instrumentation on with a new Profiler, and returns it.
+def enableProfiling():
+    global activeProfiler
+    activeProfiler = Profiler()
+    return activeProfiler
+
+# Turns instrumentation off, and returns the Profiler that was collecting measurements (or None).
+def disableProfiling():
+    global activeProfiler
+    profiler, activeProfiler = activeProfiler, None
+    return profiler
+
+# Returns the active Profiler, or None if instrumentation is off.
+def getProfiler():
+    return activeProfiler
+
+# Returns a context manager that times the code it runs as the given stage.
+def stageTimer(stage):
+    if activeProfiler is None:
+        return contextlib.nullcontext()
+    return activeProfiler.stageTimer(stage)
+
+# Returns the given iterable, timing the work of producing each of its items as the given stage.
+# Stages have to be wrapped while instrumentation is on, since the iterable is returned as is otherwise.
+def timedStage(stage, iterable):
+    if activeProfiler is None:
+        return iterable
+    return activeProfiler.timedStage(stage, iterable)
+
+# Adds n to the counter with the given name.
+def countEvent(name, n=1):
+    if activeProfiler is not None:
+        activeProfiler.counters[name] += n
+
+# Adds the given integer values (any iterable) to the distribution with the given name.
+def observeValues(name, values):
+    if activeProfiler is not None:
+        values, counts = np.unique(np.fromiter(values, dtype=np.int64), return_counts=True)
+        activeProfiler.distributions[name].update(dict(zip(values.tolist(), counts.tolist())))
+
+# Appends the given value to the series with the given name, for values that should be seen in order.
+def recordValue(name, value):
+    if activeProfiler is not None:
+        activeProfiler.series[name].append(value)
+
+# Calls function with the given arguments under cProfile, and returns its result. The functions taking the
+# most cumulative time are added to the report of the active Profiler (if any), and all the stats are saved
+# to statsFilename if it is given, to be read with pstats or snakeviz.
+def runWithCProfile(function, args=(), kwargs=None, statsFilename=None, top=25):
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args, **(kwargs or {}))
+    finally:
+        if statsFilename is not None:
+            profile.dump_stats(statsFilename)
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        functions = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:top]
+        if activeProfiler is not None:
+            activeProfiler.hooks["cprofile"] = {
+                "stats_file": statsFilename,
+                "top_cumulative": [{"function": "%s:%d(%s)" % key, "calls": primitiveCalls,
+                                    "total_seconds": totalSeconds, "cumulative_seconds": cumulativeSeconds}
+                                   for key, (primitiveCalls, calls, totalSeconds, cumulativeSeconds, callers) in functions]}
+
+# A statistical profiler: while it runs, a background thread looks at the stack of the profiled thread every
+# interval seconds and counts the functions on it. This has a small, constant overhead, unlike cProfile, so
+# it can be left on for long recordings.
+class SamplingProfiler:
+    def __init__(self, interval=0.005, thread=None):
+        self.interval = interval
+        self.threadId = (thread or threading.current_thread()).ident
+        self.numSamples = 0
+        self.selfCounts = Counter()
+        self.inclusiveCounts = Counter()
+        self.stopEvent = threading.Event()
+        self.samplerThread = None
+
+    def start(self):
+        self.samplerThread = threading.Thread(target=self.sample, daemon=True)
+        self.samplerThread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        self.samplerThread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        if activeProfiler is not None:
+            activeProfiler.hooks["sampling"] = self.getReport()
+
+    def sample(self):
+        while not self.stopEvent.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            if frame is None:
+                continue
+            self.numSamples += 1
+            self.selfCounts[getFrameName(frame)] += 1
+            # count every function once per sample, even if it is on the stack more than once
+            names = set()
+            while frame is not None:
+                names.add(getFrameName(frame))
+                frame = frame.f_back
+            self.inclusiveCounts.update(names)
+
+    # Returns the number of samples taken, and the functions found most often on top of the stack (self)
+    # and anywhere on it (inclusive), with the fraction of samples they were found in.
+    def getReport(self, top=25):
+        def getTop(counts):
+            return [{"function": name, "samples": n, "fraction": n / self.numSamples}
+                    for name, n in counts.most_common(top)]
+        return {"interval": self.interval, "samples": self.numSamples,
+                "top_self": getTop(self.selfCounts), "top_inclusive": getTop(self.inclusiveCounts)}
+
+# Returns the name of the function of the given stack frame, as file:line(function).
+def getFrameName(frame):
+    code = frame.f_code
+    return "%s:%d(%s)" % (os.path.basename(code.co_filename), code.co_firstlineno, code.co_name)
+
+# Prints a table of the stages, counters and distributions in the given report.
+def printReport(report):
+    print()
+    print("%-24s %10s %8s %8s" % ("stage", "seconds", "share", "calls"))
+    for stage, timing in report["stages"].items():
+        print("%-24s %10.3f %7.1f%% %8d" % (stage, timing["seconds"], 100 * timing["share"], timing["calls"]))
+    print("%-24s %10.3f" % ("wall time", report["wall_seconds"]))
+    for name, value in sorted(report["counters"].items()):
+        print("%-24s %10d" % (name, value))
+    for name, distribution in sorted(report["distributions"].items()):
+        print("%-24s mean %.2f, min %d, max %d over %d" % (name, distribution["mean"], distribution["min"],
+              distribution["max"], distribution["count"]))
+    for name, values in sorted(report["series"].items()):
+        print("%-24s %d values, last %s" % (name, len(values), values[-1] if values else None))
+
+# Saves the given report to the given JSON file.
+def saveReport(report, filename):
+    with open(filename, 'w') as reportFile:
+        json.dump(report, reportFile, indent=1)
+
+# Calls function with the given arguments under the given profiling hook, and returns its result. The hook is
+# "cprofile" (see runWithCProfile; its stats are saved to statsFilename), "sample" (see SamplingProfiler), or
+# None to call the function without any hook.
+def runWithHook(hook, function, args=(), kwargs=None, statsFilename=None):
+    if hook == "cprofile":
+        return runWithCProfile(function, args, kwargs, statsFilename)
+    if hook == "sample":
+        with SamplingProfiler():
+            return function(*args, **(kwargs or {}))
+    if hook is not None:
+        raise ValueError("Unknown profiling hook %r: use one of %s" % (hook, ", ".join(PROFILE_HOOKS)))
+    return function(*args, **(kwargs or {}))
@@ -0,0 +1,155 @@
+# This file holds the synthesizer of test recordings for the Ragam Finder. It sings random phrases of a ragam,
+# going up its arohanam and down its avarohanam, at a given sruthi: every note is a harmonic tone whose pitch
+# glides in from the note before it (a simple gamaka) and wavers with vibrato, over a tambura drone plucking
+# the sruthi's pa and sa, with white noise added. Audio is rendered and written one note at a time, so
+# recordings of any length (minutes to hours) take a fixed amount of memory, and the notes that were sung are
+# written alongside it as the ground truth.
+
+import csv, wave
+import numpy as np
+from musicFuncs import pitchToSemitones, C0
+from RagamDB import SWARA_STEPS, NOTE_NAMES
+
+# The strings of the tambura, as semitones from the sruthi, in the order they are plucked: pa below the sruthi,
+# the sruthi twice, and the sruthi an octave below.
+DRONE_STRINGS = [-5, 0, 0, -12]
+
+# Returns the frequencies, in Hz, of the given numbers of semitones from the given sruthi (a pitch with its
+# octave, such as C3).
+def getStepFrequencies(sruthi, steps):
+    return C0 * 2 ** ((pitchToSemitones(sruthi) + np.asarray(steps)) / 12)
+
+# Returns the frequency, in Hz, of the given Note sung at the given sruthi. Octave 1 starts at the sruthi, as
+# the notes of the ragam list do.
+def getNoteFrequency(note, sruthi):
+    return float(getStepFrequencies(sruthi, 12*(note.octave - 1) + int(SWARA_STEPS[note.code % (4*len(NOTE_NAMES))])))
+
+# Generator that yields the notes of random phrases of the given Ragam forever, using the given numpy random
+# Generator: runs of three notes or more going up its arohanam or down its avarohanam, like a singer exploring
+# the ragam. Each phrase starts on the note the last one ended on, or on the sruthi, and no note is repeated.
+def getPhraseNotes(ragam, rng):
+    scales = [scale for scale in (ragam.ascending, ragam.descending) if len(scale) >= 3]
+    if scales == []:
+        raise ValueError("The ragam %s has no phrases of three notes or more" % ragam.name)
+    last = None
+    while True:
+        scale = scales[rng.integers(len(scales))]
+        starts = [i for i in range(len(scale) - 2) if scale[i] == last] or [0]
+        start = starts[rng.integers(len(starts))]
+        end = rng.integers(start + 3, len(scale) + 1)
+        for note in scale[start:end]:
+            if note != last:
+                yield note
+            last = note
+
+# Renders recordings of ragams (see the top of this file). samplerate is that of the audio written, harmonics
+# is the number of harmonics of every note (with amplitudes falling as 1/k), drone and noise are the levels of
+# the tambura and the noise relative to the voice, vibrato is the depth of the vibrato in cents, gamaka the
+# fraction of every note spent gliding from the note before, and noteSeconds the mean length of a note. The
+# same seed always gives the same recording.
+class RagamSynthesizer:
+    def __init__(self, samplerate=44100, harmonics=6, drone=0.1, noise=0.01, vibrato=15, gamaka=0.2,
+                 noteSeconds=0.4, seed=0):
+        if harmonics < 1 or noteSeconds <= 0 or not 0 <= gamaka < 1 or min(drone, noise, vibrato) < 0:
+            raise ValueError("The number of harmonics must be at least 1, the note length positive, the gamaka "
+                             "a fraction below 1, and the other levels at least 0")
+        self.samplerate = samplerate
+        self.harmonics = harmonics
+        self.drone = drone
+        self.noise = noise
+        self.vibrato = vibrato
+        self.gamaka = gamaka
+        self.noteSeconds = noteSeconds
+        self.seed = seed
+
+    # Returns the settings as a dictionary, to be saved with results.
+    def getParameters(self):
+        return {"samplerate": self.samplerate, "harmonics": self.harmonics, "drone": self.drone,
+                "noise": self.noise, "vibrato": self.vibrato, "gamaka": self.gamaka,
+                "note_seconds": self.noteSeconds, "seed": self.seed}
+
+    # Renders the given number of seconds of the given Ragam at the given sruthi to a mono 16-bit WAV file. If
+    # a notes filename is given, the notes sung are written to it as CSV, one "start,end,note,octave,frequency"
+    # line per note (times in seconds). Returns the list of Notes sung.
+    def render(self, ragam, sruthi, seconds, filename, notesFilename=None):
+        rng = np.random.default_rng(self.seed)
+        numSamples = int(round(seconds * self.samplerate))
+        amplitudes = 1.0 / np.arange(1, self.harmonics + 1)
+        amplitudes /= amplitudes.sum()
+        # The peak level is kept below full scale, whatever the levels of the drone and the noise
+        scale = 0.8 / (1 + self.drone + 3*self.noise)
+        notes = []
+        notesFile = open(notesFilename, 'w', newline='') if notesFilename is not None else None
+        try:
+            writer = csv.writer(notesFile) if notesFile is not None else None
+            if writer is not None:
+                writer.writerow(["start", "end", "note", "octave", "frequency"])
+            with wave.open(filename, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(self.samplerate)
+                start = 0
+                phase = 0.0
+                previousFrequency = None
+                phraseNotes = getPhraseNotes(ragam, rng)
+                while start < numSamples:
+                    note = next(phraseNotes)
+                    frequency = getNoteFrequency(note, sruthi)
+                    length = min(int(self.noteSeconds * rng.uniform(0.6, 1.4) * self.samplerate), numSamples - start)
+                    voice, phase = self.renderNote(frequency, previousFrequency, length, phase, amplitudes, rng)
+                    t = (start + np.arange(length)) / self.samplerate
+                    samples = voice + self.drone * self.renderDrone(t, sruthi) + \
+                              self.noise * rng.standard_normal(length)
+                    wav.writeframes((np.clip(scale * samples, -1, 1) * 32767).astype('<i2').tobytes())
+                    if writer is not None:
+                        writer.writerow(["%.4f" % (start / self.samplerate),
+                                         "%.4f" % ((start + length) / self.samplerate),
+                                         note.note + str(note.noteclass), note.octave, "%.2f" % frequency])
+                    notes.append(note)
+                    previousFrequency = frequency
+                    start += length
+        finally:
+            if notesFile is not None:
+                notesFile.close()
+        return notes
+
+    # Renders one note of the given frequency and number of samples, starting at the given oscillator phase,
+    # gliding from the frequency of the note before it (if any) over the first gamaka fraction of the note.
+    # Returns its samples and the phase at its end, so that the next note continues without a click.
+    def renderNote(self, frequency, previousFrequency, length, phase, amplitudes, rng):
+        t = np.arange(length) / self.samplerate
+        cents = self.vibrato * np.sin(2*np.pi*rng.uniform(5, 7)*t + rng.uniform(0, 2*np.pi))
+        glide = int(self.gamaka * length)
+        if previousFrequency is not None and glide > 0:
+            cents[:glide] += 1200*np.log2(previousFrequency / frequency) * (1 - np.arange(glide) / glide)
+        phases = phase + 2*np.pi*np.cumsum(frequency * 2 ** (cents / 1200)) / self.samplerate
+        samples = np.zeros(length)
+        for k, amplitude in enumerate(amplitudes, 1):
+            samples += amplitude * np.sin(k * phases)
+        return samples, float(phases[-1]) % (2*np.pi) if length > 0 else phase
+
+    # Renders the tambura drone at the given times (in seconds) for the given sruthi: the strings are plucked in
+    # turn, one every 0.6 seconds, and each one rings, fading out, until it is plucked again. Every string is a
+    # tone of its own, whose phase runs on from the start of the recording, so plucking a string does not cut off
+    # the others or make the phase of the drone jump. The drone is scaled so that it never goes above 1.
+    def renderDrone(self, t, sruthi):
+        period = 0.6 * len(DRONE_STRINGS)
+        drone = np.zeros(len(t))
+        for k, frequency in enumerate(getStepFrequencies(sruthi, DRONE_STRINGS)):
+            # the time since the string was last plucked. Every pluck rises over 5 ms from what was left of the
+            # last one (nothing, before the string is first plucked), so that it does not click.
+            sincePluck = (t - 0.6*k) % period
+            left = np.where(t >= 0.6*k + period, np.exp(-period / 1.5), 0)
+            envelope = np.where(sincePluck < 0.005, left + (np.exp(-0.005 / 1.5) - left) * sincePluck / 0.005,
+                                np.exp(-sincePluck / 1.5))
+            envelope[t < 0.6*k] = 0
+            phases = 2*np.pi*frequency*t
+            drone += envelope * (np.sin(phases) + 0.5*np.sin(2*phases) + 0.3*np.sin(3*phases))
+        return drone / (1.8 * np.exp(-0.6*np.arange(len(DRONE_STRINGS)) / 1.5).sum())
+
+# Returns the number of seconds in the given duration, such as 90, 90s, 5m or 2h.
+def parseDuration(duration):
+    units = {"s": 1, "m": 60, "h": 3600}
+    if duration[-1:] in units:
+        return float(duration[:-1]) * units[duration[-1]]
+    return float(duration)
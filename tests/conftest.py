@@ -0,0 +1,5 @@
+# Lets the tests import the modules of the Ragam Finder, which live in the directory above this one.
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
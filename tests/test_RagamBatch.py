@@ -0,0 +1,62 @@
+import os, csv, json
+import pytest
+from conftest import ROOT
+from RagamBatch import getCompletedJobs, ResultWriter, runBatch, RESULT_FIELDS
+
+def getResult(filename, sruthi, error=""):
+    return {"file": filename, "sruthi": sruthi, "num_transitions": 0 if error else 12, "num_ragams": 0 if error else 2,
+            "ragams": [] if error else ["Megha", "Madhyamāvati"], "seconds": 0.5, "error": error,
+            "detected_sruthi": ""}
+
+# Writes the results of a.wav, which worked, and of b.wav, which failed, followed by part of the result of c.wav,
+# as when a batch is interrupted while writing it.
+def writeInterruptedBatch(output):
+    writer = ResultWriter(output)
+    writer.write(getResult("a.wav", "C"))
+    writer.write(getResult("b.wav", "D", "RuntimeError: could not decode"))
+    writer.close()
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('c.wav,E,12,1,Megh' if output.endswith(".csv") else '{"file": "c.wav", "sruthi": "E", "num_tr')
+
+def readRows(output):
+    with open(output, newline="", encoding="utf-8") as f:
+        if output.endswith(".csv"):
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f]
+
+@pytest.mark.parametrize("extension", [".csv", ".jsonl"])
+def test_resume_drops_partial_lines_and_retries_errors(tmp_path, extension):
+    output = str(tmp_path / ("results" + extension))
+    writeInterruptedBatch(output)
+    assert getCompletedJobs(output) == {("a.wav", "C")}
+    rows = readRows(output)
+    assert [(row["file"], row["sruthi"], row["error"]) for row in rows] == [("a.wav", "C", "")]
+    # results written after resuming follow on from the results that were kept
+    writer = ResultWriter(output)
+    writer.write(getResult("b.wav", "D"))
+    writer.close()
+    assert [row["file"] for row in readRows(output)] == ["a.wav", "b.wav"]
+    assert getCompletedJobs(output) == {("a.wav", "C"), ("b.wav", "D")}
+
+def test_resume_rejects_csv_with_other_columns(tmp_path):
+    output = str(tmp_path / "results.csv")
+    with open(output, "w", encoding="utf-8") as f:
+        f.write("file,sruthi,num_transitions,num_ragams,ragams,seconds,error\na.wav,C,12,2,Megha,0.5,\n")
+    with open(output, encoding="utf-8") as f:
+        contents = f.read()
+    with pytest.raises(ValueError):
+        getCompletedJobs(output)
+    with open(output, encoding="utf-8") as f:
+        assert f.read() == contents
+
+# A file that cannot be read gives an error row, which is replaced when the batch is run again.
+def test_batch_runs_failed_jobs_again(tmp_path):
+    output = str(tmp_path / "results.csv")
+    jobs = [(str(tmp_path / "missing.wav"), "C")]
+    ragamListFilename = os.path.join(ROOT, "reference", "ragam_list.txt")
+    for run in range(2):
+        runBatch(jobs, output, workers=1, ragamListFilename=ragamListFilename)
+        rows = readRows(output)
+        assert [row["file"] for row in rows] == [jobs[0][0]]
+        assert rows[0]["error"] != ""
+    assert list(rows[0]) == RESULT_FIELDS
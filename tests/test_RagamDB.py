@@ -0,0 +1,122 @@
+import os, io, contextlib
+import numpy as np
+import pytest
+from conftest import ROOT
+from RagamDB import RagamDB, Note, PHRASE_LENGTH, COMPILED_VERSION, SWARA_NAMES, getScalePhrases
+
+@pytest.fixture(scope="module")
+def ragamDB():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return RagamDB(os.path.join(ROOT, "reference", "ragam_list.txt"))
+
+# Going up the arohanam of Megha into the next octave and jumping back down to S sings S twice in a row, in two
+# octaves, which is one step of its phrases.
+def test_phrases_skip_swaras_repeated_in_another_octave(ragamDB):
+    megha = ragamDB.searchByName("Megha")
+    notes = megha.ascending + [Note("S", 0, 1), Note("R", 1, 1), Note("M", 1, 1)]
+    assert megha.ascending[-1] == Note("S", 0, 2)
+    matches, violations = ragamDB.countPhrases(notes)
+    assert violations[megha.id] == 0
+    # S1 is skipped, so the phrases are those of the other notes
+    assert matches[megha.id] == len(megha.ascending) + 2 - PHRASE_LENGTH + 1
+
+def getRagamIds(ragamDB, mask):
+    return [ragam.id for ragam in ragamDB.getRagasFromMask(mask)]
+
+# None means that nothing was filtered yet, so every ragam is a candidate, while 0 means that none is left, which
+# no transition can undo.
+def test_filter_ragams_tells_no_candidates_from_no_filtering(ragamDB):
+    megha = ragamDB.searchByName("Megha")
+    transitions = megha.getTransitions()[:3]
+    assert ragamDB.filterRagams([]) == ragamDB.allRagams
+    assert ragamDB.filterRagams([], 0) == 0
+    assert ragamDB.filterRagams(transitions, 0) == 0
+    expected = [ragam.id for ragam in ragamDB.ragamList
+                if {transition.code for transition in transitions} <= {t.code for t in ragam.getTransitions()}]
+    assert megha.id in expected
+    assert getRagamIds(ragamDB, ragamDB.filterRagams(transitions)) == expected
+    # filtering in steps gives the same candidates as filtering at once
+    assert ragamDB.filterRagams(transitions[1:], ragamDB.filterRagams(transitions[:1])) == \
+           ragamDB.filterRagams(transitions)
+
+RAGAM_LIST = """1 Kanakāngi
+S R1 G1 M1 P D1 N1 S
+S N1 D1 P M1 G1 R1 S
+Kanakāmbari
+S R1 M1 P D1 S
+S N1 D1 P M1 G1 R1 S
+"""
+
+def loadRagamDB(filename):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return RagamDB(filename)
+
+# Returns the names in the RagamDB loaded from the given file, failing if the ragam list is parsed rather than
+# loaded from its compiled form, or the other way around if parsed is True.
+def loadNames(filename, monkeypatch, parsed):
+    calls = []
+    parse = RagamDB.getRagamListFromFile
+    monkeypatch.setattr(RagamDB, "getRagamListFromFile", lambda self, name: calls.append(name) or parse(self, name))
+    names = list(loadRagamDB(filename).names)
+    monkeypatch.setattr(RagamDB, "getRagamListFromFile", parse)
+    assert calls == ([filename] if parsed else [])
+    return names
+
+def test_compiled_ragam_list_is_rebuilt_when_out_of_date(tmp_path, monkeypatch):
+    filename = str(tmp_path / "ragam_list.txt")
+    with open(filename, "w") as f:
+        f.write(RAGAM_LIST)
+    assert loadNames(filename, monkeypatch, parsed=True) == ["Kanakāngi", "Kanakāmbari"]
+    assert os.path.exists(RagamDB.getCompiledFilename(filename))
+    assert loadNames(filename, monkeypatch, parsed=False) == ["Kanakāngi", "Kanakāmbari"]
+    # a changed ragam list has another hash
+    with open(filename, "a") as f:
+        f.write("Megha\nS R2 M1 P N2 S\nS N2 P M1 R2 S\n")
+    assert loadNames(filename, monkeypatch, parsed=True) == ["Kanakāngi", "Kanakāmbari", "Megha"]
+    assert loadNames(filename, monkeypatch, parsed=False) == ["Kanakāngi", "Kanakāmbari", "Megha"]
+    # so does a compiled file of another version
+    monkeypatch.setattr("RagamDB.COMPILED_VERSION", COMPILED_VERSION + 1)
+    assert loadNames(filename, monkeypatch, parsed=True) == ["Kanakāngi", "Kanakāmbari", "Megha"]
+    assert loadNames(filename, monkeypatch, parsed=False) == ["Kanakāngi", "Kanakāmbari", "Megha"]
+    # and an unreadable one is replaced
+    with open(RagamDB.getCompiledFilename(filename), "wb") as f:
+        f.write(b"not a zip file")
+    assert loadNames(filename, monkeypatch, parsed=True) == ["Kanakāngi", "Kanakāmbari", "Megha"]
+    assert loadNames(filename, monkeypatch, parsed=False) == ["Kanakāngi", "Kanakāmbari", "Megha"]
+
+def getSteps(notes):
+    return [SWARA_NAMES.index((note.note, note.noteclass)) for note in notes]
+
+# Counts the phrases of the notes that every ragam allows one window at a time: the swara steps of the notes, with
+# repeated steps merged, are cut into every window of PHRASE_LENGTH steps, which is looked up in the phrase rules
+# of every ragam.
+def countPhrasesReference(ragamDB, notes):
+    steps = getSteps(notes)
+    steps = [step for i, step in enumerate(steps) if i == 0 or step != steps[i - 1]]
+    windows = [tuple(steps[i:i + PHRASE_LENGTH]) for i in range(len(steps) - PHRASE_LENGTH + 1)]
+    matches = []
+    for id in range(len(ragamDB.names)):
+        ragam = ragamDB.getRagam(id)
+        phrases = getScalePhrases(getSteps(ragam.ascending), getSteps(ragam.descending))
+        matches.append(sum(window in phrases for window in windows))
+    return matches, len(windows)
+
+# Random walks up and down the scale of a ragam, in any octave, with now and then a jump to any swara, so that
+# the notes have phrases that many ragams allow as well as phrases that few or none allow.
+@pytest.mark.parametrize("name", ["Megha", "Kharaharapriya", "Hindolam", "Bilahari"])
+def test_count_phrases_matches_brute_force(ragamDB, name):
+    rng = np.random.default_rng(len(name))
+    scale = ragamDB.searchByName(name).ascending[:-1]
+    index, notes = 0, []
+    for i in range(200):
+        if rng.random() < 0.1:
+            note, noteclass = SWARA_NAMES[rng.integers(len(SWARA_NAMES))]
+        else:
+            index = (index + rng.choice([-1, 1, 2])) % len(scale)
+            note, noteclass = scale[index].note, scale[index].noteclass
+        notes.append(Note(note, noteclass, int(rng.integers(3))))
+    matches, violations = ragamDB.countPhrases(notes)
+    expected, numPhrases = countPhrasesReference(ragamDB, notes)
+    assert matches.tolist() == expected
+    assert (matches + violations == numPhrases).all()
+    assert 0 < matches[ragamDB.searchByName(name).id] < numPhrases
@@ -0,0 +1,52 @@
+import os, io, contextlib, statistics
+import numpy as np
+import pytest
+from conftest import ROOT
+from RagamDB import RagamDB
+from RagamFinder import processFileAllSruthis, getBestSruthis, despecklePitches, despeckleFrames
+from synthFuncs import RagamSynthesizer
+
+@pytest.fixture(scope="module")
+def ragamDB():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return RagamDB(os.path.join(ROOT, "reference", "ragam_list.txt"))
+
+# A clean synthetic recording of Kharaharapriya at D. Its notes sung from G are those of Harikambhoji, and from A
+# those of Natabhairavi, so some ragam includes every transition for those sruthis too.
+@pytest.fixture(scope="module")
+def kharaharapriyaFile(ragamDB, tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp("audio") / "kharaharapriya.wav")
+    RagamSynthesizer(drone=0, noise=0, vibrato=0, gamaka=0, noteSeconds=0.6).render(
+        ragamDB.searchByName("Kharaharapriya"), "D3", 15, filename)
+    return filename
+
+@pytest.mark.parametrize("pitchBackend", ["fft", "yin"])
+def test_auto_sruthi_finds_the_sung_sruthi(ragamDB, kharaharapriyaFile, pitchBackend):
+    results = processFileAllSruthis(kharaharapriyaFile, ragamDB, pitchBackend=pitchBackend)
+    assert sum(result["coverage"] == 1.0 for result in results) > 1
+    assert [result["sruthi"] for result in getBestSruthis(results)] == ["D"]
+    assert "Kharaharapriya" in [ragam.name for ragam in results[0]["ragams"]]
+
+# The original despeckling: every frame whose super window is complete becomes the statistics.mode of the pitches
+# in the window, which holds the frames before it as they were already despeckled. A window without pitches
+# leaves the frame empty. Returns the first pitch of every frame that has one.
+def despeckleReference(pitchList, superwindow_size):
+    pitchList = [list(frame) for frame in pitchList]
+    before = superwindow_size // 2
+    for middle in range(before, len(pitchList) - before):
+        freqs = [pitch for frame in pitchList[middle - before:middle + before + 1] for pitch in frame]
+        pitchList[middle] = [statistics.mode(freqs)] if freqs != [] else []
+    return [frame[0] for frame in pitchList if frame != []]
+
+@pytest.mark.parametrize("superwindow_size", [1, 3, 5, 7])
+def test_despeckle_matches_reference(superwindow_size):
+    rng = np.random.default_rng(superwindow_size)
+    # a few pitches, so that windows often have ties, and runs of empty frames
+    frames = [[float(pitch) for pitch in rng.choice([110.0, 220.0, 330.0, 440.0], rng.integers(0, 4))]
+              for i in range(500)]
+    expected = despeckleReference(frames, superwindow_size)
+    assert despecklePitches(frames, superwindow_size) == expected
+    # frames that are too few for a complete super window keep their first pitch
+    assert despecklePitches(frames[:superwindow_size - 1], superwindow_size) == \
+           [frame[0] for frame in frames[:superwindow_size - 1] if frame != []]
+    assert len(list(despeckleFrames(frames, superwindow_size))) == len(frames)
@@ -0,0 +1,15 @@
+import pytest
+from arrayFuncs import RaggedArray
+
+ROWS = [[1.0, 2.0], [], [3.0]]
+
+def test_negative_index_counts_from_the_end():
+    ragged = RaggedArray.fromRows(ROWS)
+    assert ragged[-1] == [3.0]
+    assert ragged[-3] == [1.0, 2.0]
+    assert ragged[1:][-2] == []
+
+@pytest.mark.parametrize("i", [3, -4])
+def test_index_out_of_range_raises(i):
+    with pytest.raises(IndexError):
+        RaggedArray.fromRows(ROWS)[i]
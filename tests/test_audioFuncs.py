@@ -0,0 +1,40 @@
+import os, io, contextlib
+import pytest
+from conftest import ROOT
+from RagamDB import RagamDB
+from RagamFinder import processFile, getFileFrames
+from audioFuncs import FrontEnd
+from synthFuncs import RagamSynthesizer
+
+# A clean synthetic recording of Megha at C, with no drone, noise, vibrato or gamakas, so that every frame
+# setting finds the same notes.
+@pytest.fixture(scope="module")
+def meghaFile(tmp_path_factory):
+    with contextlib.redirect_stdout(io.StringIO()):
+        ragamDB = RagamDB(os.path.join(ROOT, "reference", "ragam_list.txt"))
+    filename = str(tmp_path_factory.mktemp("audio") / "megha.wav")
+    RagamSynthesizer(drone=0, noise=0, vibrato=0, gamaka=0, noteSeconds=0.6).render(
+        ragamDB.searchByName("Megha"), "C3", 15, filename)
+    return filename
+
+def getTransitions(filename, frontEnd):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return processFile(filename, "C3", frontEnd=frontEnd)
+
+# Hops shorter than the default minimum read of 512 samples used to give no frames at all.
+@pytest.mark.parametrize("hop", [256, 1024])
+def test_undecimated_hops_find_default_transitions(meghaFile, hop):
+    frontEnd = FrontEnd(win_s=4096, hop_s=hop)
+    assert len(getFileFrames(meghaFile, frontEnd)) > 0
+    transitions = getTransitions(meghaFile, frontEnd)
+    assert transitions != []
+    # The first and last frames with a pitch are left out, which covers less of the audio with shorter hops, so
+    # they can find notes at the very start and end that the default does not: the default's transitions must be
+    # found in a row, with nothing else between them.
+    default = [repr(transition) for transition in getTransitions(meghaFile, FrontEnd())]
+    found = [repr(transition) for transition in transitions]
+    assert any(found[i:i + len(default)] == default for i in range(len(found) - len(default) + 1))
+
+def test_min_read_is_at_most_a_hop():
+    assert FrontEnd(hop_s=256).minRead == 256
+    assert FrontEnd().minRead == 512
@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import pytest
+import cacheFuncs
+from cacheFuncs import FeatureCache
+from arrayFuncs import RaggedArray
+
+# Features with two pitches in each frame, so that every entry has the same size.
+def getFeatures(seed):
+    return RaggedArray.fromRows(list(np.random.default_rng(seed).uniform(80, 800, (100, 2))))
+
+def assertSameFeatures(features, expected):
+    assert [list(frame) for frame in features] == [list(frame) for frame in expected]
+
+# Sets the time an entry was last used, a second apart for each entry, so that their order does not depend on
+# how quickly they were written.
+def setLastUsed(cache, key, seconds):
+    os.utime(cache.getFilenames(key)[0], (seconds, seconds))
+
+def saveEntry(cache, key, features):
+    cache.save(key, features)
+    return cache.getFilenames(key)
+
+def test_cache_removes_least_recently_used_entries(tmp_path):
+    features = [getFeatures(seed) for seed in range(4)]
+    entryBytes = sum(map(os.path.getsize, saveEntry(FeatureCache(str(tmp_path / "size")), "size", features[0])))
+    cache = FeatureCache(str(tmp_path / "cache"), maxBytes=3*entryBytes)
+    for i in range(3):
+        saveEntry(cache, "entry%d" % i, features[i])
+        setLastUsed(cache, "entry%d" % i, 1000 + i)
+    # using entry0 makes entry1 the least recently used
+    assertSameFeatures(cache.load("entry0"), features[0])
+    cache.save("entry3", features[3])
+    assert cache.load("entry1") is None
+    for i in (0, 2, 3):
+        assertSameFeatures(cache.load("entry%d" % i), features[i])
+    assert sorted(os.listdir(cache.directory)) == sorted(name for i in (0, 2, 3) for name in
+                                                         ("entry%d.offsets.npy" % i, "entry%d.values.npy" % i))
+
+def test_cache_never_holds_more_than_its_size(tmp_path):
+    cache = FeatureCache(str(tmp_path), maxBytes=0)
+    cache.save("entry", getFeatures(0))
+    assert cache.load("entry") is None
+    assert os.listdir(str(tmp_path)) == []
+
+def test_incomplete_entries_are_not_loaded(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    offsetsFilename, valuesFilename = saveEntry(cache, "entry", getFeatures(0))
+    os.remove(offsetsFilename)
+    assert cache.load("entry") is None
+    with open(offsetsFilename, "wb") as f:
+        f.write(b"not an array")
+    assert cache.load("entry") is None
+
+# The key depends on the contents of the file rather than its name or modification time, so a file that is changed
+# in place is analyzed again even if its modification time is kept, and a copy of a file uses the same entry.
+def test_key_changes_with_contents_parameters_and_version(tmp_path, monkeypatch):
+    filename, copyFilename = str(tmp_path / "a.wav"), str(tmp_path / "b.wav")
+    for name in (filename, copyFilename):
+        with open(name, "wb") as f:
+            f.write(b"RIFF" + bytes(range(256)) * 10)
+    key = FeatureCache.getKey(filename, rate=44100, hop_s=1024)
+    assert FeatureCache.getKey(copyFilename, rate=44100, hop_s=1024) == key
+    assert FeatureCache.getKey(filename, hop_s=1024, rate=44100) == key
+    assert FeatureCache.getKey(filename, rate=44100, hop_s=512) != key
+    stat = os.stat(filename)
+    with open(filename, "r+b") as f:
+        f.seek(100)
+        f.write(b"\xff")
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert FeatureCache.getKey(filename, rate=44100, hop_s=1024) != key
+    monkeypatch.setattr(cacheFuncs, "FEATURE_VERSION", cacheFuncs.FEATURE_VERSION + 1)
+    assert FeatureCache.getKey(copyFilename, rate=44100, hop_s=1024) != key
+
+@pytest.mark.parametrize("rows", [[], [[]], [[110.0, 220.0], [], [330.0]]])
+def test_cache_round_trip(tmp_path, rows):
+    cache = FeatureCache(str(tmp_path))
+    features = RaggedArray.fromRows(rows)
+    cache.save("entry", features)
+    loaded = cache.load("entry")
+    assert len(loaded) == len(rows)
+    assertSameFeatures(loaded, features)
@@ -0,0 +1,83 @@
+import statistics
+import numpy as np
+import pytest
+from musicFuncs import (getFundamentalFrequencies, getFundamentalFrequenciesBatch, checkIfOvertone, getOvertoneMask,
+                        getFrameFundamentals, getSpectrumParameters, FrameWindow, freqToSemitones)
+
+RATE, WIN_S = 44100, 4096
+
+# Returns random sorted lists of bin frequencies, as the peaks of frames would be: a few fundamentals with some of
+# their harmonics, moved to the nearest bin, and a few other peaks, with every number of peaks from 0 up.
+def getRandomPeakLists(numFrames, seed=0):
+    rng = np.random.default_rng(seed)
+    frequencies = getSpectrumParameters(RATE, WIN_S)[2]
+    spacing = frequencies[1]
+    peakLists = []
+    for i in range(numFrames):
+        funFreqs = rng.uniform(80, 800, rng.integers(0, 3))
+        harmonics = [funFreq * harmonic for funFreq in funFreqs for harmonic in range(1, 8) if rng.random() < 0.6]
+        freqs = np.concatenate([harmonics, rng.uniform(50, 4000, rng.integers(0, 4))])
+        bins = np.unique(np.rint(freqs / spacing).astype(int))
+        peakLists.append(frequencies[bins[(bins > 0) & (bins < len(frequencies))]].tolist())
+    return peakLists
+
+@pytest.mark.parametrize("tolerance", [10, 2.5])
+def test_overtone_mask_matches_check_if_overtone(tolerance):
+    pitches = getSpectrumParameters(RATE, WIN_S)[2][1:400:3]
+    mask = getOvertoneMask(pitches[:, np.newaxis], pitches[np.newaxis, :], tolerance)
+    expected = [[checkIfOvertone(pitchA, pitchB, tolerance) for pitchB in pitches] for pitchA in pitches]
+    assert mask.tolist() == expected
+
+# Small blocks split the frames with the same number of peaks into several blocks.
+@pytest.mark.parametrize("maxBlockSize", [2**22, 50])
+def test_vectorized_sieve_matches_per_frame_sieve(maxBlockSize):
+    peakLists = getRandomPeakLists(400)
+    assert len(set(map(len, peakLists))) > 5
+    expected = [getFundamentalFrequencies(peaks) for peaks in peakLists]
+    assert getFundamentalFrequenciesBatch(peakLists, maxBlockSize) == expected
+
+def test_frame_fundamentals_match_reference():
+    rng = np.random.default_rng(1)
+    t = np.arange(WIN_S) / RATE
+    frames = np.array([sum(np.sin(2*np.pi*funFreq*harmonic*t) / harmonic for funFreq in rng.uniform(100, 500, 2)
+                           for harmonic in range(1, 5)) + 0.05*rng.standard_normal(WIN_S) for i in range(40)])
+    fundamentals = getFrameFundamentals(RATE, frames)
+    assert any(len(funFreqs) > 0 for funFreqs in fundamentals)
+    assert fundamentals == getFrameFundamentals(RATE, frames, reference=True)
+
+# Random frames of a few pitches, so that the super windows often have ties, and some frames are empty.
+def getRandomFrames(numFrames, seed=0):
+    rng = np.random.default_rng(seed)
+    return [[float(pitch) for pitch in rng.choice([110.0, 220.0, 330.0, 440.0], rng.integers(0, 4))]
+            for i in range(numFrames)]
+
+def test_frame_window_mode_matches_statistics_mode():
+    rng = np.random.default_rng(2)
+    frames = getRandomFrames(300)
+    window = FrameWindow()
+    contents = []
+    for frame in frames:
+        action = rng.integers(3)
+        if action == 0 and len(contents) > 0:
+            assert window.pop() == contents.pop(0)
+        elif action == 1 and len(contents) > 0:
+            index = int(rng.integers(len(contents)))
+            window.replace(index, frame)
+            contents[index] = frame
+        else:
+            window.push(frame)
+            contents.append(frame)
+        freqs = [freq for frame in contents for freq in frame]
+        # ties go to the frequency that comes first, oldest frame first, as with statistics.mode
+        assert window.mode() == (statistics.mode(freqs) if freqs != [] else None)
+
+def test_keyed_frame_window_counts_keys():
+    window = FrameWindow(freqToSemitones)
+    for frame in [[440.0], [445.0, 220.0], [219.0], [438.0]]:
+        window.push(frame)
+    # 440 Hz, 445 Hz and 438 Hz are all A4: the mode is the first of them
+    assert window.mode() == 440.0
+    window.pop()
+    assert window.mode() == 445.0
+    window.replace(0, [221.0])
+    assert window.mode() == 221.0
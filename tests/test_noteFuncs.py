@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from musicFuncs import C0, freqToCents
+from noteFuncs import NoteSegmenter, getNoteSegmenter
+
+# The original rule: the voiced frames are taken in order, skipping frames without a pitch, and a pitch found in at
+# least two of them in a row is a note. Returns the pitch and number of frames of every note.
+def segmentReference(track):
+    notes = []
+    pitches = [pitch for pitch in track if not np.isnan(pitch)]
+    for i, pitch in enumerate(pitches):
+        if i > 0 and pitch == pitches[i - 1]:
+            notes[-1][1] += 1
+        else:
+            notes.append([pitch, 1])
+    return [(pitch, numFrames) for pitch, numFrames in notes if numFrames >= 2]
+
+def test_default_segments_match_original_rule():
+    rng = np.random.default_rng(0)
+    track = rng.choice([110.0, 220.0, 330.0, np.nan], 1000, p=[0.3, 0.3, 0.2, 0.2])
+    segments = NoteSegmenter(0.1).segment(track)
+    assert len(segments) > 10
+    notes = list(zip(np.round(segments.getFrequencies(), 6), segments.numFrames))
+    assert notes == segmentReference(track)
+
+# A track 0.1 seconds a frame: three frames of A, two of B, and four of C with a gap in the middle of them.
+def getTrack():
+    return C0 * 2**(np.array([57, 57, 57, 59, 59, 60, 60, np.nan, np.nan, 60, 60], dtype=float) / 12)
+
+def test_min_duration_counts_time_not_frames():
+    segmenter = NoteSegmenter(0.1, minDuration=300)
+    segments = segmenter.segment(getTrack())
+    # a segment of three frames lasts 300 ms, and the frames without a pitch count towards the duration of C
+    assert list(segments.getSemitones()) == [57, 60]
+    assert list(segments.numFrames) == [3, 4]
+    assert np.allclose(segments.start, [0, 0.5])
+    assert np.allclose(segments.end, [0.3, 1.1])
+    assert len(NoteSegmenter(0.1, minDuration=301).segment(getTrack())) == 1
+    assert list(NoteSegmenter(0.1, minDuration=0).segment(getTrack()).getSemitones()) == [57, 59, 60]
+
+# Halving the hop, as when frames overlap by half, halves the duration of every segment.
+def test_durations_follow_the_hop():
+    segments = NoteSegmenter(0.05, minDuration=150).segment(getTrack())
+    assert list(segments.getSemitones()) == [57, 60]
+    assert np.allclose(segments.end - segments.start, [0.15, 0.3])
+    assert list(NoteSegmenter(0.05, minDuration=151).segment(getTrack()).getSemitones()) == [60]
+
+def test_trim_leaves_out_voiced_frames_at_both_ends():
+    segments = NoteSegmenter(0.1).segment(getTrack(), trim=1)
+    assert list(segments.getSemitones()) == [57, 59, 60]
+    assert list(segments.numFrames) == [2, 2, 3]
+    assert len(NoteSegmenter(0.1).segment(getTrack(), trim=6)) == 0
+
+def test_cents_tolerance_joins_gliding_pitches():
+    track = C0 * 2**(np.array([4500, 4510, 4520, 4530, 4700, 4700]) / 1200)
+    assert len(NoteSegmenter(0.1).segment(track)) == 1
+    segments = NoteSegmenter(0.1, centsTolerance=10).segment(track)
+    assert list(segments.numFrames) == [4, 2]
+    assert np.allclose(segments.cents, [4515, 4700])
+    assert np.allclose(freqToCents(segments.getFrequencies()), segments.cents)
+
+def test_note_segmenter_options():
+    segmenter = getNoteSegmenter({"cents": "20", "min-note": "80"}, 512 / 44100)
+    assert segmenter.getParameters() == {"cents_tolerance": 20.0, "min_duration_ms": 80.0}
+    assert segmenter.hopSeconds == 512 / 44100
+    assert getNoteSegmenter({}, 0.1).getParameters() == {"cents_tolerance": 0, "min_duration_ms": None}
+    for options in ({"cents": "-1"}, {"min-note": "-5"}):
+        with pytest.raises(ValueError):
+            getNoteSegmenter(options, 0.1)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from musicFuncs import freqToSemitones, freqToCents, C0
+from noteFuncs import NoteSegmenter
+from pitchFuncs import getPitchBackend, hasExactPitches
+
+RATE, WIN_S = 44100, 4096
+
+# Frames of a sine 40 cents above E3, where the FFT bins are about a semitone apart: its nearest bin rounds to F3.
+def getDetunedFrames():
+    freq = C0 * 2**(40.4 / 12)
+    samples = np.sin(2*np.pi*freq*np.arange(8*WIN_S) / RATE).astype(np.float32)
+    return freq, samples.reshape(8, WIN_S)
+
+def getPitches(name, frames):
+    return [pitch for frame in getPitchBackend(name, RATE, WIN_S).getFrameFundamentals(frames) for pitch in frame]
+
+@pytest.mark.parametrize("name", ["yin", "autocorrelation"])
+def test_exact_backends_keep_detuned_pitches(name):
+    freq, frames = getDetunedFrames()
+    pitches = getPitches(name, frames)
+    assert hasExactPitches(name)
+    assert len(pitches) == len(frames)
+    assert np.all(np.abs(freqToCents(pitches) - freqToCents(freq)) < 5)
+    assert np.all(freqToSemitones(pitches) == 40)
+    # the fft backend only finds the bin frequency, a semitone too high
+    fftPitches = getPitches("fft", frames)
+    assert not hasExactPitches("fft")
+    assert np.all(freqToSemitones(fftPitches) == 41)
+    assert not np.any(np.isin(np.float32(pitches), np.float32(fftPitches)))
+
+def test_segments_join_exact_pitches_by_semitone():
+    track = C0 * 2**(np.array([40.1, 39.9, 40.2, np.nan, 40.3, 41.0, 41.1]) / 12)
+    segmenter = NoteSegmenter(0.1)
+    assert len(segmenter.segment(track)) == 0
+    segments = segmenter.segment(track, bySemitone=True)
+    assert list(segments.numFrames) == [4, 2]
+    assert list(segments.getSemitones()) == [40, 41]